@@ -0,0 +1,267 @@
+# coding: utf-8
+"""
+    Benchmarks of JoplinApi against the fake webclipper of joplin_api.fake_server
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --compare results.json --threshold 0.1
+
+    By default the fake server answers in-process (no socket, only the client
+    is measured), `--tcp` serves it on localhost to include the HTTP stack.
+    `--latency` adds a delay to each answer, like a busy desktop app
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from joplin_api import JoplinApi, __version__  # noqa: E402
+from joplin_api.bulk import run_bounded  # noqa: E402
+from joplin_api.fake_server import FakeJoplin, FakeJoplinTransport, serve  # noqa: E402
+
+TOKEN = 'benchmark'
+
+
+class Bench:
+    """
+    one JoplinApi talking to one fresh FakeJoplin
+    """
+
+    def __init__(self, args, **populate):
+        self.args = args
+        self.fake = FakeJoplin(token=TOKEN, latency=args.latency)
+        if populate:
+            self.fake.populate(body_size=args.body_size, **populate)
+        self.server = None
+        self.api = None
+
+    async def __aenter__(self):
+        config = {'BULK_CONCURRENCY': self.args.concurrency, 'MAX_CONNECTIONS': self.args.concurrency}
+        if self.args.tcp:
+            self.server = await serve(self.fake, '127.0.0.1', 0)
+            port = self.server.sockets[0].getsockname()[1]
+            config['JOPLIN_HOST'] = f'http://127.0.0.1:{port}'
+        else:
+            config['TRANSPORT'] = FakeJoplinTransport(self.fake)
+        self.api = JoplinApi(TOKEN, **config)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.api.aclose()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+def result(operations, seconds, size=0):
+    data = {'operations': operations, 'seconds': round(seconds, 4),
+            'ops_per_second': round(operations / seconds, 1) if seconds else None}
+    if size:
+        data['mb_per_second'] = round(size / seconds / 2 ** 20, 2) if seconds else None
+    return data
+
+
+def check(results):
+    failed = [r for r in results if not r.ok]
+    if failed:
+        raise RuntimeError(f'{len(failed)} queries failed, eg {failed[0]}')
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    value = await coro
+    return value, time.perf_counter() - start
+
+
+##############
+# SCENARIOS
+##############
+
+async def bench_crud(args):
+    """
+    create, get, update then delete `--notes` notes with the bulk methods
+    """
+    body = 'x' * args.body_size
+    async with Bench(args, folders=1, notes=0, tags=0) as bench:
+        api = bench.api
+        folder_id = next(iter(bench.fake.items['folders']))
+        notes = [{'title': f'note {i}', 'body': body, 'parent_id': folder_id} for i in range(args.notes)]
+        created, create_time = await timed(api.create_notes(notes))
+        check(created)
+        ids = [r.response.json()['id'] for r in created]
+        fetched, get_time = await timed(run_bounded(api.get_note, ids, args.concurrency))
+        check(fetched)
+        updates = [{'note_id': note_id, 'title': 'updated', 'body': body, 'parent_id': folder_id} for note_id in ids]
+        updated, update_time = await timed(api.update_notes(updates))
+        check(updated)
+        deleted, delete_time = await timed(api.delete_notes(ids))
+        check(deleted)
+    return {'create': result(len(ids), create_time), 'get': result(len(ids), get_time),
+            'update': result(len(ids), update_time), 'delete': result(len(ids), delete_time)}
+
+
+async def bench_listing(args):
+    """
+    list a profile of `--profile-notes` notes, page by page
+    """
+    results = {}
+    async with Bench(args, folders=10, notes=args.profile_notes, tags=10) as bench:
+        for name, fields, prefetch in (('titles', 'id,title', False),
+                                       ('titles_prefetch', 'id,title', True),
+                                       ('bodies_prefetch', 'id,title,body', True)):
+            start = time.perf_counter()
+            count = 0
+            async for _ in bench.api.iter_notes(fields, prefetch=prefetch):
+                count += 1
+            results[name] = result(count, time.perf_counter() - start)
+    return results
+
+
+async def bench_resources(args):
+    """
+    upload then download `--resources` files of `--resource-size` bytes
+    """
+    content = os.urandom(args.resource_size)
+    total = args.resources * args.resource_size
+    async with Bench(args) as bench:
+        api = bench.api
+        resources = [{'resource_file': io.BytesIO(content), 'title': f'file {i}', 'filename': f'file{i}.bin'}
+                     for i in range(args.resources)]
+        uploaded, upload_time = await timed(api.create_resources(resources))
+        check(uploaded)
+        ids = [r.response.json()['id'] for r in uploaded]
+        with tempfile.TemporaryDirectory() as dest_dir:
+            downloaded, download_time = await timed(api.download_resources_many(ids, dest_dir, resume=False))
+            check(downloaded)
+    return {'upload': result(len(ids), upload_time, total), 'download': result(len(ids), download_time, total)}
+
+
+async def bench_mixed(args):
+    """
+    `--concurrency` clients reading, listing and writing at the same time for `--duration` seconds
+    """
+    async with Bench(args, folders=10, notes=args.notes, tags=10) as bench:
+        api = bench.api
+        note_ids = list(bench.fake.items['notes'])
+        folder_ids = list(bench.fake.items['folders'])
+        end = time.perf_counter() + args.duration
+        counts = {'get': 0, 'list': 0, 'update': 0, 'create': 0}
+
+        async def worker(number):
+            step = number
+            while time.perf_counter() < end:
+                step += 1
+                kind = ('get', 'get', 'get', 'list', 'update', 'create')[step % 6]
+                if kind == 'get':
+                    res = await api.get_note(note_ids[step % len(note_ids)])
+                elif kind == 'list':
+                    res = await api.query('get', f'/folders/{folder_ids[step % len(folder_ids)]}/notes',
+                                          'id,title', limit=50)
+                elif kind == 'update':
+                    res = await api.update_note(note_ids[step % len(note_ids)], f'title {step}', 'body',
+                                                folder_ids[0])
+                else:
+                    res = await api.create_note(f'new {step}', 'body', folder_ids[0])
+                res.raise_for_status()
+                counts[kind] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(number) for number in range(args.concurrency)])
+        seconds = time.perf_counter() - start
+    data = {kind: result(count, seconds) for kind, count in counts.items()}
+    data['total'] = result(sum(counts.values()), seconds)
+    return data
+
+
+SCENARIOS = {'crud': bench_crud, 'listing': bench_listing, 'resources': bench_resources, 'mixed': bench_mixed}
+
+
+##############
+# REPORT
+##############
+
+def flatten(results):
+    """
+    :return: dict 'scenario.operation' -> ops per second
+    """
+    return {f'{scenario}.{name}': data['ops_per_second']
+            for scenario, operations in results.items() for name, data in operations.items()
+            if data.get('ops_per_second')}
+
+
+def compare(results, baseline, threshold):
+    """
+    print the ratio with the baseline of each measure
+    :return: list of the measures slower than the baseline by more than `threshold`
+    """
+    current, previous = flatten(results), flatten(baseline['results'])
+    regressions = []
+    for name in sorted(current):
+        if name not in previous:
+            continue
+        ratio = current[name] / previous[name]
+        flag = ''
+        if ratio < 1 - threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:32} {previous[name]:>12.1f} -> {current[name]:>12.1f} ops/s  x{ratio:.2f}{flag}')
+    return regressions
+
+
+async def run(args):
+    results = {}
+    for name in args.scenarios:
+        results[name] = await SCENARIOS[name](args)
+        for operation, data in results[name].items():
+            print(f'{name + "." + operation:32} {data["ops_per_second"] or 0:>12.1f} ops/s  {data["seconds"]:>8.3f}s')
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmarks of joplin_api against a fake webclipper')
+    parser.add_argument('scenarios', nargs='*', help=f'default all of: {", ".join(SCENARIOS)}')
+    parser.add_argument('--tcp', action='store_true', help='serve the fake webclipper on localhost')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before each answer of the server')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--notes', type=int, default=500, help='notes of the crud and mixed scenarios')
+    parser.add_argument('--profile-notes', type=int, default=5000, help='notes of the listing scenario')
+    parser.add_argument('--body-size', type=int, default=2048, help='bytes of each note body')
+    parser.add_argument('--resources', type=int, default=20)
+    parser.add_argument('--resource-size', type=int, default=1024 * 1024)
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds of the mixed scenario')
+    parser.add_argument('--output', help='save the results in this JSON file')
+    parser.add_argument('--compare', help='JSON file of previous results')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown ratio reported as a regression')
+    args = parser.parse_args(argv)
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+
+    results = asyncio.run(run(args))
+    report = {'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                       'httpx': httpx.__version__, 'joplin_api': __version__,
+                       'args': {key: value for key, value in vars(args).items()
+                                if key not in ('output', 'compare')}},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
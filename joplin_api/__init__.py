@@ -4,6 +4,12 @@
     tags into our Joplin Editor
 """
 
+from .bulk import BulkResult
+from .cache import ResponseCache
 from .core import JoplinApi
+from .metrics import Hook, MetricsRecorder
+from .models import Folder, Note, Resource, Tag
+from .multi import JoplinMultiApi
+from .sync import JoplinSyncApi
 
 __version__ = "1.5.4"
@@ -0,0 +1,276 @@
+# coding: utf-8
+"""
+    Export of a whole Joplin profile to one archive, and its restore
+
+    The archive is an uncompressed tar file:
+    - manifest.json        format, date, number of items
+    - folders.jsonl        one folder per line
+    - tags.jsonl           one tag per line
+    - notes.jsonl          one note per line, with its body
+    - note_tags.jsonl      one {"tag_id", "note_id"} per line
+    - resources.jsonl      one resource per line
+    - resources/<id>       content of each resource
+
+    The items are written as they are listed, page by page, and the resources
+    go through the disk: the memory used does not depend on the size of the profile
+"""
+import asyncio
+import json
+import os
+import tarfile
+import tempfile
+import time
+
+from .bulk import run_bounded
+
+__all__ = ['export_profile', 'import_profile']
+
+FORMAT = 1
+# number of lines created at once during the restore
+BATCH_SIZE = 500
+# fields which are computed by joplin, not given when creating a resource
+RESOURCE_READ_ONLY = ('size', 'encryption_blob_encrypted')
+
+
+class ArchiveWriter:
+    """
+    tar file written off the event loop
+    """
+
+    def __init__(self, path, tmp_dir):
+        self.tar = tarfile.open(path, 'w')
+        self.tmp_dir = tmp_dir
+
+    async def add(self, name, path):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.tar.add, path, name)
+        os.remove(path)
+
+    async def add_jsonl(self, name, items):
+        """
+        :param items: async iterable of dict
+        :return: number of lines
+        """
+        path = os.path.join(self.tmp_dir, name)
+        count = 0
+        # small buffered writes, only the tar is written off the event loop
+        with open(path, 'w', encoding='utf-8') as f:
+            async for item in items:
+                f.write(json.dumps(item, ensure_ascii=False))
+                f.write('\n')
+                count += 1
+        await self.add(name, path)
+        return count
+
+    def close(self):
+        self.tar.close()
+
+
+async def export_profile(api, path, concurrency=None):
+    """
+    write all the folders, tags, notes, links between notes and tags, and resources to an archive
+    :param api: JoplinApi instance
+    :param path: string, name of the tar file to write
+    :param concurrency: max number of queries at once, default `BULK_CONCURRENCY` of the api
+    :return: dict, the manifest of the archive, `missing` listing the resources which could not be downloaded
+    """
+    concurrency = concurrency or api.bulk_concurrency
+    loop = asyncio.get_running_loop()
+    part = path + '.part'
+    counts = {}
+    missing = []
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as tmp_dir:
+        writer = await loop.run_in_executor(None, ArchiveWriter, part, tmp_dir)
+        try:
+            counts['folders'] = await writer.add_jsonl('folders.jsonl', api.iter_folders(prefetch=True))
+
+            tag_ids = []
+
+            async def tags():
+                async for tag in api.iter_tags(api.tag_props, prefetch=True):
+                    tag_ids.append(tag['id'])
+                    yield tag
+            counts['tags'] = await writer.add_jsonl('tags.jsonl', tags())
+
+            async def tag_notes(tag_id):
+                return [note['id'] async for note in api.iter_tags_notes(tag_id, 'id')]
+
+            async def links():
+                for start in range(0, len(tag_ids), concurrency):
+                    for result in await run_bounded(tag_notes, tag_ids[start:start + concurrency], concurrency):
+                        if result.error is not None:
+                            raise result.error
+                        for note_id in result.response:
+                            yield {'tag_id': result.item, 'note_id': note_id}
+            counts['note_tags'] = await writer.add_jsonl('note_tags.jsonl', links())
+
+            counts['notes'] = await writer.add_jsonl('notes.jsonl', api.iter_notes(api.note_props, prefetch=True))
+
+            resource_ids = []
+
+            async def resources():
+                async for resource in api.iter_resources(api.resource_props, prefetch=True):
+                    resource_ids.append(resource['id'])
+                    yield resource
+            counts['resources'] = await writer.add_jsonl('resources.jsonl', resources())
+
+            # the files are downloaded by batches, each batch is moved into the archive before the next one
+            for start in range(0, len(resource_ids), concurrency):
+                batch = resource_ids[start:start + concurrency]
+                for result in await api.download_resources_many(batch, tmp_dir, resume=False,
+                                                                concurrency=concurrency):
+                    if result.error is not None:
+                        missing.append(result.item)
+                        path_of_blob = os.path.join(tmp_dir, result.item)
+                        if os.path.exists(path_of_blob):
+                            os.remove(path_of_blob)
+                    else:
+                        await writer.add(f'resources/{result.item}', result.response)
+
+            manifest = {'format': FORMAT, 'created_time': int(time.time() * 1000), 'counts': counts,
+                        'missing': missing}
+            manifest_path = os.path.join(tmp_dir, 'manifest.json')
+            with open(manifest_path, 'w') as f:
+                json.dump(manifest, f)
+            await writer.add('manifest.json', manifest_path)
+        except BaseException:
+            await loop.run_in_executor(None, writer.close)
+            os.remove(part)
+            raise
+        await loop.run_in_executor(None, writer.close)
+    os.replace(part, path)
+    return manifest
+
+
+class ArchiveReader:
+    """
+    tar file read off the event loop, the content of the resources is read
+    with its own file handle, so they can be uploaded concurrently
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tar = tarfile.open(path, 'r:')
+        self.members = {member.name: member for member in self.tar.getmembers()}
+
+    def close(self):
+        self.tar.close()
+
+    async def lines(self, name, batch_size=BATCH_SIZE):
+        """
+        :return: async generator of lists of dict
+        """
+        loop = asyncio.get_running_loop()
+        member = self.members.get(name)
+        if member is None:
+            return
+        f = self.tar.extractfile(member)
+
+        def read_batch():
+            batch = []
+            for line in f:
+                if line.strip():
+                    batch.append(json.loads(line))
+                if len(batch) >= batch_size:
+                    break
+            return batch
+
+        while True:
+            batch = await loop.run_in_executor(None, read_batch)
+            if not batch:
+                break
+            yield batch
+
+    async def blob(self, resource_id, chunk_size):
+        """
+        :return: async generator of the content of the resource
+        """
+        loop = asyncio.get_running_loop()
+        member = self.members[f'resources/{resource_id}']
+        f = await loop.run_in_executor(None, open, self.path, 'rb')
+        try:
+            await loop.run_in_executor(None, f.seek, member.offset_data)
+            remaining = member.size
+            while remaining:
+                chunk = await loop.run_in_executor(None, f.read, min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            f.close()
+
+
+def _depth(folder, folders):
+    depth = 0
+    parent_id = folder.get('parent_id')
+    while parent_id in folders and depth < len(folders):
+        depth += 1
+        parent_id = folders[parent_id].get('parent_id')
+    return depth
+
+
+async def import_profile(api, path, concurrency=None):
+    """
+    recreate the items of an archive written by `export_profile`, with their original ids:
+    the folders (the parents first), the tags, the resources, the notes, then the links between notes and tags
+    :param api: JoplinApi instance
+    :param path: string, name of the tar file
+    :param concurrency: max number of queries at once, default `BULK_CONCURRENCY` of the api
+    :return: dict with the number of items created of each kind, and `errors` the list of the failed BulkResult
+    """
+    concurrency = concurrency or api.bulk_concurrency
+    loop = asyncio.get_running_loop()
+    reader = await loop.run_in_executor(None, ArchiveReader, path)
+    counts = {'folders': 0, 'tags': 0, 'resources': 0, 'notes': 0, 'note_tags': 0}
+    errors = []
+
+    async def create(kind, func, items):
+        for result in await run_bounded(func, items, concurrency):
+            if result.ok:
+                counts[kind] += 1
+            else:
+                errors.append(result)
+
+    try:
+        # the folders are few, they are created level by level so the parents exist before their children
+        folders = {}
+        async for batch in reader.lines('folders.jsonl'):
+            folders.update((folder['id'], folder) for folder in batch)
+        levels = {}
+        for folder in folders.values():
+            levels.setdefault(_depth(folder, folders), []).append(folder)
+        for depth in sorted(levels):
+            await create('folders', lambda folder: api.create_folder(
+                folder['title'], parent_id=folder.get('parent_id', ''), id=folder['id']), levels[depth])
+
+        async for batch in reader.lines('tags.jsonl'):
+            await create('tags', lambda tag: api.create_tag(tag['title'], id=tag['id']), batch)
+
+        async def create_resource(resource):
+            props = {key: value for key, value in resource.items()
+                     if key not in RESOURCE_READ_ONLY and value is not None}
+            props['filename'] = props.get('filename') or props.get('title') or resource['id']
+            return await api.create_resource(reader.blob(resource['id'], api.chunk_size), **props)
+
+        missing = set()
+        if 'manifest.json' in reader.members:
+            manifest = json.loads(reader.tar.extractfile(reader.members['manifest.json']).read())
+            missing = set(manifest.get('missing', ()))
+        async for batch in reader.lines('resources.jsonl'):
+            await create('resources', create_resource, [resource for resource in batch
+                                                        if resource['id'] not in missing])
+
+        async def create_note(note):
+            data = {key: value for key, value in note.items() if value is not None}
+            return await api.create_note(data.pop('title', ''), data.pop('body', ''), data.pop('parent_id', ''),
+                                         **data)
+
+        async for batch in reader.lines('notes.jsonl'):
+            await create('notes', create_note, batch)
+
+        async for batch in reader.lines('note_tags.jsonl'):
+            await create('note_tags', lambda link: api.create_tags_notes(link['note_id'], link['tag_id']), batch)
+    finally:
+        await loop.run_in_executor(None, reader.close)
+    return {**counts, 'errors': errors}
@@ -0,0 +1,47 @@
+# coding: utf-8
+"""
+    run many queries to the Joplin API concurrently, with a limit
+"""
+import asyncio
+from collections import namedtuple
+
+__all__ = ['BulkResult', 'run_bounded']
+
+
+class BulkResult(namedtuple('BulkResult', 'item response error')):
+    """
+    outcome of one item of a bulk operation
+    :param item: the item as given by the caller
+    :param response: the response of the webclipper (or the result of the operation), None if it failed
+    :param error: the exception raised by the query, None if it did not fail
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.error is None and getattr(self.response, 'status_code', 200) < 400
+
+
+async def run_bounded(func, items, concurrency):
+    """
+    call `func(item)` for each item with at most `concurrency` calls at once
+    :param func: coroutine function taking one item
+    :param items: iterable of items, consumed lazily
+    :param concurrency: max number of calls running at the same time
+    :return: list of BulkResult, in the order of the items
+    """
+    results = {}
+    pending = enumerate(items)
+
+    async def worker():
+        # the workers share the same iterator, so each item is only run once
+        for index, item in pending:
+            try:
+                results[index] = BulkResult(item, await func(item), None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                results[index] = BulkResult(item, None, e)
+
+    await asyncio.gather(*[worker() for _ in range(max(1, concurrency))])
+    return [results[index] for index in range(len(results))]
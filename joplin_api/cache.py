@@ -0,0 +1,238 @@
+# coding: utf-8
+"""
+    Read-through cache of the GET responses of the Joplin API
+
+    The entries are evicted by age (per kind of item), by count and by size,
+    and invalidated by the writes done through the same JoplinApi instance
+"""
+from collections import OrderedDict
+import time
+
+__all__ = ['ResponseCache']
+
+# seconds before an entry expires, per kind of item
+DEFAULT_TTL = {'folders': 300.0, 'tags': 300.0, 'notes': 30.0, 'resources': 60.0}
+
+# the answers of those endpoints change without any write of ours, or are too large:
+# the searches, and the files of the resources
+UNCACHED = ('ping', 'events', 'search', 'resources/:id/file')
+
+
+def normalize(path):
+    """
+    '/notes/' and '/notes' are the same endpoint
+    """
+    return '/' + path.strip('/')
+
+
+class ResponseCache:
+    """
+    LRU cache of the responses, bounded by number of entries and by bytes
+
+    usage:
+        joplin = JoplinApi(token, CACHE=ResponseCache(max_entries=10000))
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024, ttl=None, default_ttl=60.0):
+        """
+        :param max_entries: max number of responses kept
+        :param max_bytes: max size of the content of the responses kept
+        :param ttl: dict of seconds before expiration per kind of item ('notes', 'folders', ...)
+        :param default_ttl: seconds before expiration of the kinds missing from `ttl`
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = {**DEFAULT_TTL, **(ttl or {})}
+        self.default_ttl = default_ttl
+        # key -> (expires at, size, path, response)
+        self._entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def accepts(path):
+        parts = normalize(path).strip('/').split('/')
+        route = '/'.join(':id' if index % 2 else part for index, part in enumerate(parts))
+        return parts[0] not in UNCACHED and route not in UNCACHED
+
+    @staticmethod
+    def key(path, fields, params):
+        """
+        :return: the key of the entry for this query
+        """
+        return normalize(path), fields, tuple(sorted((name, str(value)) for name, value in params.items()))
+
+    def get(self, key):
+        """
+        :return: the cached response or None
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] < time.monotonic():
+            self._drop(key)
+            self.evictions += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[3]
+
+    def put(self, key, response):
+        """
+        keep this response, evicting the least recently used ones if needed
+        """
+        size = len(response.content)
+        if size > self.max_bytes:
+            return
+        path = key[0]
+        if key in self._entries:
+            self._drop(key)
+        kind = path.split('/')[1]
+        self._entries[key] = (time.monotonic() + self.ttl.get(kind, self.default_ttl), size, path, response)
+        self.size += size
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self):
+        """
+        :return: dict of the counters of the cache
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'invalidations': self.invalidations, 'entries': len(self._entries), 'bytes': self.size}
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self.size -= entry[1]
+
+    ################
+    # INVALIDATION
+    ################
+
+    def invalidate(self, predicate):
+        """
+        drop the entries whose path matches
+        :param predicate: callable(list of the parts of the path) -> bool
+        """
+        keys = [key for key, entry in self._entries.items() if predicate(entry[2].strip('/').split('/'))]
+        for key in keys:
+            self._drop(key)
+        self.invalidations += len(keys)
+
+    def invalidate_path(self, path):
+        """
+        drop the entries of this path, whatever their fields and parameters
+        """
+        parts = normalize(path).strip('/').split('/')
+        self.invalidate(lambda entry: entry == parts)
+
+    def invalidate_item(self, kind, item_id):
+        """
+        drop the entries of this item and of its sub-listings (eg /notes/:id/tags)
+        """
+        self.invalidate(lambda parts: parts[0] == kind and len(parts) > 1 and parts[1] == item_id)
+
+    def _cached_ids(self, path, field):
+        """
+        :return: the set of the `field` values of the cached items of this path, None if not cached
+        """
+        path = normalize(path)
+        for entry in self._entries.values():
+            if entry[2] != path:
+                continue
+            try:
+                data = entry[3].json()
+            except ValueError:
+                return None
+            items = data.get('items', [data]) if isinstance(data, dict) else data
+            return {item.get(field) for item in items if isinstance(item, dict)}
+        return None
+
+    def on_write(self, method, path, payload, response):
+        """
+        listener of JoplinApi: drop the entries the write made stale
+        """
+        parts = normalize(path).strip('/').split('/')
+        kind = parts[0]
+        item_id = parts[1] if len(parts) > 1 else None
+        if item_id is None and method == 'post':
+            try:
+                item_id = response.json().get('id')
+            except (ValueError, AttributeError):
+                item_id = None
+
+        if kind == 'notes':
+            self._note_written(method, item_id, payload)
+        elif kind == 'folders':
+            self.invalidate_path('/folders')
+            if item_id:
+                self.invalidate_item('folders', item_id)
+            if method == 'delete':
+                # the notes of the folder went with it
+                self._notes_listings_written(None, None)
+                self.invalidate(lambda parts: parts[0] == 'notes')
+        elif kind == 'tags':
+            self._tag_written(method, parts, payload)
+        elif kind == 'resources':
+            self.invalidate_path('/resources')
+            if item_id:
+                self.invalidate_item('resources', item_id)
+            self.invalidate(lambda parts: parts[0] == 'notes' and parts[2:] == ['resources'])
+            self.invalidate_path('/search')
+        else:
+            self.clear()
+
+    def _note_written(self, method, note_id, payload):
+        # the parents and tags of the note before the write, when they are known
+        parents = self._cached_ids(f'/notes/{note_id}', 'parent_id') if note_id and method != 'post' else set()
+        tags = self._cached_ids(f'/notes/{note_id}/tags', 'id') if note_id and method != 'post' else set()
+        if parents is not None and payload.get('parent_id'):
+            parents.add(payload['parent_id'])
+        if tags is not None and payload.get('tags'):
+            # tags given by name, they can't be matched with the cached listings
+            tags = None
+            self.invalidate_path('/tags')
+        if note_id:
+            self.invalidate_item('notes', note_id)
+        self.invalidate_path('/notes')
+        self._notes_listings_written(parents, tags)
+
+    def _notes_listings_written(self, parents, tags):
+        """
+        drop the listings of notes of those folders and tags, of all of them if None
+        """
+        self.invalidate_path('/search')
+
+        def notes_of(kind, ids):
+            return lambda parts: parts[0] == kind and parts[2:] == ['notes'] and (ids is None or parts[1] in ids)
+
+        self.invalidate(notes_of('folders', parents))
+        self.invalidate(notes_of('tags', tags))
+
+    def _tag_written(self, method, parts, payload):
+        if len(parts) >= 3 and parts[2] == 'notes':
+            # link between a tag and a note
+            note_id = parts[3] if len(parts) > 3 else payload.get('id')
+            self.invalidate_path(f'/tags/{parts[1]}/notes')
+            if note_id:
+                self.invalidate_path(f'/notes/{note_id}/tags')
+            else:
+                self.invalidate(lambda parts: parts[0] == 'notes' and parts[2:] == ['tags'])
+            return
+        self.invalidate_path('/tags')
+        if len(parts) > 1:
+            self.invalidate_item('tags', parts[1])
+            # the tags listed with the notes are stale too
+            self.invalidate(lambda parts: parts[0] == 'notes' and parts[2:] == ['tags'])
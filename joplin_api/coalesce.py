@@ -0,0 +1,64 @@
+# coding: utf-8
+"""
+    Single-flight of the GET queries
+
+    The identical GET queries (same path, fields and parameters) running at the
+    same time share one request to the webclipper and its response
+"""
+import asyncio
+
+from .cache import ResponseCache
+
+__all__ = ['SingleFlight']
+
+
+class SingleFlight:
+    """
+    the GET queries in flight, by key
+    """
+
+    def __init__(self):
+        # key -> task of the request
+        self._inflight = {}
+        # requests sent to the webclipper
+        self.sent = 0
+        # queries answered by a request already in flight
+        self.saved = 0
+
+    key = staticmethod(ResponseCache.key)
+
+    def stats(self):
+        """
+        :return: dict of the counters
+        """
+        return {'sent': self.sent, 'saved': self.saved, 'inflight': len(self._inflight)}
+
+    async def do(self, key, func):
+        """
+        :param key: key of the query, see `key()`
+        :param func: coroutine function sending the request
+        :return: the response, shared with the identical queries in flight
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._done(key, done))
+            self.sent += 1
+        else:
+            self.saved += 1
+        # a cancelled caller does not cancel the request of the others
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # retrieved, even if all the callers have been cancelled
+            task.exception()
+
+    def on_write(self, method, path, payload, response):
+        """
+        listener of JoplinApi: the queries sent after a write must not get a response read before it
+        """
+        self._inflight.clear()
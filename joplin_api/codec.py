@@ -0,0 +1,104 @@
+# coding: utf-8
+"""
+    JSON codecs of the requests and the responses
+
+    The standard library by default, orjson or msgspec when they are installed
+    and asked for with the `CODEC` config of JoplinApi:
+        JoplinApi(token, CODEC='orjson')  # or 'msgspec', 'json', 'auto' (the fastest installed)
+"""
+import json
+
+__all__ = ['JsonCodec', 'MsgspecCodec', 'OrjsonCodec', 'bind_response', 'get_codec']
+
+
+class JsonCodec:
+    """
+    the json module of the standard library
+    """
+    name = 'json'
+
+    def dumps(self, data):
+        """
+        :return: bytes, utf-8 JSON of the data
+        """
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8', 'surrogatepass')
+
+    def loads(self, content):
+        """
+        :param content: bytes or string
+        :return: the decoded data
+        """
+        return json.loads(content)
+
+
+class OrjsonCodec:
+    """
+    orjson, https://github.com/ijl/orjson
+    """
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._dumps = orjson.dumps
+        self._loads = orjson.loads
+
+    def dumps(self, data):
+        return self._dumps(data)
+
+    def loads(self, content):
+        return self._loads(content)
+
+
+class MsgspecCodec:
+    """
+    msgspec, https://github.com/jcrist/msgspec
+    """
+    name = 'msgspec'
+
+    def __init__(self):
+        import msgspec
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, data):
+        return self._encoder.encode(data)
+
+    def loads(self, content):
+        return self._decoder.decode(content)
+
+
+CODECS = {'json': JsonCodec, 'orjson': OrjsonCodec, 'msgspec': MsgspecCodec}
+
+
+def get_codec(codec=None):
+    """
+    :param codec: 'json' (default), 'orjson', 'msgspec', 'auto' for the fastest one installed,
+                  or an object with `dumps(data) -> bytes` and `loads(bytes)`
+    :return: the codec
+    """
+    if codec is None:
+        return JsonCodec()
+    if not isinstance(codec, str):
+        return codec
+    if codec == 'auto':
+        for name in ('orjson', 'msgspec'):
+            try:
+                return CODECS[name]()
+            except ImportError:
+                continue
+        return JsonCodec()
+    if codec not in CODECS:
+        raise ValueError(f'codec expected: {", ".join(CODECS)} or auto, not {codec}')
+    try:
+        return CODECS[codec]()
+    except ImportError as e:
+        raise ImportError(f'the codec {codec} requires: pip install joplin-api[{codec}]') from e
+
+
+def bind_response(response, codec):
+    """
+    make `response.json()` decode the body with the codec
+    :return: the response
+    """
+    response.json = lambda **kwargs: codec.loads(response.content)
+    return response
@@ -3,19 +3,39 @@
     Joplin Editor API - https://joplinapp.org/api/
 """
 # external lib to use async accesses to the joplin webclipper
+import asyncio
 import httpx
-import json
 import logging
 from logging import getLogger
 import os
 import re
 
+from .archive import export_profile, import_profile
+from .bulk import run_bounded
+from .cache import ResponseCache
+from .coalesce import SingleFlight
+from .codec import JsonCodec, bind_response, get_codec
+from .dedup import ResourceDedup
+from .delta import NoteBaselines
+from .models import (BodyLoader, Folder, MODELS, Note, Resource, Tag,
+                     PREVIEW_NOTE_FIELDS, NOTE_FIELDS, FOLDER_FIELDS, TAG_FIELDS, RESOURCE_FIELDS)
+from .multipart import MultipartBody, is_path
+from .metrics import Instrumentation, MetricsRecorder
+from .transport import AdaptiveLimiter, AdaptiveTransport
+from .watch import ChangeWatcher
+from .writebehind import WriteBehind
+
 __author__ = 'FoxMaSk'
 __all__ = ['JoplinApi']
 
-logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
 logger = getLogger("joplin_api.api")
 
+# headers of the queries sending a JSON body
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+# fields of `update_note` sent in delta mode when they are given
+DELTA_NOTE_FIELDS = ('author', 'source_url', 'is_todo', 'todo_due', 'todo_completed', 'tags')
+
 
 class JoplinApi:
 
@@ -25,22 +45,19 @@ class JoplinApi:
     token = ''
 
     # note properties accessibles for joplin but __only__ in preview mode
-    preview_note_props = 'id,title,is_todo,todo_completed,parent_id, updated_time, ' \
-                         'user_updated_time,user_created_time,encryption_applied'
+    preview_note_props = ','.join(PREVIEW_NOTE_FIELDS)
 
     # note properties accessibles for joplin
-    note_props = 'id,parent_id,title, body, created_time,updated_time, is_conflict, latitude, longitude,' \
-                 'altitude, author, source_url, is_todo,todo_due, todo_completed, source, source_application, order,' \
-                 'application_data, user_created_time, user_updated_time, encryption_cipher_text, encryption_applied'
-                 # ',body_html,base_url,image_data_url,crop_rect'  # noqa
+    note_props = ','.join(NOTE_FIELDS)
+    # ',body_html,base_url,image_data_url,crop_rect'
 
     # folder properties accessibles for joplin
-    folder_props = 'id, title, created_time, updated_time, user_created_time, user_updated_time, ' \
-                   'encryption_cipher_text, encryption_applied, parent_id'
+    folder_props = ','.join(FOLDER_FIELDS)
 
-    resource_props = 'id, title, mime, filename, created_time, updated_time, ' \
-                     'user_created_time, user_updated_time, file_extension, encryption_cipher_text,' \
-                     'encryption_applied, encryption_blob_encrypted, size'
+    # tag properties accessibles for joplin
+    tag_props = ','.join(TAG_FIELDS)
+
+    resource_props = ','.join(RESOURCE_FIELDS)
 
     def __init__(self, token, **config):
         """
@@ -51,6 +68,138 @@ class JoplinApi:
         default_host = 'http://127.0.0.1:{}'.format(config.get('JOPLIN_WEBCLIPPER', 41184))
         self.JOPLIN_HOST = config.get('JOPLIN_HOST', default_host)
         self.token = token
+        # connection pool shared by all the queries of this instance
+        self.limits = httpx.Limits(max_connections=config.get('MAX_CONNECTIONS', 10),
+                                   max_keepalive_connections=config.get('MAX_KEEPALIVE_CONNECTIONS', 10),
+                                   keepalive_expiry=config.get('KEEPALIVE_EXPIRY', 30.0))
+        self.timeout = httpx.Timeout(config.get('TIMEOUT', 30.0),
+                                     connect=config.get('CONNECT_TIMEOUT', 5.0),
+                                     pool=config.get('POOL_TIMEOUT', 30.0))
+        # JSON codec of the bodies of the requests and the responses: 'json', 'orjson', 'msgspec' or 'auto'
+        self.codec = get_codec(config.get('CODEC'))
+        # number of items requested per page by the `iter_*` methods
+        self.page_size = config.get('PAGE_SIZE', 100)
+        # number of queries running at the same time in the bulk methods
+        self.bulk_concurrency = config.get('BULK_CONCURRENCY', 8)
+        # size of the chunks of the streamed downloads and uploads
+        self.chunk_size = config.get('CHUNK_SIZE', 64 * 1024)
+        # callables notified of each successful write: listener(method, path, payload, response)
+        self.listeners = []
+        # opt-in cache of the GET responses: True for the default settings, or a ResponseCache
+        cache = config.get('CACHE')
+        self.cache = ResponseCache() if cache is True else cache
+        if self.cache is not None:
+            self.add_listener(self.cache.on_write)
+        # opt-in sharing of the identical GET queries running at the same time
+        self.coalescer = SingleFlight() if config.get('COALESCE') else None
+        if self.coalescer is not None:
+            self.add_listener(self.coalescer.on_write)
+        # retries of the idempotent queries, deadline and adaptive number of queries in flight
+        self.limiter = None
+        if config.get('ADAPTIVE_CONCURRENCY'):
+            self.limiter = AdaptiveLimiter(initial=config.get('MIN_CONCURRENCY', 1),
+                                           minimum=config.get('MIN_CONCURRENCY', 1),
+                                           maximum=config.get('MAX_CONCURRENCY', self.limits.max_connections))
+        self._transport_config = {'retries': config.get('RETRIES', 2),
+                                  'backoff': config.get('RETRY_BACKOFF', 0.1),
+                                  'max_backoff': config.get('RETRY_MAX_BACKOFF', 5.0),
+                                  'deadline': config.get('DEADLINE'),
+                                  'limiter': self.limiter}
+        # transport sending the requests, eg for tests
+        self._inner_transport = config.get('TRANSPORT')
+        # hooks called at the start and the end of each request, see metrics.py
+        self.instrumentation = Instrumentation(config.get('HOOKS'))
+        # built-in recorder of the latency, sizes, status and retries per endpoint
+        self.metrics = None
+        if config.get('METRICS'):
+            self.metrics = MetricsRecorder()
+            self.instrumentation.add_hook(self.metrics)
+        # opt-in delta updates of the notes: only the fields which changed since the last read or write are sent
+        self.baselines = None
+        if config.get('DELTA_UPDATES'):
+            self.baselines = NoteBaselines(max_entries=config.get('DELTA_MAX_NOTES', 10000),
+                                           ttl=config.get('DELTA_TTL', 300.0),
+                                           revalidate=config.get('DELTA_REVALIDATE', True))
+            self.add_listener(self.baselines.on_write)
+        # opt-in buffer of the updates of the notes, folders and tags, sent later and merged
+        self.write_behind = None
+        if config.get('WRITE_BEHIND'):
+            self.write_behind = WriteBehind(self, interval=config.get('WRITE_BEHIND_INTERVAL', 1.0),
+                                            max_pending=config.get('WRITE_BEHIND_MAX_PENDING', 100),
+                                            max_failures=config.get('WRITE_BEHIND_MAX_FAILURES', 1000))
+        # opt-in deduplication of the resources by their content, before the uploads
+        self.dedup = None
+        if config.get('DEDUP_RESOURCES'):
+            self.dedup = ResourceDedup(self, path=config.get('DEDUP_INDEX'),
+                                       hash_remote=config.get('DEDUP_HASH_REMOTE', True))
+            self.add_listener(self.dedup.on_write)
+        # poller shared by the consumers of `watch_changes()`, created on first use
+        self.watcher = None
+        self._watch_config = {'min_interval': config.get('WATCH_MIN_INTERVAL', 1.0),
+                              'max_interval': config.get('WATCH_MAX_INTERVAL', 30.0),
+                              'checkpoint': config.get('WATCH_CHECKPOINT'),
+                              'queue_size': config.get('WATCH_QUEUE_SIZE', 1000)}
+        self.transport = None
+        self._body_loader = None
+        self._client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    @property
+    def client(self):
+        """
+        the pooled http client, created on first use
+        and reused until `aclose()` is called
+        """
+        if self._client is None or self._client.is_closed:
+            inner = self._inner_transport or httpx.AsyncHTTPTransport(limits=self.limits)
+            self.transport = AdaptiveTransport(inner, **self._transport_config)
+            self._client = httpx.AsyncClient(transport=self.transport, timeout=self.timeout)
+        return self._client
+
+    async def aclose(self):
+        """
+        close the pooled http client and its keep-alive connections,
+        after having sent the pending updates of the write-behind and saved the index of the resources
+        """
+        if self.watcher is not None:
+            await self.watcher.close()
+            self.watcher = None
+        if self.write_behind is not None:
+            await self.write_behind.close()
+        if self.dedup is not None:
+            await self.dedup.save()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def body_loader(self):
+        """
+        batches the lazy loads of the body of the Note models
+        """
+        if self._body_loader is None:
+            self._body_loader = BodyLoader(self)
+        return self._body_loader
+
+    def add_listener(self, listener):
+        """
+        be notified of the writes (post, put, delete) done through this instance
+        :param listener: callable(method, path, payload, response)
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        stop notifying this listener
+        :param listener: callable given to `add_listener`
+        """
+        if listener in self.listeners:
+            self.listeners.remove(listener)
 
     async def query(self, method, path, fields='', **payload):
         """
@@ -61,67 +210,198 @@ class JoplinApi:
         :param payload: dict with all the necessary things to deal with the API
         :return json data
         """
+        self._check(method, path)
+        if self.write_behind is not None:
+            if method == 'put' and self.write_behind.key(path) is not None:
+                res = await self.write_behind.put(path, payload)
+                # the listeners follow the update at once, then again once it is sent
+                self._notify(method, path, payload, res)
+                return res
+            # the reads come after the pending updates
+            await self.write_behind.before(path, method)
+        return await self._query(method, path, fields, payload)
+
+    async def query_raw(self, method, path, fields='', content=None, **payload):
+        """
+        Do a query to the System API without decoding the response,
+        eg to forward a note to another profile without parsing and serializing it again.
+        The body of a write, and the response of a post, are still decoded when listeners
+        follow the writes (`add_listener`, eg CACHE, DELTA_UPDATES, WRITE_BEHIND, a mirror or `watch_changes`)
+        :param method: the kind of query to do
+        :param path: endpoints url to the API eg 'notes' 'tags' 'folders'
+        :param fields: fields we want to get
+        :param content: bytes, body of a post or a put already encoded in JSON, sent as it is instead of the payload
+        :param payload: dict with all the necessary things to deal with the API
+        :return: bytes, the body of the response
+        :raise httpx.HTTPStatusError: when the response is an error
+        """
+        self._check(method, path)
+        if self.write_behind is not None:
+            # sent at once, after the pending updates
+            await self.write_behind.before(path, method)
+        res = await self._query(method, path, fields, payload, content, raw=True)
+        res.raise_for_status()
+        return res.content
+
+    @staticmethod
+    def _check(method, path):
         if method not in ('get', 'post', 'put', 'delete'):
             raise ValueError('method expected: get, post, put, delete')
 
-        endpoints = ['/notes/', '/folders/', '/tags/', '/resources/', '/ping/', '/search/']
+        endpoints = ['/notes/', '/folders/', '/tags/', '/resources/', '/ping/', '/search/', '/events/']
 
         if not any(f"{endpoint}" in path for endpoint in endpoints):
-            msg = f'request expected: notes, folders, tags, resources, search, version or ping but not {path}'
+            msg = f'request expected: notes, folders, tags, resources, search, events, version or ping but not {path}'
             raise ValueError(msg)
 
+    async def _query(self, method, path, fields, payload, content=None, raw=False):
+        """
+        the query, once validated, without the write-behind
+        :param content: bytes, the body already encoded, see `query_raw()`
+        :param raw: the response is not decoded to follow the notes read, see `query_raw()`
+        """
         full_path = self.JOPLIN_HOST + path
-        headers = {'Content-Type': 'application/json'}
         params = {'token': self.token, 'fields': fields} if fields else {'token': self.token}
-        res = {}
-        logger.info(f'method {method} path {full_path} params {params} payload {payload} headers {headers}')
+        if logger.isEnabledFor(logging.DEBUG):
+            # never the token nor the values, a note body can weigh megabytes
+            logger.debug('%s %s fields %r payload keys %s', method.upper(), path, fields, sorted(payload))
+
+        cache_key = None
+        if method == 'get' and self.cache is not None and self.cache.accepts(path):
+            cache_key = self.cache.key(path, fields, payload)
+            res = self.cache.get(cache_key)
+            if res is not None:
+                return res
+
+        if method == 'get' and self.coalescer is not None:
+            key = self.coalescer.key(path, fields, payload)
+            res = await self.coalescer.do(key, lambda: self._send(method, path, full_path, params, payload))
+        else:
+            res = await self._send(method, path, full_path, params, payload, content)
+
+        if cache_key is not None and res.status_code == 200:
+            self.cache.put(cache_key, res)
+        if method == 'get' and self.baselines is not None and res.status_code == 200 and not raw:
+            self.baselines.observe(path, res)
+        if method != 'get' and res.status_code < 400:
+            if content is not None and self.listeners:
+                # the listeners follow the fields written
+                payload = self.codec.loads(content)
+            self._notify(method, path, payload, res)
+        return res
 
-        client = httpx.AsyncClient()
+    def _notify(self, method, path, payload, response):
+        for listener in list(self.listeners):
+            listener(method, path, payload, response)
+
+    async def _send(self, method, path, full_path, params, payload, content=None):
+        """
+        send the query built by `query()`, with the hooks
+        :return: httpx.Response
+        """
+        event = self.instrumentation.start(method, path)
+        try:
+            res = await self._request(method, path, full_path, params, payload, content)
+        except Exception as e:
+            self.instrumentation.end(event, error=e)
+            raise
+        self.instrumentation.end(event, res)
+        logger.info('%s %s -> %s', method.upper(), path, res.status_code)
+        if not isinstance(self.codec, JsonCodec):
+            bind_response(res, self.codec)
+        return res
 
+    async def _request(self, method, path, full_path, params, payload, content=None):
+        client = self.client
         if method == 'get':
-            res = await client.get(full_path, params=params)
-        elif method == 'post':
-
+            return await client.get(full_path, params={**params, **payload})
+        if method == 'post':
             if 'resources' in path:
                 props = payload['props']
-
-                mime = 'multipart/form-data'
-                if 'mime' in props:
-                    mime = props['mime']
-
-                headers = {'Content-Type': mime}
-
-                files = {'data': (payload['filename'], open(payload['resource_file'], 'rb'), mime)}
-
-                res = await client.post(self.JOPLIN_HOST + '/resources',
-                                        files=files,
-                                        data={'props': json.dumps({'title': props['title'],
-                                                                   'filename': payload['filename']})
-                                              },
-                                        params=params)
-            else:
-                res = await client.post(full_path, json=payload, params=params)
-        elif method == 'put':
-            res = await client.put(full_path, data=json.dumps(payload), params=params, headers=headers)
-        elif method == 'delete':
-            res = await client.delete(full_path, params=params)
-        logger.info(f'Response of WebClipper {res}')
-        return res
+                body = MultipartBody(payload['resource_file'], payload['filename'],
+                                     {**props, 'filename': payload['filename']},
+                                     props.get('mime'), self.chunk_size)
+                return await client.post(self.JOPLIN_HOST + '/resources',
+                                         content=body,
+                                         headers=body.headers,
+                                         params=params)
+            return await client.post(full_path, content=self._encode(payload, content), params=params,
+                                     headers=JSON_HEADERS)
+        if method == 'put':
+            return await client.put(full_path, content=self._encode(payload, content), params=params,
+                                    headers=JSON_HEADERS)
+        return await client.delete(full_path, params=params)
+
+    def _encode(self, payload, content):
+        return content if content is not None else self.codec.dumps(payload)
+
+    async def _paginate(self, path, fields='', page_size=None, prefetch=False, model=None, **params):
+        """
+        GET all the pages of a paginated endpoint, one after the other
+        :param path: endpoints url to the API eg '/notes/'
+        :param fields: fields we want to get
+        :param page_size: number of items per page, default `PAGE_SIZE` of the config
+        :param prefetch: request the next page while the current one is consumed
+        :param model: Model class of the items, dict if not set
+        :param params: extra query string parameters (eg 'order_by', 'query')
+        :return: async generator of the items (dict or Model)
+        """
+        page_size = page_size or self.page_size
+        page = 1
+        next_page = None
+        try:
+            res = await self.query('get', path, fields, page=page, limit=page_size, **params)
+            while True:
+                res.raise_for_status()
+                data = res.json()
+                # joplin versions without pagination return the whole list at once
+                if isinstance(data, list):
+                    items, has_more = data, False
+                else:
+                    items, has_more = data.get('items', []), data.get('has_more', False)
+                if has_more and prefetch:
+                    next_page = asyncio.ensure_future(
+                        self.query('get', path, fields, page=page + 1, limit=page_size, **params))
+                for item in items:
+                    yield model(self, **item) if model else item
+                if not has_more:
+                    break
+                page += 1
+                if next_page is None:
+                    res = await self.query('get', path, fields, page=page, limit=page_size, **params)
+                else:
+                    res = await next_page
+                    next_page = None
+        finally:
+            # the consumer stopped before the end
+            if next_page is not None:
+                next_page.cancel()
+
+    async def _bulk(self, func, items, concurrency=None):
+        """
+        run `func` on each item with a bounded number of concurrent queries
+        :param func: coroutine function taking one item
+        :param items: iterable of items
+        :param concurrency: max number of queries at once, default `BULK_CONCURRENCY` of the config
+        :return: list of BulkResult in the order of the items
+        """
+        return await run_bounded(func, items, concurrency or self.bulk_concurrency)
 
     ##############
     # NOTES
     ##############
 
-    async def get_note(self, note_id):
+    async def get_note(self, note_id, fields=None):
         """
         GET /notes/:id
 
         get that note
         :param note_id: string
+        :param fields: fields we want to get, comma separated
         :return: res: result of the get
         """
         path = f'/notes/{note_id}'
-        return await self.query('get', path, self.note_props)
+        return await self.query('get', path, self.note_props if fields is None else fields)
 
     async def get_notes_preview(self):
         """
@@ -133,34 +413,75 @@ class JoplinApi:
         """
         return await self.query('get', '/notes/', self.preview_note_props)
 
-    async def get_notes(self):
+    async def get_notes(self, fields=None):
         """
         GET /notes
 
         get the list of all the notes of the joplin profile
+        :param fields: fields we want to get, comma separated
         :return: res: result of the get
         """
-        return await self.query('get', '/notes/', self.note_props)
+        return await self.query('get', '/notes/', self.note_props if fields is None else fields)
+
+    def iter_notes(self, fields=None, page_size=None, prefetch=False, model=False, **params):
+        """
+        GET /notes
+
+        iterate over all the notes of the joplin profile, page after page
+        :param fields: fields we want to get, default `note_props`
+        :param page_size: number of notes per page
+        :param prefetch: request the next page while the current one is consumed
+        :param params: extra query string parameters (eg 'order_by', 'order_dir')
+        :param model: yield models (Note, Folder, Tag, Resource) instead of dict
+        :return: async generator of notes
+        """
+        fields = self.note_props if fields is None else fields
+        return self._paginate('/notes/', fields, page_size, prefetch, model and Note, **params)
 
-    async def get_notes_tags(self, note_id):
+    async def get_notes_tags(self, note_id, fields=None):
         """
         GET /notes/:id/tags
 
         get all the tags attached to this note
+        :param fields: fields we want to get, comma separated
         :return: res: result of the get
         """
         path = f'/notes/{note_id}/tags'
-        return await self.query('get', path, self.note_props)
+        return await self.query('get', path, self.tag_props if fields is None else fields)
 
-    async def get_notes_resources(self, note_id):
+    def iter_notes_tags(self, note_id, fields='', page_size=None, prefetch=False, model=False):
+        """
+        GET /notes/:id/tags
+
+        iterate over all the tags attached to this note
+        :param model: yield models (Note, Folder, Tag, Resource) instead of dict
+        :return: async generator of tags
+        """
+        path = f'/notes/{note_id}/tags'
+        return self._paginate(path, fields, page_size, prefetch, model and Tag)
+
+    async def get_notes_resources(self, note_id, fields=None):
         """
         GET /notes/:id/resources
 
         get all the resources of this note
+        :param fields: fields we want to get, comma separated
         :return: res: result of the get
         """
         path = f'/notes/{note_id}/resources'
-        return await self.query('get', path, self.resource_props)
+        return await self.query('get', path, self.resource_props if fields is None else fields)
+
+    def iter_notes_resources(self, note_id, fields=None, page_size=None, prefetch=False, model=False):
+        """
+        GET /notes/:id/resources
+
+        iterate over all the resources of this note
+        :param model: yield models (Note, Folder, Tag, Resource) instead of dict
+        :return: async generator of resources
+        """
+        fields = self.resource_props if fields is None else fields
+        path = f'/notes/{note_id}/resources'
+        return self._paginate(path, fields, page_size, prefetch, model and Resource)
 
     async def create_note(self, title, body, parent_id, **kwargs):
         """
@@ -201,6 +522,18 @@ class JoplinApi:
         :param kwargs: dict of additional data
         :return: res: json result of the put
         """
+        path = f'/notes/{note_id}'
+        if self.baselines is not None:
+            # only what is given, and differs from the last known version of the note
+            if self.baselines.revalidate:
+                await self.baselines.validate(self, note_id)
+            data = {'title': title, 'body': body, 'parent_id': parent_id,
+                    **{key: kwargs[key] for key in DELTA_NOTE_FIELDS if key in kwargs}}
+            data = self.baselines.changes(note_id, data)
+            if not data:
+                return self.baselines.unchanged(self, note_id)
+            return await self.query('put', path, **data)
+
         is_todo = kwargs.get('is_todo', 0)
         data = {'title': title,
                 'body': body,
@@ -216,7 +549,6 @@ class JoplinApi:
             data['todo_due'] = todo_due
             data['todo_completed'] = todo_completed
 
-        path = f'/notes/{note_id}'
         return await self.query('put', path, **data)
 
     async def delete_note(self, note_id):
@@ -230,40 +562,100 @@ class JoplinApi:
         path = f'/notes/{note_id}'
         return await self.query('delete', path, self.note_props)
 
+    async def create_notes(self, notes, concurrency=None):
+        """
+        POST /notes
+
+        Add many notes concurrently
+        :param notes: iterable of dict with the parameters of `create_note`
+        :param concurrency: max number of queries at once
+        :return: list of BulkResult in the order of the notes
+        """
+        return await self._bulk(lambda note: self.create_note(**note), notes, concurrency)
+
+    async def update_notes(self, notes, concurrency=None):
+        """
+        PUT /notes/:id
+
+        Edit many notes concurrently
+        :param notes: iterable of dict with the parameters of `update_note` (including `note_id`)
+        :param concurrency: max number of queries at once
+        :return: list of BulkResult in the order of the notes
+        """
+        return await self._bulk(lambda note: self.update_note(**note), notes, concurrency)
+
+    async def delete_notes(self, note_ids, concurrency=None):
+        """
+        DELETE /notes/:id
+
+        Delete many notes concurrently
+        :param note_ids: iterable of note id
+        :param concurrency: max number of queries at once
+        :return: list of BulkResult in the order of the note ids
+        """
+        return await self._bulk(self.delete_note, note_ids, concurrency)
+
     ##############
     # FOLDERS
     ##############
 
-    async def get_folder(self, folder_id):
+    async def get_folder(self, folder_id, fields=None):
         """
         GET /folders/:id
 
         get a folder
         :param folder_id: string of the folder id
+        :param fields: fields we want to get, comma separated
         :return: res: json result of the get
         """
         path = f'/folders/{folder_id}'
-        return await self.query('get', path, self.folder_props)
+        return await self.query('get', path, self.folder_props if fields is None else fields)
 
-    async def get_folders(self):
+    async def get_folders(self, fields=None):
         """
         GET /folders
 
         get the list of all the folders of the joplin profile
+        :param fields: fields we want to get, comma separated
         :return: res: json result of the get
         """
-        return await self.query('get', '/folders/', self.folder_props)
+        return await self.query('get', '/folders/', self.folder_props if fields is None else fields)
+
+    def iter_folders(self, fields=None, page_size=None, prefetch=False, model=False, **params):
+        """
+        GET /folders
+
+        iterate over all the folders of the joplin profile
+        :param model: yield models (Note, Folder, Tag, Resource) instead of dict
+        :return: async generator of folders
+        """
+        fields = self.folder_props if fields is None else fields
+        return self._paginate('/folders/', fields, page_size, prefetch, model and Folder, **params)
 
-    async def get_folders_notes(self, folder_id):
+    async def get_folders_notes(self, folder_id, fields=None):
         """
         GET /folders/:id/notes
 
         get the list of all the notes of this folder
         :param folder_id: string of the folder id
+        :param fields: fields we want to get, comma separated
         :return: res: json result of the get
         """
         path = f'/folders/{folder_id}/notes'
-        return await self.query('get', path, self.note_props)
+        return await self.query('get', path, self.note_props if fields is None else fields)
+
+    def iter_folders_notes(self, folder_id, fields=None, page_size=None, prefetch=False, model=False, **params):
+        """
+        GET /folders/:id/notes
+
+        iterate over all the notes of this folder
+        :param folder_id: string of the folder id
+        :param model: yield models (Note, Folder, Tag, Resource) instead of dict
+        :return: async generator of notes
+        """
+        fields = self.note_props if fields is None else fields
+        path = f'/folders/{folder_id}/notes'
+        return self._paginate(path, fields, page_size, prefetch, model and Note, **params)
 
     async def create_folder(self, folder, **kwargs):
         """
@@ -271,10 +663,14 @@ class JoplinApi:
 
         Add a new folder
         :param folder: name of the folder
+        :param kwargs: dict of additional data (eg 'parent_id', 'id')
         :return: res: json result of the post
         """
         parent_id = kwargs.get('parent_id', '')
         data = {'title': folder, 'parent_id': parent_id}
+        # an ID has been set to create a folder
+        if 'id' in kwargs and re.match('[a-z0-9]{32}', kwargs['id']):
+            data['id'] = kwargs['id']
         return await self.query('post', '/folders/', **data)
 
     async def update_folder(self, folder_id, title, **kwargs):
@@ -314,39 +710,92 @@ class JoplinApi:
         data = {'id': folder_id, 'folder': folder}
         return await self.query('put', '/folders/', **data)
 
+    async def create_folders(self, folders, concurrency=None):
+        """
+        POST /folders
+
+        Add many folders concurrently
+        :param folders: iterable of folder name, or of dict with the parameters of `create_folder`
+        :param concurrency: max number of queries at once
+        :return: list of BulkResult in the order of the folders
+        """
+        async def create(folder):
+            if isinstance(folder, str):
+                return await self.create_folder(folder)
+            return await self.create_folder(**folder)
+        return await self._bulk(create, folders, concurrency)
+
+    async def update_folders(self, folders, concurrency=None):
+        """
+        PUT /folders/:id
+
+        Edit many folders concurrently
+        :param folders: iterable of dict with the parameters of `update_folder` (including `folder_id`)
+        :param concurrency: max number of queries at once
+        :return: list of BulkResult in the order of the folders
+        """
+        return await self._bulk(lambda folder: self.update_folder(**folder), folders, concurrency)
+
+    async def delete_folders(self, folder_ids, concurrency=None):
+        """
+        DELETE /folders/:id
+
+        Delete many folders concurrently
+        :param folder_ids: iterable of folder id
+        :param concurrency: max number of queries at once
+        :return: list of BulkResult in the order of the folder ids
+        """
+        return await self._bulk(self.delete_folder, folder_ids, concurrency)
+
     ##############
     # TAGS
     ##############
 
-    async def get_tag(self, tag_id):
+    async def get_tag(self, tag_id, fields=''):
         """
         GET /tags/:id
 
         get a tag
         :param tag_id: string name of the tag
+        :param fields: fields we want to get, comma separated
         :return: res: json result of the get
         """
         path = f'/tags/{tag_id}'
-        return await self.query('get', path)
+        return await self.query('get', path, fields)
 
-    async def get_tags(self):
+    async def get_tags(self, fields=''):
         """
         GET /tags
 
         get the list of all the tags of the joplin profile
+        :param fields: fields we want to get, comma separated
         :return: res: json result of the get
         """
-        return await self.query('get', '/tags/')
+        return await self.query('get', '/tags/', fields)
+
+    def iter_tags(self, fields='', page_size=None, prefetch=False, model=False, **params):
+        """
+        GET /tags
 
-    async def create_tag(self, title):
+        iterate over all the tags of the joplin profile
+        :param model: yield models (Note, Folder, Tag, Resource) instead of dict
+        :return: async generator of tags
+        """
+        return self._paginate('/tags/', fields, page_size, prefetch, model and Tag, **params)
+
+    async def create_tag(self, title, **kwargs):
         """
         POST /tags
 
         Add a new tag
         :param title: name of the tag
+        :param kwargs: dict of additional data (eg 'id')
         :return: res: json result of the post
         """
         data = {'title': title}
+        # an ID has been set to create a tag
+        if 'id' in kwargs and re.match('[a-z0-9]{32}', kwargs['id']):
+            data['id'] = kwargs['id']
         return await self.query('post', '/tags/', **data)
 
     async def update_tag(self, tag_id, title):
@@ -373,6 +822,39 @@ class JoplinApi:
         path = f'/tags/{tag_id}'
         return await self.query('delete', path)
 
+    async def create_tags(self, titles, concurrency=None):
+        """
+        POST /tags
+
+        Add many tags concurrently
+        :param titles: iterable of tag name
+        :param concurrency: max number of queries at once
+        :return: list of BulkResult in the order of the titles
+        """
+        return await self._bulk(self.create_tag, titles, concurrency)
+
+    async def update_tags(self, tags, concurrency=None):
+        """
+        PUT /tags/:id
+
+        Edit many tags concurrently
+        :param tags: iterable of dict with the parameters of `update_tag` (`tag_id` and `title`)
+        :param concurrency: max number of queries at once
+        :return: list of BulkResult in the order of the tags
+        """
+        return await self._bulk(lambda tag: self.update_tag(**tag), tags, concurrency)
+
+    async def delete_tags(self, tag_ids, concurrency=None):
+        """
+        DELETE /tags/:id
+
+        Delete many tags concurrently
+        :param tag_ids: iterable of tag id
+        :param concurrency: max number of queries at once
+        :return: list of BulkResult in the order of the tag ids
+        """
+        return await self._bulk(self.delete_tag, tag_ids, concurrency)
+
     async def get_tags_notes_preview(self, tag_id):
         """
         GET /tags/:id/notes
@@ -383,25 +865,40 @@ class JoplinApi:
         path = f'/tags/{tag_id}/notes'
         return await self.query('get', path, self.preview_note_props)
 
-    async def get_tags_notes(self, tag_id):
+    async def get_tags_notes(self, tag_id, fields=None):
         """
         GET /tags/:id/notes
 
         Gets all the notes with this tag.
+        :param fields: fields we want to get, comma separated
         :return: res: json result of the get
         """
         path = f'/tags/{tag_id}/notes'
-        return await self.query('get', path, self.note_props)
+        return await self.query('get', path, self.note_props if fields is None else fields)
+
+    def iter_tags_notes(self, tag_id, fields=None, page_size=None, prefetch=False, model=False, **params):
+        """
+        GET /tags/:id/notes
+
+        iterate over all the notes with this tag
+        :param model: yield models (Note, Folder, Tag, Resource) instead of dict
+        :return: async generator of notes
+        """
+        fields = self.note_props if fields is None else fields
+        path = f'/tags/{tag_id}/notes'
+        return self._paginate(path, fields, page_size, prefetch, model and Note, **params)
 
     async def create_tags_notes(self, note_id, tag):
         """
         POST /tags/:id/notes
 
-        create a tag from a note
-        :return: res: json result of the get
+        add a tag to a note
+        :param note_id: string id of the note to tag
+        :param tag: string id of the tag
+        :return: res: json result of the post
         """
-        data = {'title': tag}
-        path = f'/tags/{note_id}/notes'
+        data = {'id': note_id}
+        path = f'/tags/{tag}/notes'
         return await self.query('post', path, **data)
 
     async def delete_tags_notes(self, tag_id, note_id):
@@ -420,44 +917,79 @@ class JoplinApi:
     # RESOURCES
     ##############
 
-    async def get_resource(self, resource_id):
+    async def get_resource(self, resource_id, fields=''):
         """
         GET /resources/:id
 
         get a resource
         :param resource_id: string name of the resource
+        :param fields: fields we want to get, comma separated
         :return: res: json result of the get
         """
         path = f'/resources/{resource_id}'
-        return await self.query('get', path)
+        return await self.query('get', path, fields)
 
-    async def get_resources(self):
+    async def get_resources(self, fields=''):
         """
         GET /resources
 
         get the list of all the resource_id of the joplin profile
+        :param fields: fields we want to get, comma separated
         :return: res: json result of the get
         """
-        return await self.query('get', '/resources/')
+        return await self.query('get', '/resources/', fields)
+
+    def iter_resources(self, fields='', page_size=None, prefetch=False, model=False, **params):
+        """
+        GET /resources
+
+        iterate over all the resources of the joplin profile
+        :param model: yield models (Note, Folder, Tag, Resource) instead of dict
+        :return: async generator of resources
+        """
+        return self._paginate('/resources/', fields, page_size, prefetch, model and Resource, **params)
 
     async def create_resource(self, resource_file, **props):
         """
         POST /resources
 
         Add a new resource
-        :param resource_file: string, name of the resource_file
-        :param props: dict
-        :return: res: json result of the post
+        :param resource_file: string, name of the resource_file,
+                              or its content: bytes, memoryview, binary file object, async iterable of bytes
+        :param props: dict, `filename` is required when `resource_file` is not a name of file
+        :return: res: json result of the post,
+                 with `DEDUP_RESOURCES` the one of GET /resources/:id when the content is already a resource
         """
         if 'title' not in props:
             raise ValueError('`create_resource` requires `title` in `props` property')
 
-        data = {'filename': os.path.basename(resource_file),
+        if is_path(resource_file):
+            filename = os.path.basename(resource_file)
+        else:
+            filename = props.pop('filename', '') or props['title']
+        if self.dedup is not None:
+            return await self.dedup.create(resource_file, filename, props)
+        return await self._upload_resource(resource_file, filename, props)
+
+    async def _upload_resource(self, resource_file, filename, props):
+        data = {'filename': filename,
                 'resource_file': resource_file,
                 'props': props}
 
         return await self.query('post', '/resources/', **data)
 
+    async def create_resources(self, resources, concurrency=None):
+        """
+        POST /resources
+
+        Add many resources concurrently
+        :param resources: iterable of dict with the parameters of `create_resource`
+                          (`resource_file`, `title` ...)
+        :param concurrency: max number of uploads at once
+        :return: list of BulkResult in the order of the resources
+        """
+        return await self._bulk(lambda resource: self.create_resource(**resource), resources, concurrency)
+
     async def update_resources(self, resource_id, **props):
         """
         PUT /resources/:id
@@ -484,6 +1016,133 @@ class JoplinApi:
         path = f'/resources/{resource_id}/file'
         return await self.query('get', path)
 
+    async def stream_resource(self, resource_id, chunk_size=None, offset=0):
+        """
+        GET /resources/:id/file
+
+        Download a file chunk by chunk, without holding it in memory
+        :param resource_id: string id of the resource
+        :param chunk_size: size of the chunks, default `CHUNK_SIZE` of the config
+        :param offset: number of bytes to skip, asked with a Range header
+        :return: async generator of bytes
+        """
+        async for position, chunk in self._stream_file(resource_id, chunk_size, offset):
+            # the Range header has been ignored, skip the beginning ourselves
+            if position < offset:
+                if position + len(chunk) <= offset:
+                    continue
+                chunk = chunk[offset - position:]
+            yield chunk
+
+    async def _stream_file(self, resource_id, chunk_size, offset):
+        """
+        :return: async generator of (position of the chunk in the file, chunk),
+                 from 0 when the server ignores the Range header
+        """
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        path = f'/resources/{resource_id}/file'
+        event = self.instrumentation.start('get', path)
+        res = error = None
+        try:
+            async with self.client.stream('GET', self.JOPLIN_HOST + path,
+                                          params={'token': self.token}, headers=headers) as res:
+                if offset and res.status_code == 416:
+                    # nothing left after the offset
+                    return
+                res.raise_for_status()
+                position = offset if res.status_code == 206 else 0
+                async for chunk in res.aiter_bytes(chunk_size or self.chunk_size):
+                    yield position, chunk
+                    position += len(chunk)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.instrumentation.end(event, res, error)
+
+    async def download_resource_to(self, resource_id, path, chunk_size=None, resume=True):
+        """
+        GET /resources/:id/file
+
+        Download a file to the disk
+        :param resource_id: string id of the resource
+        :param path: string, name of the file to write
+        :param chunk_size: size of the chunks, default `CHUNK_SIZE` of the config
+        :param resume: complete the existing file instead of downloading it again,
+                       when it is a part of the same version of the resource
+        :return: path: the name of the file
+        """
+        offset = 0
+        # updated_time of the resource, kept next to the file while it is partial
+        marker = f'{path}.version'
+        version = None
+        if resume:
+            res = await self.get_resource(resource_id, 'id,size,updated_time')
+            res.raise_for_status()
+            resource = res.json()
+            version = str(resource.get('updated_time', ''))
+            offset = self._resume_offset(path, marker, version, resource.get('size'))
+        loop = asyncio.get_running_loop()
+        f = None
+        try:
+            async for position, chunk in self._stream_file(resource_id, chunk_size, offset):
+                # the file is only touched once the download succeeded to start
+                if f is None:
+                    # the whole file is sent again when the server ignores the Range header
+                    f = open(path, 'ab' if position else 'wb')
+                    if version is not None:
+                        await loop.run_in_executor(None, self._write_marker, marker, version)
+                # do not block the event loop with the disk
+                await loop.run_in_executor(None, f.write, chunk)
+        finally:
+            if f is not None:
+                f.close()
+        if f is None and not offset:
+            # empty file
+            open(path, 'wb').close()
+        if version is not None and os.path.exists(marker):
+            # complete
+            os.remove(marker)
+        return path
+
+    @staticmethod
+    def _resume_offset(path, marker, version, size):
+        """
+        :return: size of the part of the file already downloaded, 0 when it is another version
+        """
+        if not os.path.exists(path):
+            return 0
+        offset = os.path.getsize(path)
+        try:
+            with open(marker, encoding='utf-8') as f:
+                downloaded = f.read()
+        except FileNotFoundError:
+            # without marker, the file is complete, or written by something else
+            return offset if offset == size else 0
+        return offset if downloaded == version else 0
+
+    @staticmethod
+    def _write_marker(marker, version):
+        with open(marker, 'w', encoding='utf-8') as f:
+            f.write(version)
+
+    async def download_resources_many(self, resource_ids, dest_dir, chunk_size=None, resume=True, concurrency=None):
+        """
+        GET /resources/:id/file
+
+        Download many files concurrently, each one in a file named as its id
+        :param resource_ids: iterable of resource id
+        :param dest_dir: string, folder where to write the files
+        :param chunk_size: size of the chunks, default `CHUNK_SIZE` of the config
+        :param resume: complete the existing files instead of downloading them again
+        :param concurrency: max number of downloads at once
+        :return: list of BulkResult in the order of the resource ids, the `response` being the name of the file
+        """
+        async def download(resource_id):
+            path = os.path.join(dest_dir, resource_id)
+            return await self.download_resource_to(resource_id, path, chunk_size, resume)
+        return await self._bulk(download, resource_ids, concurrency)
+
     async def delete_resources(self, resource_id):
         """
         DELETE /resources/:id
@@ -495,6 +1154,60 @@ class JoplinApi:
         path = f'/resources/{resource_id}'
         return await self.query('delete', path)
 
+    ####################
+    # MODELS
+    ####################
+    async def _fetch_model(self, model, path, fields):
+        res = await self.query('get', path, fields)
+        res.raise_for_status()
+        return model(self, **res.json())
+
+    async def fetch_note(self, note_id, fields=None):
+        """
+        GET /notes/:id
+
+        get that note as a Note model
+        :param note_id: string
+        :param fields: fields we want to get, default `note_props`
+        :return: Note
+        """
+        return await self._fetch_model(Note, f'/notes/{note_id}', self.note_props if fields is None else fields)
+
+    async def fetch_folder(self, folder_id, fields=None):
+        """
+        GET /folders/:id
+
+        get that folder as a Folder model
+        :param folder_id: string
+        :param fields: fields we want to get, default `folder_props`
+        :return: Folder
+        """
+        return await self._fetch_model(Folder, f'/folders/{folder_id}',
+                                       self.folder_props if fields is None else fields)
+
+    async def fetch_tag(self, tag_id, fields=None):
+        """
+        GET /tags/:id
+
+        get that tag as a Tag model
+        :param tag_id: string
+        :param fields: fields we want to get, default `tag_props`
+        :return: Tag
+        """
+        return await self._fetch_model(Tag, f'/tags/{tag_id}', self.tag_props if fields is None else fields)
+
+    async def fetch_resource(self, resource_id, fields=None):
+        """
+        GET /resources/:id
+
+        get that resource as a Resource model
+        :param resource_id: string
+        :param fields: fields we want to get, default `resource_props`
+        :return: Resource
+        """
+        return await self._fetch_model(Resource, f'/resources/{resource_id}',
+                                       self.resource_props if fields is None else fields)
+
     ####################
     # PING
     ####################
@@ -525,21 +1238,78 @@ class JoplinApi:
         :param field, 'title' or 'body' or nothing
         :return: res: json result of the request
         """
-        words = []
-        # exact match
+        # replace multiple space by one if any
+        query = re.sub(' +', ' ', query.strip())
+        # exact match and '*' wildcard are understood by joplin as they are
         if query.startswith('"') and query.endswith('"'):
-            words[0] = query.replace('"', '').replace('"', '')
-        # '*' wildcard use case
-        elif query.endswith('*'):
-            words[0] = query
-        # if space in query
-        elif ' ' in query:
-            # replace multiple space by one if any
-            new_query = re.sub(' +', ' ', query)
-            words = new_query.split(' ')
+            words = [query]
         else:
-            words[0] = query
-        # if a field is specified, just filter with this one, otherwise use both
-        qs = {field: words} if field else {'body': words, 'title': words}
-        res = await self.query('get', '/search/', **qs)
+            words = query.split(' ')
+        # if a field is specified, just filter with this one, otherwise joplin uses both
+        if len(field) == 1:
+            query = ' '.join(f'{field[0]}:{word}' for word in words)
+        res = await self.query('get', '/search/', query=query)
         return res
+
+    def iter_search(self, query, item_type=None, fields='', page_size=None, prefetch=False, model=False):
+        """
+        GET /search?query=YOUR_QUERY
+
+        iterate over all the results of the search, page after page
+        :param query: string, the query syntax is described in https://joplinapp.org/#searching
+        :param item_type: 'note' (default of joplin), 'folder', 'tag' or 'resource'
+        :param fields: fields we want to get
+        :param model: yield models (Note, Folder, Tag, Resource) instead of dict
+        :return: async generator of the matching items
+        """
+        params = {'query': query}
+        if item_type:
+            params['type'] = item_type
+        return self._paginate('/search/', fields, page_size, prefetch, model and MODELS[item_type or 'note'], **params)
+
+    ####################
+    # EVENTS
+    ####################
+    async def get_events(self, cursor=None):
+        """
+        GET /events
+
+        get the changes done on the notes since the cursor
+        without cursor, joplin only returns the current cursor
+        :param cursor: string, the `cursor` returned by the previous call
+        :return: res: json result of the request
+        """
+        params = {'cursor': cursor} if cursor else {}
+        return await self.query('get', '/events/', **params)
+
+    def watch_changes(self, kinds=None):
+        """
+        follow the changes of the profile, from `/events` for the notes and from the `id` and `updated_time`
+        of the folders, tags and resources. All the consumers share one poller, see watch.py
+        :param kinds: iterable of 'note', 'folder', 'tag', 'resource', all of them if None
+        :return: async generator of ChangeEvent
+        """
+        if self.watcher is None:
+            self.watcher = ChangeWatcher(self, **self._watch_config)
+        return self.watcher.subscribe(kinds)
+
+    ####################
+    # ARCHIVE
+    ####################
+    async def export_profile(self, path, concurrency=None):
+        """
+        write the whole profile (folders, tags, notes, links, resources) to a tar archive
+        :param path: string, name of the archive
+        :param concurrency: max number of queries at once
+        :return: dict, the manifest of the archive
+        """
+        return await export_profile(self, path, concurrency)
+
+    async def import_profile(self, path, concurrency=None):
+        """
+        restore an archive written by `export_profile`, the items keep their ids
+        :param path: string, name of the archive
+        :param concurrency: max number of queries at once
+        :return: dict with the number of items created of each kind and the failed BulkResult in `errors`
+        """
+        return await import_profile(self, path, concurrency)
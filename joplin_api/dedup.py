@@ -0,0 +1,269 @@
+# coding: utf-8
+"""
+    Deduplication of the resources by their content
+
+    Before an upload, the content is hashed (sha256, read chunk by chunk in a
+    worker thread) and looked up in an index digest -> resource id. When the
+    content is already stored as a resource, this resource is returned instead
+    of a new one. The index is made of the previous uploads, and of the
+    resources of the profile which have the same size as the content: these
+    ones are downloaded and hashed once. It can be kept in a JSON file between
+    two runs
+"""
+import asyncio
+import hashlib
+import json
+from logging import getLogger
+import os
+
+import httpx
+
+from .multipart import is_path
+
+__all__ = ['ResourceDedup', 'content_digest']
+
+logger = getLogger("joplin_api.dedup")
+
+INDEX_VERSION = 1
+
+
+def _hash_file(f, chunk_size):
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return digest.hexdigest(), size
+        digest.update(chunk)
+        size += len(chunk)
+
+
+def _hash_path(path, chunk_size):
+    with open(path, 'rb') as f:
+        return _hash_file(f, chunk_size)
+
+
+def _hash_seekable(f, chunk_size):
+    # the upload reads the file object again from where it was
+    start = f.tell()
+    try:
+        return _hash_file(f, chunk_size)
+    finally:
+        f.seek(start)
+
+
+def _hash_bytes(data):
+    view = memoryview(data).cast('B')
+    return hashlib.sha256(view).hexdigest(), view.nbytes
+
+
+def hashable(source):
+    """
+    :return: True if the content can be hashed before being uploaded,
+             an async iterable can only be read once
+    """
+    if is_path(source) or isinstance(source, (bytes, bytearray, memoryview)):
+        return True
+    return hasattr(source, 'read') and hasattr(source, 'seekable') and source.seekable()
+
+
+async def content_digest(source, chunk_size=64 * 1024):
+    """
+    :param source: path of a file, bytes, memoryview or seekable binary file object
+    :return: (sha256 hex digest, size in bytes), computed in a worker thread
+    """
+    loop = asyncio.get_running_loop()
+    if is_path(source):
+        return await loop.run_in_executor(None, _hash_path, source, chunk_size)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return await loop.run_in_executor(None, _hash_bytes, source)
+    return await loop.run_in_executor(None, _hash_seekable, source, chunk_size)
+
+
+class ResourceDedup:
+    """
+    index of the content of the resources, used by JoplinApi with `DEDUP_RESOURCES=True`
+    """
+
+    def __init__(self, api, path=None, hash_remote=True):
+        """
+        :param api: JoplinApi instance
+        :param path: JSON file where the index is kept between two runs, in memory only if None
+        :param hash_remote: download and hash the resources of the profile which have the size of the content,
+                            else only the previous uploads are known
+        """
+        self.api = api
+        self.path = path
+        self.hash_remote = hash_remote
+        # sha256 -> resource id, and back
+        self.digests = {}
+        self._ids = {}
+        # size -> ids of the resources not hashed yet, None until the index is loaded
+        self._sizes = None
+        # sha256 -> task of the upload of this content
+        self._inflight = {}
+        # created in the event loop
+        self._lock = None
+        self.uploaded = 0
+        self.reused = 0
+        self.bytes_saved = 0
+
+    def stats(self):
+        """
+        :return: dict of the counters
+        """
+        return {'digests': len(self.digests), 'uploaded': self.uploaded, 'reused': self.reused,
+                'bytes_saved': self.bytes_saved}
+
+    def record(self, digest, resource_id, size=None):
+        """
+        :param size: size of the content, to not hash this resource again
+        """
+        self.forget(self.digests.get(digest))
+        self.digests[digest] = resource_id
+        self._ids[resource_id] = digest
+        if self._sizes is not None and resource_id in self._sizes.get(size, ()):
+            self._sizes[size].remove(resource_id)
+
+    def forget(self, resource_id):
+        digest = self._ids.pop(resource_id, None)
+        if digest is not None:
+            self.digests.pop(digest, None)
+        if self._sizes is not None:
+            for ids in self._sizes.values():
+                if resource_id in ids:
+                    ids.remove(resource_id)
+
+    async def load(self):
+        """
+        read the index of the file, keep the entries of the resources which still exist,
+        and the sizes of the resources not hashed yet
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._sizes is not None:
+                return
+            saved = {}
+            if self.path and os.path.exists(self.path):
+                loop = asyncio.get_running_loop()
+                try:
+                    saved = await loop.run_in_executor(None, self._read)
+                except (OSError, ValueError) as e:
+                    logger.warning('index %s ignored: %r', self.path, e)
+            sizes = {}
+            existing = set()
+            async for resource in self.api.iter_resources('id,size'):
+                existing.add(resource['id'])
+                sizes.setdefault(resource.get('size'), []).append(resource['id'])
+            for digest, resource_id in saved.items():
+                if resource_id in existing and resource_id not in self._ids:
+                    self.record(digest, resource_id)
+            self._sizes = {size: [resource_id for resource_id in ids if resource_id not in self._ids]
+                           for size, ids in sizes.items()}
+
+    def _read(self):
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != INDEX_VERSION:
+            return {}
+        return data['digests']
+
+    async def save(self):
+        """
+        write the index to its file, the previous one being replaced only once the new one is complete
+        """
+        if not self.path or self._sizes is None:
+            # not loaded, the file is left as it is
+            return
+        data = {'version': INDEX_VERSION, 'digests': dict(self.digests)}
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._write, data)
+
+    def _write(self, data):
+        part = self.path + '.part'
+        with open(part, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(part, self.path)
+
+    async def create(self, resource_file, filename, props):
+        """
+        upload the content, or return the resource which already has it
+        :return: the response of POST /resources, or of GET /resources/:id of the existing resource
+        """
+        if props.get('id') or not hashable(resource_file):
+            return await self.api._upload_resource(resource_file, filename, props)
+        await self.load()
+        digest, size = await content_digest(resource_file, self.api.chunk_size)
+        resource_id = self.digests.get(digest)
+        if resource_id is None and self.hash_remote:
+            resource_id = await self._match_remote(digest, size)
+        if resource_id is not None:
+            res = await self.api.get_resource(resource_id, self.api.resource_props)
+            if res.status_code == 200:
+                self.reused += 1
+                self.bytes_saved += size
+                return res
+            # deleted by another client
+            self.forget(resource_id)
+        # the identical contents uploaded at the same time share one upload
+        task = self._inflight.get(digest)
+        if task is None:
+            task = asyncio.ensure_future(self._upload(digest, size, resource_file, filename, props))
+            self._inflight[digest] = task
+            task.add_done_callback(lambda done: self._inflight.pop(digest, None))
+        else:
+            self.reused += 1
+            self.bytes_saved += size
+        return await asyncio.shield(task)
+
+    async def _upload(self, digest, size, resource_file, filename, props):
+        res = await self.api._upload_resource(resource_file, filename, props)
+        if res.status_code < 400:
+            self.uploaded += 1
+            self.record(digest, res.json()['id'], size)
+        return res
+
+    async def _match_remote(self, digest, size):
+        """
+        hash the resources of the profile which have this size
+        :return: id of the resource with this digest, or None
+        """
+        async with self._lock:
+            if digest in self.digests:
+                return self.digests[digest]
+            candidates = self._sizes.pop(size, [])
+            for index, resource_id in enumerate(candidates):
+                try:
+                    remote = await self._remote_digest(resource_id)
+                except httpx.HTTPError as e:
+                    logger.warning('resource %s not hashed: %r', resource_id, e)
+                    continue
+                self.record(remote, resource_id)
+                if remote == digest:
+                    # the others are hashed when they are needed
+                    if candidates[index + 1:]:
+                        self._sizes[size] = candidates[index + 1:]
+                    return resource_id
+        return None
+
+    async def _remote_digest(self, resource_id):
+        loop = asyncio.get_running_loop()
+        digest = hashlib.sha256()
+        async for chunk in self.api.stream_resource(resource_id):
+            await loop.run_in_executor(None, digest.update, chunk)
+        return digest.hexdigest()
+
+    def on_write(self, method, path, payload, response):
+        """
+        listener of JoplinApi: follow the resources deleted, and created without the index
+        """
+        parts = path.strip('/').split('/')
+        if parts[0] != 'resources':
+            return
+        if method == 'delete' and len(parts) == 2:
+            self.forget(parts[1])
+        elif method == 'post' and len(parts) == 1 and self._sizes is not None:
+            resource = response.json()
+            if isinstance(resource, dict) and 'id' in resource and resource['id'] not in self._ids:
+                self._sizes.setdefault(resource.get('size'), []).append(resource['id'])
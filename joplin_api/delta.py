@@ -0,0 +1,181 @@
+# coding: utf-8
+"""
+    Delta updates of the notes
+
+    The last known version of each note (read or written through the api) is
+    kept, the long texts as a digest only. `update_note` then sends only the
+    fields which changed, and no request at all when nothing changed.
+    A baseline is checked against the `updated_time` of the note before being
+    used: a note changed by another client, or a baseline read without the
+    `updated_time`, is sent whole
+"""
+from collections import OrderedDict
+import hashlib
+import time
+
+import httpx
+
+__all__ = ['NoteBaselines']
+
+# the strings longer than this are kept as their digest
+DIGEST_FROM = 256
+# routes of which the GET responses contain notes
+NOTE_LISTINGS = (['notes'], ['folders', ':id', 'notes'], ['tags', ':id', 'notes'])
+
+
+def fingerprint(value):
+    """
+    :return: the value, or a digest of the long strings
+    """
+    if isinstance(value, str) and len(value) > DIGEST_FROM:
+        return 'sha1:' + hashlib.sha1(value.encode('utf-8', 'surrogatepass')).hexdigest()
+    return value
+
+
+class NoteBaselines:
+    """
+    last known fields of the notes, used by JoplinApi with `DELTA_UPDATES=True`
+    """
+
+    def __init__(self, max_entries=10000, ttl=300.0, revalidate=True):
+        """
+        :param max_entries: number of notes kept, the least recently used are dropped
+        :param ttl: seconds after which a baseline is not trusted anymore, forever if None
+        :param revalidate: compare the `updated_time` of the baseline with the one of the note before an update
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.revalidate = revalidate
+        # note id -> (time, dict field -> fingerprint)
+        self._notes = OrderedDict()
+        # requests not sent, fields not sent, characters not sent
+        self.skipped = 0
+        self.fields_saved = 0
+        self.chars_saved = 0
+        # baselines dropped because the note changed outside of this client
+        self.stale = 0
+        # baselines dropped because they did not know the `updated_time` of the note
+        self.unversioned = 0
+
+    def __len__(self):
+        return len(self._notes)
+
+    def stats(self):
+        """
+        :return: dict of the counters
+        """
+        return {'notes': len(self._notes), 'skipped': self.skipped, 'fields_saved': self.fields_saved,
+                'chars_saved': self.chars_saved, 'stale': self.stale, 'unversioned': self.unversioned}
+
+    def get(self, note_id):
+        """
+        :return: dict field -> fingerprint of the note, empty if unknown or too old
+        """
+        entry = self._notes.get(note_id)
+        if entry is None:
+            return {}
+        if self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+            del self._notes[note_id]
+            return {}
+        self._notes.move_to_end(note_id)
+        return entry[1]
+
+    def record(self, note_id, fields):
+        """
+        merge these fields in the baseline of the note
+        """
+        entry = self._notes.get(note_id)
+        known = entry[1] if entry is not None else {}
+        known.update((name, fingerprint(value)) for name, value in fields.items() if name != 'id')
+        self._notes[note_id] = (time.monotonic(), known)
+        self._notes.move_to_end(note_id)
+        while len(self._notes) > self.max_entries:
+            self._notes.popitem(last=False)
+
+    def forget(self, note_id):
+        self._notes.pop(note_id, None)
+
+    async def validate(self, api, note_id):
+        """
+        drop the baseline of the note if the note was changed since, eg by another client,
+        or if the baseline cannot tell, having no `updated_time`
+        :param api: JoplinApi instance
+        """
+        if api.write_behind is not None:
+            # the pending update of the note is sent first, its version is the one to compare with
+            await api.write_behind.before(f'/notes/{note_id}')
+        known = self.get(note_id)
+        if not known:
+            return
+        if 'updated_time' not in known:
+            # nothing to compare with: a change by another client would be reverted, all the fields are sent
+            self.unversioned += 1
+            self.forget(note_id)
+            return
+        updated_time = known['updated_time']
+        res = await api.query('get', f'/notes/{note_id}', 'updated_time')
+        current = res.json() if res.status_code == 200 else {}
+        if not isinstance(current, dict) or current.get('updated_time') != updated_time:
+            self.stale += 1
+            self.forget(note_id)
+
+    def changes(self, note_id, data):
+        """
+        :param data: dict of the fields of the update
+        :return: dict of the fields which differ from the baseline, or are not known
+        """
+        known = self.get(note_id)
+        changed = {}
+        for name, value in data.items():
+            if name in known and known[name] == fingerprint(value):
+                self.fields_saved += 1
+                self.chars_saved += len(value) if isinstance(value, str) else 0
+            else:
+                changed[name] = value
+        return changed
+
+    def unchanged(self, api, note_id):
+        """
+        :return: the response of an update which did not need a request
+        """
+        self.skipped += 1
+        request = httpx.Request('PUT', f'{api.JOPLIN_HOST}/notes/{note_id}')
+        return httpx.Response(200, json={'id': note_id}, request=request)
+
+    def observe(self, path, response):
+        """
+        record the notes of a GET response
+        """
+        parts = path.strip('/').split('/')
+        route = [':id' if index % 2 else part for index, part in enumerate(parts)]
+        if route == ['notes', ':id']:
+            data = response.json()
+            if isinstance(data, dict) and 'id' in data:
+                self.record(data['id'], data)
+        elif route in NOTE_LISTINGS:
+            data = response.json()
+            items = data.get('items', []) if isinstance(data, dict) else data
+            for item in items:
+                if isinstance(item, dict) and 'id' in item:
+                    self.record(item['id'], item)
+
+    def on_write(self, method, path, payload, response):
+        """
+        listener of JoplinApi: the fields written are the new baseline
+        """
+        parts = path.strip('/').split('/')
+        if parts[0] != 'notes' or len(parts) > 2:
+            return
+        if method == 'delete' and len(parts) == 2:
+            self.forget(parts[1])
+        elif method == 'put' and len(parts) == 2:
+            fields = dict(payload)
+            note = response.json() if response.status_code == 200 else None
+            if isinstance(note, dict) and 'updated_time' in note:
+                # the version written, to check later that nobody changed the note since
+                fields['updated_time'] = note['updated_time']
+            self.record(parts[1], fields)
+        elif method == 'post' and len(parts) == 1:
+            note = response.json()
+            if isinstance(note, dict) and 'id' in note:
+                self.record(note['id'], {**payload, **note})
@@ -0,0 +1,409 @@
+# coding: utf-8
+"""
+    A stand-in for the Joplin webclipper server
+
+    It implements the routes used by JoplinApi, keeps everything in memory,
+    and can be used in-process (as an httpx transport) or on localhost
+"""
+import asyncio
+import email.parser
+import email.policy
+import json
+import time
+from urllib.parse import parse_qsl, urlsplit
+import uuid
+
+import httpx
+
+__all__ = ['FakeJoplin', 'FakeJoplinTransport', 'serve']
+
+KINDS = ('notes', 'folders', 'tags', 'resources')
+
+# default fields returned when the query does not ask for any
+DEFAULT_FIELDS = {'notes': ('id', 'parent_id', 'title'),
+                  'folders': ('id', 'parent_id', 'title'),
+                  'tags': ('id', 'parent_id', 'title'),
+                  'resources': ('id', 'title')}
+
+# events.type and events.item_type of the API
+EVENT_CREATED, EVENT_UPDATED, EVENT_DELETED = 1, 2, 3
+ITEM_TYPE_NOTE = 1
+
+
+def new_id():
+    return uuid.uuid4().hex
+
+
+def now():
+    return int(time.time() * 1000)
+
+
+class FakeJoplin:
+    """
+    in-memory profile served with the same routes as the webclipper
+    """
+
+    def __init__(self, token='', latency=0.0, max_page_size=100, events=True, ranges=True):
+        """
+        :param token: expected API token, any token is accepted if empty
+        :param latency: seconds to wait before answering each request
+        :param max_page_size: max `limit` of the paginated routes
+        :param events: serve `/events`, like Joplin 1.7+
+        :param ranges: honour the Range header on `/resources/:id/file`
+        """
+        self.token = token
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.events_enabled = events
+        self.ranges = ranges
+        self.items = {kind: {} for kind in KINDS}
+        self.blobs = {}
+        # set of (tag_id, note_id)
+        self.links = set()
+        self.events = []
+        # number of requests per (method, route)
+        self.requests = {}
+
+    ###########
+    # FIXTURES
+    ###########
+
+    def add(self, kind, **item):
+        """
+        add an item without going through the API
+        :return: the item
+        """
+        item.setdefault('id', new_id())
+        item.setdefault('title', '')
+        item.setdefault('created_time', now())
+        item.setdefault('updated_time', item['created_time'])
+        if kind in ('notes', 'folders', 'tags'):
+            item.setdefault('parent_id', '')
+        if kind == 'notes':
+            item.setdefault('body', '')
+            self._event(EVENT_CREATED, item['id'])
+        self.items[kind][item['id']] = item
+        return item
+
+    def populate(self, folders=10, notes=1000, tags=20, body_size=1024, tags_per_note=2):
+        """
+        fill the profile with generated data
+        """
+        folder_ids = [self.add('folders', title=f'folder {i}')['id'] for i in range(folders)]
+        tag_ids = [self.add('tags', title=f'tag{i}')['id'] for i in range(tags)]
+        body = ('lorem ipsum dolor sit amet ' * (body_size // 27 + 1))[:body_size]
+        for i in range(notes):
+            note = self.add('notes', title=f'note {i}', body=body,
+                            parent_id=folder_ids[i % folders] if folders else '')
+            for j in range(tags_per_note if tags else 0):
+                self.links.add((tag_ids[(i + j) % tags], note['id']))
+
+    ###########
+    # ROUTING
+    ###########
+
+    async def handle(self, method, target, headers, body):
+        """
+        answer one request
+        :param method: string, eg 'GET'
+        :param target: path and query string, eg '/notes/?limit=10'
+        :param headers: dict with lower case names
+        :param body: bytes
+        :return: (status, headers, body)
+        """
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+        parts = [part for part in url.path.split('/') if part]
+        route = '/' + '/'.join(':id' if i % 2 else part for i, part in enumerate(parts))
+        key = f'{method} {route}'
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+        if parts == ['ping']:
+            return 200, {'content-type': 'text/plain'}, b'JoplinClipperServer'
+        if self.token and params.get('token') != self.token:
+            return self._error(403, 'Invalid "token" parameter')
+        try:
+            status, data = self._route(method, parts, params, headers, body)
+        except KeyError as e:
+            return self._error(404, f'Not Found {e}')
+        except ValueError as e:
+            return self._error(400, str(e))
+        if isinstance(data, tuple):
+            # raw content: (content type, bytes, extra headers)
+            content_type, content, extra = data
+            return status, {'content-type': content_type, **extra}, content
+        return status, {'content-type': 'application/json'}, json.dumps(data).encode()
+
+    def _error(self, status, message):
+        return status, {'content-type': 'application/json'}, json.dumps({'error': message}).encode()
+
+    def _route(self, method, parts, params, headers, body):
+        kind = parts[0] if parts else ''
+        if kind == 'events' and self.events_enabled and method == 'GET':
+            return 200, self._get_events(params)
+        if kind == 'search' and method == 'GET':
+            return 200, self._search(params)
+        if kind not in KINDS:
+            raise KeyError(kind)
+        items = self.items[kind]
+
+        if len(parts) == 1:
+            if method == 'GET':
+                return 200, self._page(kind, items.values(), params)
+            if method == 'POST':
+                return 200, self._create(kind, headers, body)
+        elif len(parts) == 2:
+            item = items[parts[1]]
+            if method == 'GET':
+                return 200, self._fields(kind, item, params)
+            if method == 'PUT':
+                return 200, self._update(kind, item, json.loads(body or b'{}'))
+            if method == 'DELETE':
+                self._delete(kind, item['id'])
+                return 200, ''
+        elif len(parts) >= 3:
+            item = items[parts[1]]
+            return self._sub_route(method, kind, item, parts[2:], params, headers, body)
+        raise ValueError(f'unsupported {method} /{"/".join(parts)}')
+
+    def _sub_route(self, method, kind, item, parts, params, headers, body):
+        if kind == 'notes' and parts == ['tags'] and method == 'GET':
+            tags = [self.items['tags'][tag_id] for tag_id, note_id in self.links if note_id == item['id']]
+            return 200, self._page('tags', tags, params)
+        if kind == 'notes' and parts == ['resources'] and method == 'GET':
+            resources = [resource for resource_id, resource in self.items['resources'].items()
+                         if f':/{resource_id}' in item.get('body', '')]
+            return 200, self._page('resources', resources, params)
+        if kind == 'folders' and parts == ['notes'] and method == 'GET':
+            notes = [note for note in self.items['notes'].values() if note['parent_id'] == item['id']]
+            return 200, self._page('notes', notes, params)
+        if kind == 'tags' and parts == ['notes'] and method == 'GET':
+            notes = [self.items['notes'][note_id] for tag_id, note_id in self.links
+                     if tag_id == item['id'] and note_id in self.items['notes']]
+            return 200, self._page('notes', notes, params)
+        if kind == 'tags' and parts == ['notes'] and method == 'POST':
+            note = self.items['notes'][json.loads(body)['id']]
+            self.links.add((item['id'], note['id']))
+            return 200, note
+        if kind == 'tags' and len(parts) == 2 and parts[0] == 'notes' and method == 'DELETE':
+            self.links.discard((item['id'], parts[1]))
+            return 200, ''
+        if kind == 'resources' and parts == ['file'] and method == 'GET':
+            return self._download(item, headers)
+        raise ValueError(f'unsupported {method} {kind}/:id/{"/".join(parts)}')
+
+    ###########
+    # ACTIONS
+    ###########
+
+    def _fields(self, kind, item, params):
+        fields = params.get('fields')
+        fields = [field.strip() for field in fields.split(',')] if fields else DEFAULT_FIELDS[kind]
+        return {field: item[field] for field in fields if field in item}
+
+    def _page(self, kind, items, params):
+        items = list(items)
+        order_by = params.get('order_by', 'updated_time' if kind == 'notes' else 'title')
+        reverse = params.get('order_dir', 'ASC' if order_by == 'title' else 'DESC').upper() == 'DESC'
+        items.sort(key=lambda item: (item.get(order_by, ''), item['id']), reverse=reverse)
+        limit = min(int(params.get('limit', self.max_page_size)), self.max_page_size)
+        page = int(params.get('page', 1))
+        start = (page - 1) * limit
+        return {'items': [self._fields(kind, item, params) for item in items[start:start + limit]],
+                'has_more': start + limit < len(items)}
+
+    def _create(self, kind, headers, body):
+        if kind == 'resources':
+            data, blob = self._parse_multipart(headers.get('content-type', ''), body)
+            data.setdefault('size', len(blob))
+        else:
+            data = json.loads(body or b'{}')
+        tags = data.pop('tags', '') if kind == 'notes' else ''
+        if data.get('id') and data['id'] in self.items[kind]:
+            raise ValueError(f'duplicate id {data["id"]}')
+        item = self.add(kind, **{key: value for key, value in data.items() if value is not None and key != 'id'},
+                        **({'id': data['id']} if data.get('id') else {}))
+        if kind == 'resources':
+            self.blobs[item['id']] = blob
+        for title in [title.strip() for title in (tags or '').split(',') if title.strip()]:
+            tag = next((tag for tag in self.items['tags'].values() if tag['title'] == title), None)
+            tag = tag or self.add('tags', title=title)
+            self.links.add((tag['id'], item['id']))
+        return item
+
+    def _update(self, kind, item, data):
+        data.pop('id', None)
+        data.pop('tags', None)
+        item.update(data)
+        item['updated_time'] = max(now(), item['updated_time'] + 1)
+        if kind == 'notes':
+            self._event(EVENT_UPDATED, item['id'])
+        return item
+
+    def _delete(self, kind, item_id):
+        del self.items[kind][item_id]
+        if kind == 'notes':
+            self._event(EVENT_DELETED, item_id)
+            self.links = {link for link in self.links if link[1] != item_id}
+        elif kind == 'tags':
+            self.links = {link for link in self.links if link[0] != item_id}
+        elif kind == 'folders':
+            for note in [note for note in self.items['notes'].values() if note['parent_id'] == item_id]:
+                self._delete('notes', note['id'])
+            for folder in [folder for folder in self.items['folders'].values() if folder['parent_id'] == item_id]:
+                self._delete('folders', folder['id'])
+        elif kind == 'resources':
+            self.blobs.pop(item_id, None)
+
+    def _download(self, item, headers):
+        blob = self.blobs.get(item['id'], b'')
+        mime = item.get('mime', 'application/octet-stream')
+        range_header = headers.get('range', '')
+        if self.ranges and range_header.startswith('bytes='):
+            start, _, end = range_header[len('bytes='):].partition('-')
+            start = int(start)
+            end = int(end) if end else len(blob) - 1
+            if start >= len(blob):
+                return 416, (mime, b'', {'content-range': f'bytes */{len(blob)}'})
+            return 206, (mime, blob[start:end + 1], {'content-range': f'bytes {start}-{end}/{len(blob)}'})
+        return 200, (mime, blob, {})
+
+    def _event(self, event_type, note_id):
+        self.events.append({'id': len(self.events) + 1, 'item_type': ITEM_TYPE_NOTE, 'item_id': note_id,
+                            'type': event_type, 'created_time': now(), 'source': 1,
+                            'before_change_item': ''})
+
+    def _get_events(self, params):
+        if 'cursor' not in params:
+            return {'cursor': str(len(self.events))}
+        start = int(params['cursor'] or 0)
+        items = self.events[start:start + self.max_page_size]
+        return {'items': items, 'has_more': start + len(items) < len(self.events),
+                'cursor': str(start + len(items))}
+
+    def _search(self, params):
+        kind = params.get('type', 'note') + 's'
+        words = [word.strip('"*').lower() for word in params.get('query', '').split()]
+        found = [item for item in self.items[kind].values()
+                 if all(word in f'{item.get("title", "")} {item.get("body", "")}'.lower() for word in words)]
+        return self._page(kind, found, params)
+
+    @staticmethod
+    def _parse_multipart(content_type, body):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+        props, blob = {}, b''
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if name == 'props':
+                props = json.loads(part.get_content())
+            elif name == 'data':
+                blob = part.get_payload(decode=True)
+                props.setdefault('mime', part.get_content_type())
+        return props, blob
+
+
+class FakeJoplinTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport answering in-process with a FakeJoplin
+
+    usage:
+        JoplinApi(token, TRANSPORT=FakeJoplinTransport(FakeJoplin()))
+    """
+
+    def __init__(self, server=None):
+        self.server = server if server is not None else FakeJoplin()
+
+    async def handle_async_request(self, request):
+        body = b''.join([chunk async for chunk in request.stream])
+        target = request.url.raw_path.decode()
+        headers = {name.decode().lower(): value.decode() for name, value in request.headers.raw}
+        status, headers, content = await self.server.handle(request.method, target, headers, body)
+        return httpx.Response(status, headers=headers, content=content, request=request)
+
+
+async def serve(server=None, host='127.0.0.1', port=41184):
+    """
+    serve a FakeJoplin over HTTP/1.1 with keep-alive
+
+    :param server: FakeJoplin instance
+    :return: asyncio.Server, already listening
+    """
+    server = server if server is not None else FakeJoplin()
+
+    async def connection(reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode('latin-1').rstrip('\r\n')
+                    if not line:
+                        break
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if headers.get('transfer-encoding', '').lower() == 'chunked':
+                    body = b''
+                    while True:
+                        size = int((await reader.readline()).split(b';')[0], 16)
+                        # the chunk and its trailing CRLF
+                        body += (await reader.readexactly(size + 2))[:-2]
+                        if size == 0:
+                            break
+                else:
+                    body = await reader.readexactly(int(headers.get('content-length', 0)))
+                status, response_headers, content = await server.handle(method, target, headers, body)
+                lines = [f'HTTP/1.1 {status} {httpx.codes.get_reason_phrase(status)}',
+                         f'content-length: {len(content)}']
+                lines += [f'{name}: {value}' for name, value in response_headers.items()]
+                writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + content)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(connection, host, port)
+
+
+def main():
+    """
+    python -m joplin_api.fake_server --notes 10000 --latency 0.002
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='serve a fake Joplin webclipper on localhost')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=41184)
+    parser.add_argument('--token', default='')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before each answer')
+    parser.add_argument('--folders', type=int, default=10)
+    parser.add_argument('--notes', type=int, default=1000)
+    parser.add_argument('--tags', type=int, default=20)
+    parser.add_argument('--body-size', type=int, default=1024, help='bytes of each note body')
+    args = parser.parse_args()
+
+    fake = FakeJoplin(token=args.token, latency=args.latency)
+    fake.populate(args.folders, args.notes, args.tags, args.body_size)
+
+    async def run():
+        server = await serve(fake, args.host, args.port)
+        print(f'fake joplin listening on http://{args.host}:{args.port}')
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+# coding: utf-8
+"""
+    Tree of the folders (notebooks) of a Joplin profile
+
+    The folders are fetched once, then the tree follows the writes done through
+    the api: the parent, the children, the path of a folder and the folder of
+    a path like 'Work/Projects/2026' are answered without any query
+"""
+from .bulk import run_bounded
+
+__all__ = ['FolderTree']
+
+SEPARATOR = '/'
+
+
+class FolderTree:
+    """
+    parent/children index of the folders
+
+    usage:
+        tree = FolderTree(joplin)
+        await tree.build()
+        folder_id = tree.resolve('Work/Projects/2026')
+        notes = await tree.get_subtree_notes(tree.resolve('Work'))
+    """
+
+    def __init__(self, api, concurrency=None):
+        """
+        :param api: JoplinApi instance, the writes done through it update the tree
+        :param concurrency: max number of queries at once, default `BULK_CONCURRENCY` of the api
+        """
+        self.api = api
+        self.concurrency = concurrency or api.bulk_concurrency
+        # folder id -> dict with `id`, `title`, `parent_id`
+        self.folders = {}
+        # parent id ('' for the top level) -> set of folder id
+        self._children = {'': set()}
+        # (parent id, title) -> set of folder id, several folders can have the same title
+        self._titles = {}
+        api.add_listener(self._on_write)
+
+    def close(self):
+        """
+        stop following the writes done through the api
+        """
+        self.api.remove_listener(self._on_write)
+
+    def __len__(self):
+        return len(self.folders)
+
+    def __contains__(self, folder_id):
+        return folder_id in self.folders
+
+    async def build(self):
+        """
+        fetch all the folders
+        """
+        self.folders = {}
+        self._children = {'': set()}
+        self._titles = {}
+        async for folder in self.api.iter_folders('id,title,parent_id'):
+            self.add(folder)
+
+    ############
+    # UPDATES
+    ############
+
+    def add(self, folder):
+        """
+        add this folder to the tree, or update it
+        :param folder: dict with `id`, and `title`, `parent_id` (kept as they were if missing)
+        """
+        previous = self.folders.get(folder['id'])
+        if previous is not None:
+            self._unlink(previous)
+        else:
+            previous = {'title': '', 'parent_id': ''}
+        folder = {'id': folder['id'],
+                  'title': folder.get('title', previous['title']),
+                  'parent_id': folder.get('parent_id', previous['parent_id']) or ''}
+        self.folders[folder['id']] = folder
+        self._children.setdefault(folder['parent_id'], set()).add(folder['id'])
+        self._children.setdefault(folder['id'], set())
+        self._titles.setdefault((folder['parent_id'], folder['title']), set()).add(folder['id'])
+
+    def remove(self, folder_id):
+        """
+        drop this folder and its descendants from the tree
+        """
+        for descendant_id in self.descendants(folder_id, include_self=True):
+            folder = self.folders.pop(descendant_id)
+            self._unlink(folder)
+            self._children.pop(descendant_id, None)
+
+    def _unlink(self, folder):
+        siblings = self._children.get(folder['parent_id'])
+        if siblings is not None:
+            siblings.discard(folder['id'])
+        key = (folder['parent_id'], folder['title'])
+        same_title = self._titles.get(key)
+        if same_title is not None:
+            same_title.discard(folder['id'])
+            if not same_title:
+                del self._titles[key]
+
+    def _on_write(self, method, path, payload, response):
+        """
+        listener of JoplinApi: follow the writes on the folders
+        """
+        parts = path.strip('/').split('/')
+        if parts[0] != 'folders':
+            return
+        if method == 'post' and len(parts) == 1:
+            self.add(response.json())
+        elif method == 'put' and len(parts) == 2 and parts[1] in self.folders:
+            self.add({'id': parts[1], **{key: payload[key] for key in ('title', 'parent_id') if key in payload}})
+        elif method == 'delete' and len(parts) == 2 and parts[1] in self.folders:
+            self.remove(parts[1])
+
+    ############
+    # LOOKUPS
+    ############
+
+    def get(self, folder_id):
+        """
+        :return: dict with `id`, `title`, `parent_id`, None if unknown
+        """
+        return self.folders.get(folder_id)
+
+    def parent(self, folder_id):
+        """
+        :return: id of the parent folder, '' at the top level
+        """
+        return self.folders[folder_id]['parent_id']
+
+    def children(self, folder_id=''):
+        """
+        :param folder_id: id of the folder, '' for the top level
+        :return: list of the id of the sub folders, sorted by title
+        """
+        return sorted(self._children.get(folder_id, ()), key=lambda child_id: self.folders[child_id]['title'])
+
+    def ancestors(self, folder_id):
+        """
+        :return: list of the id of the parents, the closest first
+        """
+        ancestors = []
+        parent_id = self.folders[folder_id]['parent_id']
+        # a parent missing from the tree ends the walk, as a loop would
+        while parent_id in self.folders and parent_id not in ancestors:
+            ancestors.append(parent_id)
+            parent_id = self.folders[parent_id]['parent_id']
+        return ancestors
+
+    def descendants(self, folder_id, include_self=False):
+        """
+        :return: list of the id of the sub folders at any depth, each folder before its own children
+        """
+        found = [folder_id] if include_self else []
+        pending = list(self._children.get(folder_id, ()))
+        while pending:
+            child_id = pending.pop()
+            found.append(child_id)
+            pending.extend(self._children.get(child_id, ()))
+        return found
+
+    def path(self, folder_id):
+        """
+        :return: titles from the top level down to this folder, eg 'Work/Projects/2026'
+        """
+        ids = [folder_id] + self.ancestors(folder_id)
+        return SEPARATOR.join(self.folders[item_id]['title'] for item_id in reversed(ids))
+
+    def resolve(self, path, parent_id=''):
+        """
+        :param path: titles separated by '/', eg 'Work/Projects/2026'
+        :param parent_id: folder the path starts from, the top level by default
+        :return: id of the folder, None if there is none at this path.
+                 When several folders have the same title, the one with the smallest id is used
+        """
+        folder_id = parent_id
+        for title in self._split(path):
+            same_title = self._titles.get((folder_id, title))
+            if not same_title:
+                return None
+            folder_id = min(same_title)
+        return folder_id or None
+
+    @staticmethod
+    def _split(path):
+        return [title.strip() for title in path.split(SEPARATOR) if title.strip()]
+
+    ############
+    # ACTIONS
+    ############
+
+    async def ensure_path(self, path, parent_id=''):
+        """
+        create the folders of this path which do not exist yet
+        :param path: titles separated by '/', eg 'Work/Projects/2026'
+        :param parent_id: folder the path starts from, the top level by default
+        :return: id of the last folder of the path
+        """
+        folder_id = parent_id
+        for title in self._split(path):
+            child_id = self.resolve(title, folder_id)
+            if child_id is None:
+                res = await self.api.create_folder(title, parent_id=folder_id)
+                res.raise_for_status()
+                # the listener has added it to the tree
+                child_id = res.json()['id']
+            folder_id = child_id
+        return folder_id
+
+    async def get_subtree_notes(self, folder_id, fields=None):
+        """
+        get the notes of this folder and of all its sub folders, the folders are listed concurrently
+        :param folder_id: string of the folder id
+        :param fields: fields we want to get, comma separated
+        :return: list of notes (dict)
+        """
+        async def folder_notes(child_id):
+            return [note async for note in self.api.iter_folders_notes(child_id, fields)]
+
+        notes = []
+        for result in await run_bounded(folder_notes, self.descendants(folder_id, include_self=True),
+                                        self.concurrency):
+            if result.error is not None:
+                raise result.error
+            notes.extend(result.response)
+        return notes
+
+    async def move(self, folder_id, parent_id=''):
+        """
+        move a folder, with all its content, into another one
+        :param folder_id: string of the folder id
+        :param parent_id: id of the new parent, '' for the top level
+        :return: res: json result of the put
+        """
+        if parent_id == folder_id or parent_id in self.descendants(folder_id):
+            raise ValueError(f'can not move the folder {folder_id} into itself')
+        return await self.api.update_folder(folder_id, self.folders[folder_id]['title'], parent_id=parent_id)
+
+    async def delete(self, folder_id):
+        """
+        delete a folder and its sub folders, the deepest first, the folders of the same depth concurrently.
+        The deletion stops before the parents of a folder which could not be deleted
+        :param folder_id: string of the folder id
+        :return: list of BulkResult
+        """
+        depths = {}
+        for child_id in self.descendants(folder_id, include_self=True):
+            depths.setdefault(len(self.ancestors(child_id)), []).append(child_id)
+        results = []
+        for depth in sorted(depths, reverse=True):
+            level = await run_bounded(self.api.delete_folder, depths[depth], self.concurrency)
+            results.extend(level)
+            if not all(result.ok for result in level):
+                break
+        return results
@@ -0,0 +1,505 @@
+# coding: utf-8
+"""
+    Full-text index of the notes, to answer the searches locally
+
+    It understands the main parts of the query syntax of Joplin
+    (https://joplinapp.org/help/#searching): words, "exact phrases", prefix*,
+    title: body: tag: notebook: filters, -negation and any:1.
+    It follows the writes done through the api, and `refresh()` catches up
+    with the changes done elsewhere, from the `/events` cursor of Joplin or
+    the `updated_time` of the notes when `/events` is not available
+"""
+from bisect import bisect_left
+from fnmatch import fnmatchcase
+from logging import getLogger
+import math
+import re
+
+import httpx
+
+from .bulk import run_bounded
+
+__all__ = ['SearchIndex']
+
+logger = getLogger("joplin_api.fulltext")
+
+TOKEN_RE = re.compile(r'\w+')
+# [-][field:]("phrase"|word)
+QUERY_RE = re.compile(r'(-?)(?:([a-z]+):)?("[^"]*"?|\S+)')
+
+FIELDS = ('title', 'body')
+# fields of the notes fetched to index them
+NOTE_FIELDS = 'id,title,body,parent_id,updated_time'
+# events.type of the API
+EVENT_DELETED = 3
+# events.item_type of the API
+ITEM_TYPE_NOTE = 1
+# a word found in the title weights more than in the body
+WEIGHTS = {'title': 2.0, 'body': 1.0}
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex:
+    """
+    inverted index of the titles and bodies of the notes, with the positions of the words
+
+    usage:
+        index = SearchIndex(joplin)
+        await index.build()
+        index.search('title:meeting "action items" tag:work')
+    """
+
+    def __init__(self, api=None, concurrency=None):
+        """
+        :param api: JoplinApi instance, the writes done through it update the index
+        :param concurrency: max number of queries at once when building, default `BULK_CONCURRENCY` of the api
+        """
+        self.api = api
+        self.concurrency = concurrency or (api.bulk_concurrency if api is not None else 8)
+        # field -> word -> note id -> set of positions
+        self.postings = {field: {} for field in FIELDS}
+        # field -> note id -> number of words
+        self.lengths = {field: {} for field in FIELDS}
+        # field -> sum of the lengths
+        self.total_lengths = {field: 0 for field in FIELDS}
+        # field -> note id -> set of the words
+        self.words = {field: {} for field in FIELDS}
+        # note id -> {'title', 'parent_id', 'updated_time', 'tags': set of tag id}
+        self.notes = {}
+        # folder id -> (title, parent_id)
+        self.folders = {}
+        # tag id -> title
+        self.tags = {}
+        # tag id -> set of note id, folder id -> set of note id, folder id -> set of the ids of its sub folders
+        self.tag_notes = {}
+        self.folder_notes = {}
+        self.children = {}
+        # cursor of `/events`, None when not available, else the high-water mark of the `updated_time` of the notes
+        self.cursor = None
+        self.updated_time = 0
+        self._vocabulary = {field: None for field in FIELDS}
+        if api is not None:
+            api.add_listener(self._on_write)
+
+    def close(self):
+        """
+        stop following the writes done through the api
+        """
+        if self.api is not None:
+            self.api.remove_listener(self._on_write)
+
+    def __len__(self):
+        return len(self.notes)
+
+    async def build(self):
+        """
+        fetch all the notes, folders and tags and index them
+        """
+        api = self.api
+        for field in FIELDS:
+            self.postings[field], self.lengths[field], self.words[field] = {}, {}, {}
+            self.total_lengths[field] = 0
+            self._vocabulary[field] = None
+        self.notes, self.tag_notes, self.folder_notes = {}, {}, {}
+        # get the cursor first, so nothing done during the build is missed
+        self.cursor = await self._events_cursor()
+        self.updated_time = 0
+        await self._load_folders_tags()
+
+        async def tag_notes(tag_id):
+            return [note['id'] async for note in api.iter_tags_notes(tag_id, 'id')]
+
+        links = {}
+        for result in await run_bounded(tag_notes, list(self.tags), self.concurrency):
+            if result.error is not None:
+                raise result.error
+            for note_id in result.response:
+                links.setdefault(note_id, set()).add(result.item)
+
+        async for note in api.iter_notes(NOTE_FIELDS, prefetch=True):
+            self.add(note, links.get(note['id'], ()))
+
+    async def refresh(self):
+        """
+        index again the notes changed since `build()` or the previous refresh, done through the api or not,
+        drop the deleted ones, and list the folders and tags again
+        :return: set of the ids of the notes indexed again or dropped
+        """
+        await self._load_folders_tags()
+        if self.cursor is not None:
+            changed, deleted = await self._changes_from_events()
+        else:
+            changed, deleted = await self._changes_from_watermark()
+        for note_id in deleted:
+            self.remove(note_id)
+        await self._fetch(changed)
+        return changed | deleted
+
+    async def _events_cursor(self):
+        """
+        :return: the current cursor of `/events`, None when the api does not provide it
+        """
+        try:
+            res = await self.api.get_events()
+        except httpx.HTTPError as e:
+            logger.debug('events unavailable: %s', e)
+            return None
+        if res.status_code != 200:
+            return None
+        try:
+            return res.json().get('cursor')
+        except ValueError:
+            return None
+
+    async def _load_folders_tags(self):
+        self.folders, self.children = {}, {}
+        async for folder in self.api.iter_folders('id,title,parent_id'):
+            self._set_folder(folder['id'], folder['title'], folder.get('parent_id', ''))
+        tags = {tag['id']: tag['title'] async for tag in self.api.iter_tags('id,title')}
+        for tag_id in set(self.tags) - set(tags):
+            self._remove_tag(tag_id)
+        self.tags = tags
+
+    async def _changes_from_events(self):
+        changed, deleted = set(), set()
+        while True:
+            res = await self.api.get_events(self.cursor)
+            res.raise_for_status()
+            data = res.json()
+            for event in data.get('items', []):
+                if event.get('item_type') != ITEM_TYPE_NOTE:
+                    continue
+                if event['type'] == EVENT_DELETED:
+                    changed.discard(event['item_id'])
+                    deleted.add(event['item_id'])
+                else:
+                    deleted.discard(event['item_id'])
+                    changed.add(event['item_id'])
+            self.cursor = data.get('cursor', self.cursor)
+            if not data.get('has_more'):
+                return changed, deleted
+
+    async def _changes_from_watermark(self):
+        changed = set()
+        # the most recently updated notes come first, stop at the high-water mark
+        async for note in self.api.iter_notes('id,updated_time', order_by='updated_time', order_dir='DESC'):
+            if note.get('updated_time', 0) < self.updated_time:
+                break
+            known = self.notes.get(note['id'])
+            # the notes updated at the time of the high-water mark are listed again
+            if known is None or known['updated_time'] != note.get('updated_time', 0):
+                changed.add(note['id'])
+        # the deleted notes are only noticed by their absence
+        remote_ids = {note['id'] async for note in self.api.iter_notes('id')}
+        return changed, set(self.notes) - remote_ids
+
+    async def _fetch(self, note_ids):
+        """
+        index again those notes with their tags, drop the ones which disappeared
+        """
+        api = self.api
+
+        async def fetch(note_id):
+            res = await api.get_note(note_id, NOTE_FIELDS)
+            if res.status_code == 404:
+                return None
+            res.raise_for_status()
+            return res.json(), [tag['id'] async for tag in api.iter_notes_tags(note_id, 'id')]
+
+        for result in await run_bounded(fetch, list(note_ids), self.concurrency):
+            if result.error is not None:
+                if isinstance(result.error, httpx.HTTPStatusError) and result.error.response.status_code == 404:
+                    # deleted since
+                    self.remove(result.item)
+                    continue
+                raise result.error
+            if result.response is None:
+                self.remove(result.item)
+            else:
+                self.add(*result.response)
+
+    ############
+    # UPDATES
+    ############
+
+    def add(self, note, tag_ids=None):
+        """
+        index this note, or index it again if it changed
+        :param note: dict with at least `id`, the missing `title`, `body`, `parent_id` are kept as they were
+        :param tag_ids: iterable of the tag id of the note, kept as they were if None
+        """
+        note_id = note['id']
+        previous = self.notes.get(note_id, {'title': '', 'parent_id': '', 'updated_time': 0, 'tags': set()})
+        for field in FIELDS:
+            if field in note:
+                self._remove_field(field, note_id)
+                self._add_field(field, note_id, note[field] or '')
+        self._unlink_note(note_id)
+        entry = self.notes[note_id] = {'title': note.get('title', previous['title']),
+                                       'parent_id': note.get('parent_id', previous['parent_id']),
+                                       'updated_time': note.get('updated_time', previous['updated_time']),
+                                       'tags': set(tag_ids) if tag_ids is not None else previous['tags']}
+        self.folder_notes.setdefault(entry['parent_id'], set()).add(note_id)
+        for tag_id in entry['tags']:
+            self.tag_notes.setdefault(tag_id, set()).add(note_id)
+        self.updated_time = max(self.updated_time, entry['updated_time'])
+
+    def remove(self, note_id):
+        """
+        drop this note from the index
+        """
+        for field in FIELDS:
+            self._remove_field(field, note_id)
+        self._unlink_note(note_id)
+        self.notes.pop(note_id, None)
+
+    def _unlink_note(self, note_id):
+        """
+        drop the note from the maps of the folders and the tags
+        """
+        note = self.notes.get(note_id)
+        if note is None:
+            return
+        self.folder_notes.get(note['parent_id'], set()).discard(note_id)
+        for tag_id in note['tags']:
+            self.tag_notes.get(tag_id, set()).discard(note_id)
+
+    def _link(self, tag_id, note_id):
+        note = self.notes.get(note_id)
+        if note is not None:
+            note['tags'].add(tag_id)
+            self.tag_notes.setdefault(tag_id, set()).add(note_id)
+
+    def _unlink(self, tag_id, note_id):
+        note = self.notes.get(note_id)
+        if note is not None:
+            note['tags'].discard(tag_id)
+            self.tag_notes.get(tag_id, set()).discard(note_id)
+
+    def _remove_tag(self, tag_id):
+        self.tags.pop(tag_id, None)
+        for note_id in self.tag_notes.pop(tag_id, ()):
+            self.notes[note_id]['tags'].discard(tag_id)
+
+    def _set_folder(self, folder_id, title, parent_id):
+        previous = self.folders.get(folder_id)
+        if previous is not None:
+            self.children.get(previous[1], set()).discard(folder_id)
+        self.folders[folder_id] = (title, parent_id)
+        self.children.setdefault(parent_id, set()).add(folder_id)
+
+    def _remove_folder(self, folder_id):
+        previous = self.folders.pop(folder_id, None)
+        if previous is not None:
+            self.children.get(previous[1], set()).discard(folder_id)
+
+    def _add_field(self, field, note_id, text):
+        postings = self.postings[field]
+        words = tokenize(text)
+        for position, word in enumerate(words):
+            notes = postings.get(word)
+            if notes is None:
+                notes = postings[word] = {}
+                self._vocabulary[field] = None
+            notes.setdefault(note_id, set()).add(position)
+        self.lengths[field][note_id] = len(words)
+        self.total_lengths[field] += len(words)
+        self.words[field][note_id] = set(words)
+
+    def _remove_field(self, field, note_id):
+        length = self.lengths[field].pop(note_id, None)
+        if length is None:
+            return
+        self.total_lengths[field] -= length
+        postings = self.postings[field]
+        for word in self.words[field].pop(note_id):
+            del postings[word][note_id]
+            if not postings[word]:
+                del postings[word]
+                self._vocabulary[field] = None
+
+    def _on_write(self, method, path, payload, response):
+        """
+        listener of JoplinApi: follow the writes on the notes, folders and tags
+        """
+        parts = path.strip('/').split('/')
+        kind = parts[0]
+        if kind == 'notes' and len(parts) <= 2:
+            if method == 'delete':
+                self.remove(parts[1])
+            elif method == 'put' and parts[1] in self.notes:
+                self.add({'id': parts[1], **{key: payload[key] for key in ('title', 'body', 'parent_id')
+                                             if key in payload}})
+            elif method == 'post':
+                note = response.json()
+                self.add(note, self._tag_ids(payload.get('tags', '')))
+        elif kind == 'folders' and len(parts) <= 2:
+            if method == 'delete':
+                self._remove_folder(parts[1])
+            elif method == 'post':
+                folder = response.json()
+                self._set_folder(folder['id'], folder['title'], folder.get('parent_id', ''))
+            elif method == 'put' and parts[1] in self.folders:
+                title, parent_id = self.folders[parts[1]]
+                self._set_folder(parts[1], payload.get('title', title), payload.get('parent_id', parent_id))
+        elif kind == 'tags':
+            self._tag_written(method, parts, payload, response)
+
+    def _tag_written(self, method, parts, payload, response):
+        if len(parts) >= 3 and parts[2] == 'notes':
+            note_id = parts[3] if len(parts) > 3 else payload.get('id')
+            if method == 'post':
+                self._link(parts[1], note_id)
+            elif method == 'delete':
+                self._unlink(parts[1], note_id)
+        elif method == 'delete' and len(parts) == 2:
+            self._remove_tag(parts[1])
+        elif method == 'post':
+            tag = response.json()
+            self.tags[tag['id']] = tag['title']
+        elif method == 'put' and len(parts) == 2:
+            self.tags[parts[1]] = payload.get('title', self.tags.get(parts[1], ''))
+
+    def _tag_ids(self, titles):
+        titles = {title.strip().lower() for title in titles.split(',') if title.strip()}
+        return {tag_id for tag_id, title in self.tags.items() if title.lower() in titles}
+
+    ############
+    # SEARCH
+    ############
+
+    def search(self, query, limit=None):
+        """
+        :param query: string, query with the syntax of joplin
+        :param limit: max number of results
+        :return: list of dict (`id`, `title`, `parent_id`, `score`), the best first
+        """
+        terms = QUERY_RE.findall(query)
+        # any:1 to get the notes matching any of the terms instead of all of them
+        any_term = ('', 'any', '1') in terms
+        scores = None
+        excluded = set()
+        for negative, field, value in terms:
+            if field == 'any':
+                continue
+            matches = self._match(field, value)
+            if matches is None:
+                continue
+            if negative:
+                excluded.update(matches)
+            elif scores is None:
+                scores = dict(matches)
+            elif any_term:
+                for note_id, score in matches.items():
+                    scores[note_id] = scores.get(note_id, 0.0) + score
+            else:
+                scores = {note_id: score + matches[note_id] for note_id, score in scores.items() if note_id in matches}
+        if scores is None:
+            # only negative terms
+            scores = {note_id: 0.0 for note_id in self.notes} if excluded else {}
+        results = sorted(((score, note_id) for note_id, score in scores.items() if note_id not in excluded),
+                         key=lambda result: (-result[0], self.notes[result[1]]['title']))
+        if limit is not None:
+            results = results[:limit]
+        return [{'id': note_id, 'title': self.notes[note_id]['title'],
+                 'parent_id': self.notes[note_id]['parent_id'], 'score': score}
+                for score, note_id in results]
+
+    def _match(self, field, value):
+        """
+        :return: dict note id -> score of the notes matching this term, None if the term is empty
+        """
+        if field == 'tag':
+            tag_ids = self._matching(self.tags.items(), value)
+            return {note_id: 0.0 for tag_id in tag_ids for note_id in self.tag_notes.get(tag_id, ())}
+        if field == 'notebook':
+            titles = ((folder_id, title) for folder_id, (title, _) in self.folders.items())
+            folder_ids = self._descendants(self._matching(titles, value))
+            return {note_id: 0.0 for folder_id in folder_ids for note_id in self.folder_notes.get(folder_id, ())}
+        fields = (field,) if field in FIELDS else FIELDS
+        if field and field not in FIELDS:
+            # not a filter, eg 'http://...'
+            value = f'{field}:{value}'
+        if value.startswith('"'):
+            words = tokenize(value.strip('"'))
+            match = self._match_phrase
+        elif value.endswith('*'):
+            words = tokenize(value[:-1])[-1:]
+            match = self._match_prefix
+        else:
+            words = tokenize(value)
+            match = self._match_phrase if len(words) > 1 else self._match_words
+        if not words:
+            return None
+        scores = {}
+        for name in fields:
+            for note_id, score in match(name, words).items():
+                scores[note_id] = scores.get(note_id, 0.0) + WEIGHTS[name] * score
+        return scores
+
+    @staticmethod
+    def _matching(items, pattern):
+        pattern = pattern.strip('"').lower()
+        return {item_id for item_id, title in items if fnmatchcase(title.lower(), pattern)}
+
+    def _descendants(self, folder_ids):
+        found, pending = set(), list(folder_ids)
+        while pending:
+            folder_id = pending.pop()
+            if folder_id not in found:
+                found.add(folder_id)
+                pending.extend(self.children.get(folder_id, ()))
+        return found
+
+    def _score(self, field, word, positions_by_note):
+        """
+        BM25 score of the word for each note
+        """
+        lengths = self.lengths[field]
+        count = len(lengths) or 1
+        average = (self.total_lengths[field] / count) or 1.0
+        idf = math.log(1 + (count - len(positions_by_note) + 0.5) / (len(positions_by_note) + 0.5))
+        scores = {}
+        for note_id, positions in positions_by_note.items():
+            norm = K1 * (1 - B + B * lengths.get(note_id, 0) / average)
+            scores[note_id] = idf * len(positions) * (K1 + 1) / (len(positions) + norm)
+        return scores
+
+    def _match_words(self, field, words):
+        return self._score(field, words[0], self.postings[field].get(words[0], {}))
+
+    def _match_prefix(self, field, words):
+        vocabulary = self._vocabulary[field]
+        if vocabulary is None:
+            vocabulary = self._vocabulary[field] = sorted(self.postings[field])
+        prefix = words[0]
+        scores = {}
+        for index in range(bisect_left(vocabulary, prefix), len(vocabulary)):
+            word = vocabulary[index]
+            if not word.startswith(prefix):
+                break
+            for note_id, score in self._score(field, word, self.postings[field][word]).items():
+                scores[note_id] = scores.get(note_id, 0.0) + score
+        return scores
+
+    def _match_phrase(self, field, words):
+        postings = [self.postings[field].get(word, {}) for word in words]
+        if not all(postings):
+            return {}
+        scores = {}
+        for note_id in set.intersection(*[set(notes) for notes in postings]):
+            starts = postings[0][note_id]
+            if any(all(start + offset in notes[note_id] for offset, notes in enumerate(postings[1:], 1))
+                   for start in starts):
+                scores[note_id] = 0.0
+        for word, notes in zip(words, postings):
+            for note_id, score in self._score(field, word, notes).items():
+                if note_id in scores:
+                    scores[note_id] += score
+        return scores
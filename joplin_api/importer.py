@@ -0,0 +1,239 @@
+# coding: utf-8
+"""
+    Import of a directory of Markdown files
+
+    The directory becomes a folder, its sub directories sub folders, each .md
+    file a note. The images and attachments the notes link to are uploaded as
+    resources, once each, and the links rewritten to `:/resource_id`.
+
+    The work goes through 4 stages connected by bounded queues, so a huge tree
+    is imported with a flat memory:
+    scan (folders) -> parse (read the files) -> upload (resources) -> create (notes)
+"""
+import asyncio
+import os
+import re
+from urllib.parse import unquote
+
+from .folders import FolderTree
+
+__all__ = ['MarkdownImporter', 'import_markdown']
+
+EXTENSIONS = ('.md', '.markdown')
+# [text](target) and ![alt](target "title"), the target can be between <>
+LINK_RE = re.compile(r'(!?\[[^\]]*\]\()(<[^>\n]+>|[^)\s]+)((?:\s+"[^"]*")?\))')
+# <img src="target">
+IMG_RE = re.compile(r'(<img\s[^>]*?src=")([^"]+)(")', re.IGNORECASE)
+SCHEME_RE = re.compile(r'^[a-z][a-z0-9+.-]*:', re.IGNORECASE)
+
+# end of the stream of a queue
+DONE = None
+
+
+class ParsedNote:
+    __slots__ = ('path', 'parent_id', 'title', 'body', 'attachments')
+
+    def __init__(self, path, parent_id, title, body, attachments):
+        self.path = path
+        self.parent_id = parent_id
+        self.title = title
+        self.body = body
+        # target of the link as written in the body -> absolute path of the file
+        self.attachments = attachments
+
+
+def local_target(target, directory):
+    """
+    :return: absolute path of the file a link points to, None if it is not a local file to upload
+    """
+    target = target.strip('<>')
+    if not target or target.startswith('#') or SCHEME_RE.match(target):
+        return None
+    path = os.path.normpath(os.path.join(directory, unquote(target.split('#')[0].split('?')[0])))
+    if path.lower().endswith(EXTENSIONS) or not os.path.isfile(path):
+        return None
+    return path
+
+
+def parse_file(path, parent_id):
+    """
+    read a markdown file and find the local files it links to, runs in a worker thread
+    :return: ParsedNote
+    """
+    with open(path, encoding='utf-8', errors='replace') as f:
+        body = f.read()
+    directory = os.path.dirname(path)
+    attachments = {}
+    for regex in (LINK_RE, IMG_RE):
+        for match in regex.finditer(body):
+            target = match.group(2)
+            if target not in attachments:
+                local = local_target(target, directory)
+                if local is not None:
+                    attachments[target] = local
+    title = os.path.splitext(os.path.basename(path))[0]
+    return ParsedNote(path, parent_id, title, body, attachments)
+
+
+def rewrite_links(body, resource_ids):
+    """
+    :param resource_ids: dict target of the link -> resource id
+    :return: the body with the links to the uploaded files replaced by `:/resource_id`
+    """
+    def replace(match):
+        resource_id = resource_ids.get(match.group(2))
+        if resource_id is None:
+            return match.group(0)
+        return f'{match.group(1)}:/{resource_id}{match.group(3)}'
+
+    for regex in (LINK_RE, IMG_RE):
+        body = regex.sub(replace, body)
+    return body
+
+
+class MarkdownImporter:
+    """
+    usage:
+        importer = MarkdownImporter(joplin)
+        report = await importer.run('/path/to/notes')
+    """
+
+    def __init__(self, api, parse_workers=4, upload_workers=None, create_workers=None, queue_size=64):
+        """
+        :param api: JoplinApi instance
+        :param parse_workers: number of files read and parsed at once
+        :param upload_workers: number of resources uploaded at once, default `BULK_CONCURRENCY` of the api
+        :param create_workers: number of notes created at once, default `BULK_CONCURRENCY` of the api
+        :param queue_size: max number of items waiting between two stages
+        """
+        self.api = api
+        self.parse_workers = parse_workers
+        self.upload_workers = upload_workers or api.bulk_concurrency
+        self.create_workers = create_workers or api.bulk_concurrency
+        self.queue_size = queue_size
+        # absolute path of a file -> future of its resource id, each file is uploaded once per run
+        self._resources = {}
+        self.report = None
+
+    async def run(self, root, parent_id=''):
+        """
+        import the directory `root` as a folder named as the directory
+        :param root: string, path of the directory
+        :param parent_id: id of the folder where to create it, the top level by default
+        :return: dict with the number of `folders`, `notes`, `resources` created and
+                 `errors` the list of (path, exception) of the files which could not be imported
+        """
+        self.report = {'folders': 0, 'notes': 0, 'resources': 0, 'errors': []}
+        tree = FolderTree(self.api)
+        try:
+            await tree.build()
+            to_parse = asyncio.Queue(self.queue_size)
+            to_upload = asyncio.Queue(self.queue_size)
+            to_create = asyncio.Queue(self.queue_size)
+            # each stage ends the next one even when it fails, so all of them stop before raising
+            results = await asyncio.gather(
+                self._stage(self._scan(tree, os.path.abspath(root), parent_id, to_parse), None, 1, to_parse,
+                            self.parse_workers),
+                self._stage(self._parse, to_parse, self.parse_workers, to_upload, self.upload_workers),
+                self._stage(self._upload, to_upload, self.upload_workers, to_create, self.create_workers),
+                self._stage(self._create, to_create, self.create_workers, None, 0),
+                return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+        finally:
+            tree.close()
+            # the ids are not needed anymore, the importer may be kept for other runs
+            self._resources = {}
+        return self.report
+
+    async def _stage(self, func, source, workers, target, next_workers):
+        """
+        run the workers of a stage, then tell the workers of the next stage there is nothing more
+        :param func: coroutine function taking an item of the source queue and returning the item for the target
+                     queue (None to skip it), or a coroutine producing itself the items (the first stage)
+        """
+        async def worker():
+            while True:
+                item = await source.get()
+                if item is DONE:
+                    return
+                try:
+                    result = await func(item)
+                except Exception as e:
+                    path = item[0] if isinstance(item, tuple) else item.path
+                    self.report['errors'].append((path, e))
+                    continue
+                if result is not None and target is not None:
+                    await target.put(result)
+
+        try:
+            if source is None:
+                await func
+            else:
+                await asyncio.gather(*[worker() for _ in range(workers)])
+        finally:
+            if target is not None:
+                for _ in range(next_workers):
+                    await target.put(DONE)
+
+    async def _scan(self, tree, root, parent_id, to_parse):
+        """
+        walk the directories, create their folders and queue their markdown files
+        """
+        loop = asyncio.get_running_loop()
+        walker = os.walk(root)
+        while True:
+            entry = await loop.run_in_executor(None, next, walker, None)
+            if entry is None:
+                break
+            directory, directories, files = entry
+            directories.sort()
+            files = sorted(name for name in files if name.lower().endswith(EXTENSIONS))
+            if not files and not directories:
+                continue
+            relative = os.path.relpath(directory, os.path.dirname(root))
+            known = len(tree)
+            folder_id = await tree.ensure_path(relative.replace(os.sep, '/'), parent_id)
+            self.report['folders'] += len(tree) - known
+            for name in files:
+                await to_parse.put((os.path.join(directory, name), folder_id))
+
+    async def _parse(self, item):
+        path, folder_id = item
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, parse_file, path, folder_id)
+
+    async def _upload(self, note):
+        resource_ids = {}
+        for target, path in note.attachments.items():
+            future = self._resources.get(path)
+            if future is None:
+                future = self._resources[path] = asyncio.ensure_future(self._upload_file(path))
+            try:
+                resource_ids[target] = await future
+            except Exception as e:
+                # the link is kept as it is
+                self.report['errors'].append((path, e))
+        note.body = rewrite_links(note.body, resource_ids)
+        note.attachments = None
+        return note
+
+    async def _upload_file(self, path):
+        res = await self.api.create_resource(path, title=os.path.basename(path))
+        res.raise_for_status()
+        self.report['resources'] += 1
+        return res.json()['id']
+
+    async def _create(self, note):
+        res = await self.api.create_note(note.title, note.body, note.parent_id)
+        res.raise_for_status()
+        self.report['notes'] += 1
+
+
+async def import_markdown(api, root, parent_id='', **options):
+    """
+    import a directory of markdown files, see MarkdownImporter
+    :return: dict, the report of MarkdownImporter.run
+    """
+    return await MarkdownImporter(api, **options).run(root, parent_id)
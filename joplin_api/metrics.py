@@ -0,0 +1,246 @@
+# coding: utf-8
+"""
+    Instrumentation of the queries to the Joplin API
+
+    Hooks are called at the start and at the end of each request. The
+    MetricsRecorder hook keeps, per method and endpoint template (eg
+    `GET /notes/:id`), a latency histogram, the bytes sent and received,
+    the status codes, the errors and the retries, and hands them to exporters
+"""
+import bisect
+from collections import Counter
+from logging import getLogger
+import time
+
+import httpx
+
+__all__ = ['Exporter', 'Histogram', 'Hook', 'Instrumentation', 'LoggingExporter', 'MetricsRecorder',
+           'RequestEvent', 'endpoint_template']
+
+logger = getLogger("joplin_api.metrics")
+
+# upper bounds of the latency buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+
+def endpoint_template(path):
+    """
+    '/tags/1234/notes/5678' -> '/tags/:id/notes/:id'
+    """
+    parts = path.strip('/').split('/')
+    return '/' + '/'.join(':id' if index % 2 else part for index, part in enumerate(parts))
+
+
+class RequestEvent:
+    """
+    one request to the webclipper
+    """
+    __slots__ = ('method', 'path', 'template', 'start', 'duration', 'status_code',
+                 'bytes_sent', 'bytes_received', 'retries', 'error')
+
+    def __init__(self, method, path):
+        self.method = method.upper()
+        self.path = path
+        self.template = endpoint_template(path)
+        self.start = time.perf_counter()
+        self.duration = None
+        self.status_code = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = 0
+        self.error = None
+
+
+class Hook:
+    """
+    base class of the hooks, override what you need
+    """
+
+    def on_request_start(self, event):
+        pass
+
+    def on_request_end(self, event):
+        pass
+
+
+class Instrumentation:
+    """
+    calls the hooks, does nothing at all when there are none
+    """
+
+    def __init__(self, hooks=None):
+        self.hooks = list(hooks or [])
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+
+    def start(self, method, path):
+        """
+        :return: the RequestEvent, None if there is no hook
+        """
+        if not self.hooks:
+            return None
+        event = RequestEvent(method, path)
+        for hook in self.hooks:
+            hook.on_request_start(event)
+        return event
+
+    def end(self, event, response=None, error=None):
+        """
+        :param event: RequestEvent returned by `start()`, nothing is done if None
+        :param response: httpx.Response, None if the request failed
+        :param error: exception raised by the request
+        """
+        if event is None:
+            return
+        event.duration = time.perf_counter() - event.start
+        event.error = error
+        if response is not None:
+            event.status_code = response.status_code
+            event.bytes_sent = int(response.request.headers.get('content-length', 0))
+            event.bytes_received = response.num_bytes_downloaded
+            if not event.bytes_received:
+                # the responses built in memory (eg httpx.MockTransport) are not downloaded
+                try:
+                    event.bytes_received = len(response.content)
+                except httpx.ResponseNotRead:
+                    pass
+            event.retries = response.extensions.get('retries', 0)
+        for hook in self.hooks:
+            hook.on_request_end(event)
+
+
+class Histogram:
+    """
+    latency histogram with fixed buckets
+    """
+    __slots__ = ('counts', 'count', 'total', 'maximum')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def quantile(self, q):
+        """
+        :return: upper bound of the bucket holding this quantile
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.maximum)
+        return self.maximum
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.total, 'max': self.maximum,
+                'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99),
+                'buckets': {str(bound): count for bound, count in zip(BUCKETS, self.counts) if count}}
+
+
+class EndpointMetrics:
+    __slots__ = ('latency', 'bytes_sent', 'bytes_received', 'statuses', 'errors', 'retries')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.statuses = Counter()
+        self.errors = Counter()
+        self.retries = 0
+
+    def to_dict(self):
+        return {'latency': self.latency.to_dict(), 'bytes_sent': self.bytes_sent,
+                'bytes_received': self.bytes_received, 'statuses': dict(self.statuses),
+                'errors': dict(self.errors), 'retries': self.retries}
+
+
+class Exporter:
+    """
+    receives the snapshots of a MetricsRecorder
+    """
+
+    def export(self, snapshot):
+        raise NotImplementedError
+
+
+class LoggingExporter(Exporter):
+    """
+    logs one line per endpoint
+    """
+
+    def __init__(self, log=None):
+        self.log = log or logger
+
+    def export(self, snapshot):
+        for name, metrics in sorted(snapshot.items()):
+            latency = metrics['latency']
+            self.log.info('%s count=%d p50=%.4fs p99=%.4fs sent=%d received=%d statuses=%s retries=%d',
+                          name, latency['count'], latency['p50'], latency['p99'], metrics['bytes_sent'],
+                          metrics['bytes_received'], metrics['statuses'], metrics['retries'])
+
+
+class MetricsRecorder(Hook):
+    """
+    hook aggregating the requests per method and endpoint template
+
+    usage:
+        metrics = MetricsRecorder(exporters=[LoggingExporter()])
+        joplin = JoplinApi(token, HOOKS=[metrics])
+        ...
+        metrics.export()
+    """
+
+    def __init__(self, exporters=None):
+        """
+        :param exporters: list of Exporter called by `export()`
+        """
+        self.exporters = list(exporters or [])
+        # 'GET /notes/:id' -> EndpointMetrics
+        self.endpoints = {}
+
+    def on_request_end(self, event):
+        name = f'{event.method} {event.template}'
+        metrics = self.endpoints.get(name)
+        if metrics is None:
+            metrics = self.endpoints[name] = EndpointMetrics()
+        metrics.latency.add(event.duration)
+        metrics.bytes_sent += event.bytes_sent
+        metrics.bytes_received += event.bytes_received
+        metrics.retries += event.retries
+        if event.status_code is not None:
+            metrics.statuses[event.status_code] += 1
+        if event.error is not None:
+            metrics.errors[type(event.error).__name__] += 1
+
+    def snapshot(self):
+        """
+        :return: dict of the metrics per endpoint
+        """
+        return {name: metrics.to_dict() for name, metrics in self.endpoints.items()}
+
+    def export(self):
+        """
+        hand a snapshot to each exporter
+        """
+        snapshot = self.snapshot()
+        for exporter in self.exporters:
+            exporter.export(snapshot)
+        return snapshot
+
+    def reset(self):
+        self.endpoints = {}
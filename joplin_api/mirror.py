@@ -0,0 +1,574 @@
+# coding: utf-8
+"""
+    Local mirror of a Joplin profile
+
+    The folders, notes, tags and the links between notes and tags (and on
+    demand the resources) are fetched once, then kept fresh incrementally: the
+    notes and their tags with the `/events` cursor of Joplin (or the
+    `updated_time` of the notes when `/events` is not available), the folders,
+    tags and resources, which have no events, with their `updated_time`, when
+    they are read. With a SQLiteStore, see store.py, a new process starts from
+    what the previous one fetched
+"""
+import asyncio
+import json
+from logging import getLogger
+import os
+import time
+
+import httpx
+
+from .bulk import run_bounded
+
+__all__ = ['JoplinMirror', 'MemoryStore']
+
+logger = getLogger("joplin_api.mirror")
+
+# kind of items of the mirror, named as the endpoints of the API
+KINDS = ('folders', 'notes', 'tags', 'resources')
+
+# events.type of the API
+EVENT_DELETED = 3
+# events.item_type of the API
+ITEM_TYPE_NOTE = 1
+
+
+class MemoryStore:
+    """
+    in-memory storage of the mirror, that can be saved to a json file
+    """
+
+    def __init__(self):
+        self.items = {kind: {} for kind in KINDS}
+        # note id -> set of tag id
+        self.links = {}
+        # cursor, high-water mark ...
+        self.meta = {}
+        # number of changes of the items and the links, the mirror saves the store when it moved
+        self.revision = 0
+
+    def get(self, kind, item_id):
+        return self.items[kind].get(item_id)
+
+    def all(self, kind):
+        return list(self.items[kind].values())
+
+    def ids(self, kind):
+        return set(self.items[kind])
+
+    def put(self, kind, item):
+        self.items[kind][item['id']] = item
+        self.revision += 1
+
+    def remove(self, kind, item_id):
+        self.revision += 1
+        self.items[kind].pop(item_id, None)
+        if kind == 'notes':
+            self.links.pop(item_id, None)
+        elif kind == 'tags':
+            for tag_ids in self.links.values():
+                tag_ids.discard(item_id)
+
+    def replace(self, kind, items):
+        self.items[kind] = {item['id']: item for item in items}
+        self.revision += 1
+
+    def note_tags(self, note_id):
+        return set(self.links.get(note_id, ()))
+
+    def tag_notes(self, tag_id):
+        return {note_id for note_id, tag_ids in self.links.items() if tag_id in tag_ids}
+
+    def link(self, tag_id, note_id):
+        self.links.setdefault(note_id, set()).add(tag_id)
+        self.revision += 1
+
+    def unlink(self, tag_id, note_id):
+        self.links.get(note_id, set()).discard(tag_id)
+        self.revision += 1
+
+    def replace_links(self, links):
+        self.links = links
+        self.revision += 1
+
+    def save(self, path):
+        """
+        write the store to a json file, from a worker thread while the event loop changes the store:
+        the containers are copied first, each copy being done at once
+        :param path: string, name of the file
+        """
+        data = {'items': {kind: dict(items) for kind, items in list(self.items.items())},
+                'links': {note_id: sorted(tag_ids) for note_id, tag_ids in list(self.links.items())},
+                'meta': dict(self.meta)}
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        # never leave a half written file behind
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """
+        read the store from a json file written by `save()`
+        :param path: string, name of the file
+        """
+        with open(path) as f:
+            data = json.load(f)
+        self.items = {kind: data['items'].get(kind, {}) for kind in KINDS}
+        self.links = {note_id: set(tag_ids) for note_id, tag_ids in data['links'].items()}
+        self.meta = data['meta']
+
+
+class JoplinMirror:
+    """
+    serve the reads locally, with data at most `max_staleness` seconds old
+
+    usage:
+        mirror = JoplinMirror(joplin, path='mirror.json')
+        await mirror.start()
+        note = await mirror.get_note(note_id)
+    """
+
+    def __init__(self, api, store=None, max_staleness=5.0, path=None, note_fields=None, concurrency=None,
+                 resources=False, blobs=None, links_max_age=3600.0):
+        """
+        :param api: JoplinApi instance
+        :param store: storage of the mirror, default MemoryStore, or SQLiteStore
+        :param max_staleness: seconds after which a read refreshes the mirror first
+        :param path: file where the store is saved after each refresh, and loaded from at start
+        :param note_fields: fields of the notes to mirror, default `preview_note_props` of the api,
+                            the bodies being fetched when asked for, see `get_note_body()`
+        :param concurrency: max number of queries at once, default `BULK_CONCURRENCY` of the api
+        :param resources: mirror the resources too
+        :param blobs: BlobStore where `get_resource_file` keeps the files of the resources
+        :param links_max_age: seconds after which all the links between notes and tags are listed again,
+                              a tag added by another client to a note not changed otherwise is only seen then
+        """
+        self.api = api
+        self.store = store if store is not None else MemoryStore()
+        self.max_staleness = max_staleness
+        self.path = path
+        self.note_fields = note_fields or api.preview_note_props
+        self.concurrency = concurrency or api.bulk_concurrency
+        self.resources = resources
+        self.blobs = blobs
+        self.links_max_age = links_max_age
+        self.synced_at = None
+        # last revalidation of the folders, tags and resources
+        self.items_synced_at = None
+        # revision of the store last saved
+        self._saved = None
+        self._lock = asyncio.Lock()
+        api.add_listener(self._on_write)
+
+    def close(self):
+        """
+        stop following the writes done through the api
+        """
+        self.api.remove_listener(self._on_write)
+
+    async def start(self):
+        """
+        load the saved store if any and bring it up to date, or seed it from scratch
+        """
+        if self.path and os.path.exists(self.path):
+            self.store.load(self.path)
+            self._saved = getattr(self.store, 'revision', None)
+        if self.store.meta:
+            await self.refresh()
+        else:
+            await self.seed()
+
+    async def seed(self):
+        """
+        fetch the whole profile
+        """
+        async with self._lock:
+            self.store.meta = {}
+            # get the cursor first, so nothing done during the seed is missed
+            self.store.meta['cursor'] = await self._events_cursor()
+            self.store.replace('notes', [note async for note in
+                                         self.api.iter_notes(self.note_fields, prefetch=True)])
+            self._update_watermark(self.store.all('notes'))
+            await self._refresh_folders_tags()
+            if self.resources:
+                resources = [resource async for resource in self.api.iter_resources(self.api.resource_props)]
+                self.store.replace('resources', resources)
+                self._update_watermark(resources, 'resources_time')
+            self.items_synced_at = time.monotonic()
+            await self._synced()
+
+    async def refresh(self):
+        """
+        fetch the notes changed since the previous refresh, and their tags
+        """
+        async with self._lock:
+            if self.store.meta.get('cursor') is not None:
+                changed = await self._refresh_notes_from_events()
+            else:
+                changed = await self._refresh_notes_from_watermark()
+            await self._refresh_notes_tags(changed)
+            await self._synced()
+
+    async def refresh_items(self):
+        """
+        fetch the folders, tags and resources changed since the previous refresh, from their `updated_time`
+        """
+        async with self._lock:
+            if time.time() - self.store.meta.get('links_time', 0) > self.links_max_age:
+                await self._refresh_folders_tags()
+            else:
+                await self._revalidate('folders', self.api.folder_props)
+                changed, _ = await self._revalidate('tags', 'id,title,parent_id,updated_time')
+                await self._refresh_tags_notes(changed)
+            if self.resources:
+                _, removed = await self._revalidate('resources', self.api.resource_props)
+                if self.blobs is not None:
+                    for resource_id in removed:
+                        self.blobs.remove(resource_id)
+            self.items_synced_at = time.monotonic()
+            await self._synced()
+
+    async def ensure_fresh(self):
+        """
+        refresh the mirror when it is older than `max_staleness`
+        """
+        if self._is_fresh(self.synced_at):
+            return
+        if self.synced_at is None and not self.store.meta:
+            await self.start()
+            return
+        if self._lock.locked():
+            # another read is refreshing, wait for it
+            async with self._lock:
+                pass
+            if self._is_fresh(self.synced_at):
+                return
+        await self.refresh()
+
+    async def ensure_items_fresh(self):
+        """
+        refresh the notes, then the folders, tags and resources when they are older than `max_staleness`
+        """
+        await self.ensure_fresh()
+        if self._is_fresh(self.items_synced_at):
+            return
+        if self._lock.locked():
+            async with self._lock:
+                pass
+            if self._is_fresh(self.items_synced_at):
+                return
+        await self.refresh_items()
+
+    def _is_fresh(self, synced_at):
+        return synced_at is not None and time.monotonic() - synced_at <= self.max_staleness
+
+    async def _synced(self):
+        self.synced_at = time.monotonic()
+        revision = getattr(self.store, 'revision', None)
+        if not self.path or (revision is not None and revision == self._saved):
+            # nothing changed since the last save
+            return
+        # the store can be large, do not block the event loop with the disk
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.store.save, self.path)
+        self._saved = revision
+
+    async def _events_cursor(self):
+        """
+        :return: the current cursor of `/events`, None when the api does not provide it
+        """
+        try:
+            res = await self.api.get_events()
+        except Exception as e:
+            logger.debug('events unavailable: %s', e)
+            return None
+        if res.status_code != 200:
+            return None
+        try:
+            return res.json().get('cursor')
+        except ValueError:
+            return None
+
+    def _update_watermark(self, items, key='updated_time'):
+        times = [item.get('updated_time', 0) for item in items]
+        self.store.meta[key] = max(times + [self.store.meta.get(key, 0)])
+
+    async def _fetch_notes(self, note_ids):
+        """
+        fetch those notes and update the store, drop the ones that disappeared
+        """
+        async def get_note(note_id):
+            return await self.api.get_note(note_id, self.note_fields)
+
+        results = await run_bounded(get_note, list(note_ids), self.concurrency)
+        for result in results:
+            if result.error is not None:
+                raise result.error
+            if result.response.status_code == 404:
+                self.store.remove('notes', result.item)
+                continue
+            result.response.raise_for_status()
+            self.store.put('notes', result.response.json())
+
+    async def _refresh_notes_from_events(self):
+        changed, deleted = set(), set()
+        cursor = self.store.meta['cursor']
+        while True:
+            res = await self.api.get_events(cursor)
+            res.raise_for_status()
+            data = res.json()
+            for event in data.get('items', []):
+                if event.get('item_type') != ITEM_TYPE_NOTE:
+                    continue
+                if event['type'] == EVENT_DELETED:
+                    changed.discard(event['item_id'])
+                    deleted.add(event['item_id'])
+                else:
+                    deleted.discard(event['item_id'])
+                    changed.add(event['item_id'])
+            cursor = data.get('cursor', cursor)
+            if not data.get('has_more'):
+                break
+        for note_id in deleted:
+            self.store.remove('notes', note_id)
+        await self._fetch_notes(changed)
+        self.store.meta['cursor'] = cursor
+        return changed
+
+    async def _refresh_notes_from_watermark(self):
+        watermark = self.store.meta.get('updated_time', 0)
+        changed = []
+        # the most recently updated notes come first, stop at the high-water mark
+        async for note in self.api.iter_notes(self.note_fields, order_by='updated_time', order_dir='DESC'):
+            if note.get('updated_time', 0) < watermark:
+                break
+            changed.append(note)
+        for note in changed:
+            self.store.put('notes', note)
+        self._update_watermark(changed)
+        # the deleted notes are only noticed by their absence
+        remote_ids = {note['id'] async for note in self.api.iter_notes('id')}
+        for note_id in self.store.ids('notes') - remote_ids:
+            self.store.remove('notes', note_id)
+        return {note['id'] for note in changed}
+
+    async def _refresh_notes_tags(self, note_ids):
+        """
+        list again the tags of the notes which changed
+        """
+        async def note_tags(note_id):
+            return {tag['id'] async for tag in self.api.iter_notes_tags(note_id, 'id')}
+
+        note_ids = [note_id for note_id in note_ids if self.store.get('notes', note_id) is not None]
+        for result in await run_bounded(note_tags, note_ids, self.concurrency):
+            if result.error is not None:
+                if isinstance(result.error, httpx.HTTPStatusError) and result.error.response.status_code == 404:
+                    # deleted since
+                    continue
+                raise result.error
+            known = self.store.note_tags(result.item)
+            for tag_id in known - result.response:
+                self.store.unlink(tag_id, result.item)
+            for tag_id in result.response - known:
+                self.store.link(tag_id, result.item)
+
+    async def _refresh_tags_notes(self, tag_ids):
+        """
+        list again the notes of the tags which changed
+        """
+        async def tag_notes(tag_id):
+            return {note['id'] async for note in self.api.iter_tags_notes(tag_id, 'id')}
+
+        for result in await run_bounded(tag_notes, list(tag_ids), self.concurrency):
+            if result.error is not None:
+                raise result.error
+            known = self.store.tag_notes(result.item)
+            for note_id in known - result.response:
+                self.store.unlink(result.item, note_id)
+            for note_id in result.response - known:
+                self.store.link(result.item, note_id)
+
+    async def _revalidate(self, kind, fields):
+        """
+        fetch the items of this kind updated since the high-water mark, drop the ones which disappeared
+        :return: (set of the ids of the items changed, set of the ids of the items removed)
+        """
+        key = f'{kind}_time'
+        watermark = self.store.meta.get(key, 0)
+        changed = []
+        iterate = getattr(self.api, f'iter_{kind}')
+        # the most recently updated items come first, stop at the high-water mark
+        async for item in iterate(fields, order_by='updated_time', order_dir='DESC'):
+            if item.get('updated_time', 0) < watermark:
+                break
+            known = self.store.get(kind, item['id'])
+            # the items updated at the time of the high-water mark are listed again
+            if known is None or known.get('updated_time') != item.get('updated_time'):
+                changed.append(item)
+        for item in changed:
+            self.store.put(kind, item)
+        self._update_watermark(changed, key)
+        # the deleted items are only noticed by their absence
+        remote_ids = {item['id'] async for item in iterate('id')}
+        removed = self.store.ids(kind) - remote_ids
+        for item_id in removed:
+            self.store.remove(kind, item_id)
+        return {item['id'] for item in changed}, removed
+
+    async def _refresh_folders_tags(self):
+        folders = [folder async for folder in self.api.iter_folders(self.api.folder_props)]
+        self.store.replace('folders', folders)
+        self._update_watermark(folders, 'folders_time')
+        tags = [tag async for tag in self.api.iter_tags('id,title,parent_id,updated_time')]
+        self.store.replace('tags', tags)
+        self._update_watermark(tags, 'tags_time')
+
+        async def tag_notes(tag_id):
+            return [note['id'] async for note in self.api.iter_tags_notes(tag_id, 'id')]
+
+        links = {}
+        for result in await run_bounded(tag_notes, [tag['id'] for tag in tags], self.concurrency):
+            if result.error is not None:
+                raise result.error
+            for note_id in result.response:
+                links.setdefault(note_id, set()).add(result.item)
+        self.store.replace_links(links)
+        self.store.meta['links_time'] = time.time()
+
+    def _on_write(self, method, path, payload, response):
+        """
+        apply to the mirror the writes done through the api, so they are read back at once
+        """
+        parts = path.strip('/').split('/')
+        kind = parts[0]
+        if kind == 'resources' and method == 'delete' and len(parts) == 2 and self.blobs is not None:
+            self.blobs.remove(parts[1])
+        if kind not in KINDS or (kind == 'resources' and not self.resources):
+            return
+        if kind == 'tags' and len(parts) >= 3 and parts[2] == 'notes':
+            # POST /tags/:id/notes or DELETE /tags/:id/notes/:note_id
+            if method == 'post' and payload.get('id'):
+                self.store.link(parts[1], payload['id'])
+            elif method == 'delete' and len(parts) == 4:
+                self.store.unlink(parts[1], parts[3])
+            return
+        if len(parts) > 2:
+            return
+        if method == 'delete' and len(parts) == 2:
+            self.store.remove(kind, parts[1])
+        elif method == 'post' and len(parts) == 1:
+            try:
+                item = response.json()
+            except ValueError:
+                return
+            if isinstance(item, dict) and 'id' in item:
+                if kind == 'notes':
+                    # only the mirrored fields, not the body of a preview mirror
+                    fields = self.note_fields.split(',')
+                    item = {key: value for key, value in item.items() if key in fields}
+                self.store.put(kind, item)
+        elif method == 'put' and len(parts) == 2:
+            item = self.store.get(kind, parts[1])
+            if item is not None:
+                # only the mirrored fields, not the extra data of the query like 'tags'
+                self.store.put(kind, {**item, **{key: value for key, value in payload.items() if key in item}})
+
+    #########
+    # READS
+    #########
+
+    async def get_note(self, note_id):
+        """
+        :return: the note (dict) or None
+        """
+        await self.ensure_fresh()
+        return self.store.get('notes', note_id)
+
+    async def get_note_body(self, note_id):
+        """
+        :return: the body of the note, fetched from Joplin when the bodies are not mirrored, None if unknown
+        """
+        note = await self.get_note(note_id)
+        if note is not None and 'body' in note:
+            return note['body']
+        res = await self.api.get_note(note_id, 'id,body')
+        if res.status_code == 404:
+            return None
+        res.raise_for_status()
+        return res.json()['body']
+
+    async def get_notes(self):
+        await self.ensure_fresh()
+        return self.store.all('notes')
+
+    async def get_notes_tags(self, note_id):
+        """
+        :return: list of the tags of this note
+        """
+        await self.ensure_items_fresh()
+        tags = (self.store.get('tags', tag_id) for tag_id in self.store.note_tags(note_id))
+        return [tag for tag in tags if tag is not None]
+
+    async def get_folder(self, folder_id):
+        """
+        :return: the folder (dict) or None
+        """
+        await self.ensure_items_fresh()
+        return self.store.get('folders', folder_id)
+
+    async def get_folders(self):
+        await self.ensure_items_fresh()
+        return self.store.all('folders')
+
+    async def get_folders_notes(self, folder_id):
+        """
+        :return: list of the notes of this folder
+        """
+        await self.ensure_fresh()
+        return [note for note in self.store.all('notes') if note.get('parent_id') == folder_id]
+
+    async def get_tag(self, tag_id):
+        """
+        :return: the tag (dict) or None
+        """
+        await self.ensure_items_fresh()
+        return self.store.get('tags', tag_id)
+
+    async def get_tags(self):
+        await self.ensure_items_fresh()
+        return self.store.all('tags')
+
+    async def get_tags_notes(self, tag_id):
+        """
+        :return: list of the notes with this tag
+        """
+        await self.ensure_items_fresh()
+        notes = (self.store.get('notes', note_id) for note_id in self.store.tag_notes(tag_id))
+        return [note for note in notes if note is not None]
+
+    async def get_resource(self, resource_id):
+        """
+        :return: the resource (dict) or None, with `resources=True`
+        """
+        await self.ensure_items_fresh()
+        return self.store.get('resources', resource_id)
+
+    async def get_resources(self):
+        await self.ensure_items_fresh()
+        return self.store.all('resources')
+
+    async def get_resource_file(self, resource_id):
+        """
+        the file of the resource, downloaded once per version to the `blobs` store
+        :return: read-only mmap of the file (bytes when it is empty), None if there is no such resource
+        """
+        if self.blobs is None:
+            raise ValueError('`get_resource_file` requires a BlobStore, see the `blobs` parameter')
+        resource = await self.get_resource(resource_id) if self.resources else None
+        if resource is None:
+            res = await self.api.get_resource(resource_id, 'id,updated_time')
+            if res.status_code == 404:
+                return None
+            res.raise_for_status()
+            resource = res.json()
+        return await self.blobs.fetch(self.api, resource)
@@ -0,0 +1,163 @@
+# coding: utf-8
+"""
+    Compact models of the items of the Joplin API
+
+    Only the fields that have been fetched are set: the models of a listing
+    done with a few fields stay small, and the body of the notes can be
+    loaded later, in batches
+"""
+import asyncio
+
+from .bulk import run_bounded
+
+__all__ = ['Model', 'Note', 'Folder', 'Tag', 'Resource', 'BodyLoader']
+
+PREVIEW_NOTE_FIELDS = ('id', 'title', 'is_todo', 'todo_completed', 'parent_id', 'updated_time',
+                       'user_updated_time', 'user_created_time', 'encryption_applied')
+
+NOTE_FIELDS = ('id', 'parent_id', 'title', 'body', 'created_time', 'updated_time', 'is_conflict',
+               'latitude', 'longitude', 'altitude', 'author', 'source_url', 'is_todo', 'todo_due',
+               'todo_completed', 'source', 'source_application', 'order', 'application_data',
+               'user_created_time', 'user_updated_time', 'encryption_cipher_text', 'encryption_applied')
+
+FOLDER_FIELDS = ('id', 'title', 'created_time', 'updated_time', 'user_created_time', 'user_updated_time',
+                 'encryption_cipher_text', 'encryption_applied', 'parent_id')
+
+TAG_FIELDS = ('id', 'title', 'created_time', 'updated_time', 'user_created_time', 'user_updated_time',
+              'encryption_cipher_text', 'encryption_applied', 'parent_id')
+
+RESOURCE_FIELDS = ('id', 'title', 'mime', 'filename', 'created_time', 'updated_time', 'user_created_time',
+                   'user_updated_time', 'file_extension', 'encryption_cipher_text', 'encryption_applied',
+                   'encryption_blob_encrypted', 'size')
+
+
+class Model:
+    """
+    base of the models, the fields are slots which are only set when fetched
+    """
+    __slots__ = ('_api',)
+    fields = ()
+
+    def __init__(self, api=None, **data):
+        """
+        :param api: JoplinApi instance used to load the missing fields
+        :param data: fields of the item, the unknown ones are ignored
+        """
+        self._api = api
+        for name, value in data.items():
+            if name in self.fields:
+                setattr(self, name, value)
+
+    def __getattr__(self, name):
+        # only called when the slot has not been set
+        if name in self.fields:
+            raise AttributeError(f'{type(self).__name__}.{name} has not been fetched')
+        raise AttributeError(name)
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {getattr(self, "id", "?")} {getattr(self, "title", "")!r}>'
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __hash__(self):
+        # usable in the sets and as keys, the equal models have the same id
+        return hash((type(self), getattr(self, 'id', None)))
+
+    def is_loaded(self, name):
+        """
+        :return: True if this field has been fetched
+        """
+        return hasattr(self, name)
+
+    def to_dict(self):
+        """
+        :return: dict of the fetched fields
+        """
+        return {name: getattr(self, name) for name in self.fields if hasattr(self, name)}
+
+
+class Note(Model):
+    fields = NOTE_FIELDS
+    __slots__ = NOTE_FIELDS
+
+    async def load_body(self):
+        """
+        fetch the body if it has not been fetched yet,
+        the loads requested at the same time are sent together
+        :return: the body
+        """
+        if not hasattr(self, 'body'):
+            self.body = await self._api.body_loader.load(self.id)
+        return self.body
+
+
+class Folder(Model):
+    fields = FOLDER_FIELDS
+    __slots__ = FOLDER_FIELDS
+
+
+class Tag(Model):
+    fields = TAG_FIELDS
+    __slots__ = TAG_FIELDS
+
+
+class Resource(Model):
+    fields = RESOURCE_FIELDS
+    __slots__ = RESOURCE_FIELDS
+
+
+# model of the items of each endpoint
+MODELS = {'notes': Note, 'folders': Folder, 'tags': Tag, 'resources': Resource,
+          'note': Note, 'folder': Folder, 'tag': Tag, 'resource': Resource}
+
+
+class BodyLoader:
+    """
+    gather the bodies requested during the same iteration of the event loop,
+    and fetch them in one batch of concurrent queries: the API has no GET of several notes at once,
+    a batch is one GET per note, at most `concurrency` at a time
+    """
+
+    def __init__(self, api, concurrency=None):
+        """
+        :param api: JoplinApi instance
+        :param concurrency: max number of queries at once, default `BULK_CONCURRENCY` of the api
+        """
+        self.api = api
+        self.concurrency = concurrency or api.bulk_concurrency
+        # note id -> future of the body
+        self._pending = {}
+        self.batches = 0
+
+    def load(self, note_id):
+        """
+        :return: future of the body of the note
+        """
+        future = self._pending.get(note_id)
+        if future is None:
+            loop = asyncio.get_event_loop()
+            if not self._pending:
+                loop.call_soon(self._dispatch)
+            future = self._pending[note_id] = loop.create_future()
+        return future
+
+    def _dispatch(self):
+        pending, self._pending = self._pending, {}
+        self.batches += 1
+        asyncio.ensure_future(self._fetch(pending))
+
+    async def _fetch(self, pending):
+        async def get_body(note_id):
+            res = await self.api.get_note(note_id, fields='id,body')
+            res.raise_for_status()
+            return res.json()['body']
+
+        for result in await run_bounded(get_body, list(pending), self.concurrency):
+            future = pending[result.item]
+            if future.done():
+                continue
+            if result.error is not None:
+                future.set_exception(result.error)
+            else:
+                future.set_result(result.response)
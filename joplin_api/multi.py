@@ -0,0 +1,311 @@
+# coding: utf-8
+"""
+    One client for several Joplin instances
+
+    Each instance (one webclipper, eg one profile per team) has its own pooled
+    JoplinApi. The writes go to one instance, chosen by routing rules; the
+    reads are sent to all the healthy instances at once, and their results
+    merged as they arrive
+"""
+import asyncio
+from collections import OrderedDict
+from logging import getLogger
+import time
+
+import httpx
+
+from .bulk import run_bounded
+from .core import JoplinApi
+
+__all__ = ['JoplinMultiApi']
+
+logger = getLogger("joplin_api.multi")
+
+# end of the items of one instance
+DONE = object()
+
+
+class JoplinMultiApi:
+    """
+    usage:
+        joplin = JoplinMultiApi({'team-a': {'token': 'a', 'JOPLIN_WEBCLIPPER': 41184},
+                                 'team-b': {'token': 'b', 'JOPLIN_WEBCLIPPER': 41185}},
+                                default='team-a', tags={'team-b': 'team-b'})
+        async for instance, note in joplin.iter_search('meeting'):
+            ...
+        await joplin.create_note('title', 'body', folder_id)  # to the instance of the folder
+    """
+
+    def __init__(self, instances, default=None, folders=None, tags=None, rules=None, health_interval=30.0,
+                 queue_size=100, max_owners=100000):
+        """
+        :param instances: dict name -> JoplinApi, or dict of its config with the `token`
+        :param default: name of the instance of the writes no rule routes, the first instance by default
+        :param folders: dict folder id -> name of the instance of the items created in this folder
+        :param tags: dict tag title -> name of the instance of the notes created with this tag
+        :param rules: list of callable(method name, kwargs) -> name of the instance or None, tried first
+        :param health_interval: seconds between two checks of the health of the instances
+        :param queue_size: max number of items waiting to be consumed in the merged reads
+        :param max_owners: number of ids of which the instance is remembered, the least recently used are dropped
+        """
+        self.apis = {}
+        for name, api in instances.items():
+            if not isinstance(api, JoplinApi):
+                config = dict(api)
+                api = JoplinApi(config.pop('token'), **config)
+            self.apis[name] = api
+        if not self.apis:
+            raise ValueError('JoplinMultiApi expects at least one instance')
+        self.default = default or next(iter(self.apis))
+        self.folder_routes = dict(folders or {})
+        self.tag_routes = {title.lower(): name for title, name in (tags or {}).items()}
+        self.rules = list(rules or [])
+        self.health_interval = health_interval
+        self.queue_size = queue_size
+        self.max_owners = max_owners
+        # names of the instances which answered the last ping
+        self.healthy = set(self.apis)
+        # name -> the error of the instance when it was taken out of rotation
+        self.errors = {}
+        self._checked = None
+        # id of a folder, note or tag -> name of its instance, learned from the reads and the writes
+        self.owners = OrderedDict()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        """
+        close the connections of all the instances
+        """
+        await asyncio.gather(*[api.aclose() for api in self.apis.values()])
+
+    def __getitem__(self, name):
+        """
+        :return: the JoplinApi of this instance
+        """
+        return self.apis[name]
+
+    ############
+    # HEALTH
+    ############
+
+    async def check_health(self):
+        """
+        ping all the instances at once, the ones which do not answer are taken out of rotation
+        :return: set of the names of the healthy instances
+        """
+        async def ping(name):
+            return await self.apis[name].ping()
+
+        results = await run_bounded(ping, list(self.apis), len(self.apis))
+        self.healthy = {result.item for result in results if result.error is None}
+        self.errors = {result.item: result.error for result in results if result.error is not None}
+        for name, error in self.errors.items():
+            logger.warning('instance %s out of rotation: %r', name, error)
+        self._checked = time.monotonic()
+        return set(self.healthy)
+
+    async def available(self):
+        """
+        :return: list of the names of the healthy instances, checked again every `health_interval` seconds
+        """
+        if self._checked is None or time.monotonic() - self._checked > self.health_interval:
+            await self.check_health()
+        return [name for name in self.apis if name in self.healthy]
+
+    def _failed(self, name, error):
+        logger.warning('instance %s out of rotation: %r', name, error)
+        self.healthy.discard(name)
+        self.errors[name] = error
+
+    ############
+    # ROUTING
+    ############
+
+    def route(self, method, kwargs, item_id=None):
+        """
+        :param method: name of the JoplinApi method
+        :param kwargs: its parameters
+        :param item_id: id of the item updated or deleted
+        :return: name of the instance the write goes to
+        """
+        instance = kwargs.pop('instance', None)
+        if instance is not None:
+            return instance
+        for rule in self.rules:
+            instance = rule(method, kwargs)
+            if instance is not None:
+                return instance
+        if item_id is not None and item_id in self.owners:
+            self.owners.move_to_end(item_id)
+            return self.owners[item_id]
+        parent_id = kwargs.get('parent_id')
+        if parent_id:
+            if parent_id in self.folder_routes:
+                return self.folder_routes[parent_id]
+            if parent_id in self.owners:
+                self.owners.move_to_end(parent_id)
+                return self.owners[parent_id]
+        for title in (kwargs.get('tags') or '').split(','):
+            if title.strip().lower() in self.tag_routes:
+                return self.tag_routes[title.strip().lower()]
+        return self.default
+
+    async def call(self, method, *args, item_id=None, **kwargs):
+        """
+        run a method of JoplinApi on the instance chosen by the routing
+        :param method: name of the method, eg 'create_note'
+        :param item_id: id of the item written, to send the write to the instance which has it
+        :param kwargs: parameters of the method, and `instance` to choose the instance
+        :return: (name of the instance, result of the method)
+        """
+        name = self.route(method, kwargs, item_id)
+        if name not in await self.available():
+            raise ConnectionError(f'instance {name} is unavailable: {self.errors.get(name)!r}')
+        try:
+            res = await getattr(self.apis[name], method)(*args, **kwargs)
+        except httpx.TransportError as e:
+            self._failed(name, e)
+            raise
+        if isinstance(res, httpx.Response) and res.status_code < 400 and method.startswith('create_'):
+            data = res.json()
+            if isinstance(data, dict) and 'id' in data:
+                self._own(data['id'], name)
+        elif isinstance(res, httpx.Response) and res.status_code < 400 and method.startswith('delete_'):
+            self.owners.pop(item_id, None)
+        return name, res
+
+    def _own(self, item_id, name):
+        """
+        remember the instance of an item
+        """
+        self.owners[item_id] = name
+        self.owners.move_to_end(item_id)
+        while len(self.owners) > self.max_owners:
+            self.owners.popitem(last=False)
+
+    ############
+    # WRITES
+    ############
+
+    async def create_note(self, title, body, parent_id, **kwargs):
+        """
+        :return: (name of the instance, response)
+        """
+        return await self.call('create_note', title, body, parent_id=parent_id, **kwargs)
+
+    async def update_note(self, note_id, title, body, parent_id, **kwargs):
+        return await self.call('update_note', note_id, title, body, parent_id=parent_id, item_id=note_id, **kwargs)
+
+    async def delete_note(self, note_id, instance=None):
+        return await self.call('delete_note', note_id, item_id=note_id, instance=instance)
+
+    async def create_folder(self, folder, **kwargs):
+        return await self.call('create_folder', folder, **kwargs)
+
+    async def update_folder(self, folder_id, title, **kwargs):
+        return await self.call('update_folder', folder_id, title, item_id=folder_id, **kwargs)
+
+    async def delete_folder(self, folder_id, instance=None):
+        return await self.call('delete_folder', folder_id, item_id=folder_id, instance=instance)
+
+    async def create_tag(self, title, **kwargs):
+        return await self.call('create_tag', title, **kwargs)
+
+    ############
+    # READS
+    ############
+
+    async def _fan_out(self, method, *args, **kwargs):
+        """
+        run the async generator `method` of all the healthy instances at once
+        :return: async generator of (name of the instance, item), in the order they arrive
+        """
+        queue = asyncio.Queue(self.queue_size)
+        # name of the instance -> unexpected error which ended its read
+        errors = {}
+
+        async def produce(name):
+            try:
+                async for item in getattr(self.apis[name], method)(*args, **kwargs):
+                    item_id = item.get('id') if isinstance(item, dict) else getattr(item, 'id', None)
+                    if item_id:
+                        self._own(item_id, name)
+                    await queue.put((name, item))
+            except (httpx.HTTPError, ConnectionError) as e:
+                # the results of the other instances are still given
+                self._failed(name, e)
+            except Exception as e:
+                # eg a page which is not JSON: raised by the merged read, not dropped
+                logger.warning('read of instance %s failed: %r', name, e)
+                errors[name] = e
+            finally:
+                await queue.put(DONE)
+
+        tasks = [asyncio.ensure_future(produce(name)) for name in await self.available()]
+        try:
+            remaining = len(tasks)
+            while remaining and not errors:
+                entry = await queue.get()
+                if entry is DONE:
+                    remaining -= 1
+                else:
+                    yield entry
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if errors:
+            raise next(iter(errors.values()))
+
+    def iter_notes(self, fields=None, **params):
+        """
+        :return: async generator of (name of the instance, note) of all the instances
+        """
+        return self._fan_out('iter_notes', fields, **params)
+
+    def iter_folders(self, fields=None, **params):
+        """
+        :return: async generator of (name of the instance, folder) of all the instances
+        """
+        return self._fan_out('iter_folders', fields, **params)
+
+    def iter_tags(self, fields='', **params):
+        """
+        :return: async generator of (name of the instance, tag) of all the instances
+        """
+        return self._fan_out('iter_tags', fields, **params)
+
+    def iter_search(self, query, item_type=None, fields='', **params):
+        """
+        :return: async generator of (name of the instance, item) matching the query in all the instances
+        """
+        return self._fan_out('iter_search', query, item_type, fields, **params)
+
+    async def get_notes(self, fields=None):
+        """
+        :return: list of (name of the instance, note) of all the instances
+        """
+        return [entry async for entry in self.iter_notes(fields)]
+
+    async def get_folders(self, fields=None):
+        """
+        :return: list of (name of the instance, folder) of all the instances
+        """
+        return [entry async for entry in self.iter_folders(fields)]
+
+    async def get_tags(self, fields=''):
+        """
+        :return: list of (name of the instance, tag) of all the instances
+        """
+        return [entry async for entry in self.iter_tags(fields)]
+
+    async def search(self, query, item_type=None, fields=''):
+        """
+        :return: list of (name of the instance, item) matching the query in all the instances
+        """
+        return [entry async for entry in self.iter_search(query, item_type, fields)]
@@ -0,0 +1,102 @@
+# coding: utf-8
+"""
+    multipart/form-data body of the resources uploads, streamed chunk by chunk
+"""
+import asyncio
+import json
+import mimetypes
+import os
+import uuid
+
+__all__ = ['MultipartBody']
+
+
+def is_path(source):
+    return isinstance(source, (str, os.PathLike))
+
+
+class MultipartBody:
+    """
+    the `props` and the `data` parts expected by POST /resources
+
+    the source of the data can be
+    - a path of a file, read off the event loop
+    - bytes, bytearray or memoryview, sent without being copied as a whole
+    - a file object opened in binary mode
+    - an async iterable of bytes
+    """
+
+    def __init__(self, source, filename, props, mime=None, chunk_size=64 * 1024):
+        """
+        :param source: the content of the resource, see above
+        :param filename: string, name of the file given to joplin
+        :param props: dict, properties of the resource
+        :param mime: mime type of the file, guessed from the filename by default
+        :param chunk_size: size of the chunks read from the files
+        """
+        self.source = source
+        self.chunk_size = chunk_size
+        self.boundary = uuid.uuid4().hex
+        mime = mime or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        filename = filename.replace('"', '%22')
+        self.head = (f'--{self.boundary}\r\n'
+                     f'Content-Disposition: form-data; name="props"\r\n\r\n'
+                     f'{json.dumps(props)}\r\n'
+                     f'--{self.boundary}\r\n'
+                     f'Content-Disposition: form-data; name="data"; filename="{filename}"\r\n'
+                     f'Content-Type: {mime}\r\n\r\n').encode()
+        self.tail = f'\r\n--{self.boundary}--\r\n'.encode()
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    @property
+    def headers(self):
+        """
+        :return: dict of the headers of the request, with its length when it is known
+        """
+        headers = {'Content-Type': self.content_type}
+        size = self._source_size()
+        if size is not None:
+            headers['Content-Length'] = str(len(self.head) + size + len(self.tail))
+        return headers
+
+    def _source_size(self):
+        if is_path(self.source):
+            return os.path.getsize(self.source)
+        if isinstance(self.source, (bytes, bytearray)):
+            return len(self.source)
+        if isinstance(self.source, memoryview):
+            return self.source.nbytes
+        return None
+
+    async def __aiter__(self):
+        yield self.head
+        if is_path(self.source):
+            loop = asyncio.get_running_loop()
+            f = await loop.run_in_executor(None, open, self.source, 'rb')
+            try:
+                async for chunk in self._read(f):
+                    yield chunk
+            finally:
+                f.close()
+        elif isinstance(self.source, (bytes, bytearray, memoryview)):
+            view = memoryview(self.source).cast('B')
+            for start in range(0, len(view), self.chunk_size):
+                yield bytes(view[start:start + self.chunk_size])
+        elif hasattr(self.source, 'read'):
+            async for chunk in self._read(self.source):
+                yield chunk
+        else:
+            async for chunk in self.source:
+                yield bytes(chunk)
+        yield self.tail
+
+    async def _read(self, f):
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = await loop.run_in_executor(None, f.read, self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
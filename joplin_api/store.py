@@ -0,0 +1,236 @@
+# coding: utf-8
+"""
+    Persistent storage of the mirror
+
+    `SQLiteStore` keeps the folders, notes, tags, resources and the links
+    between notes and tags in a SQLite file, so a new process starts from what
+    the previous one fetched and only asks Joplin for the changes.
+    `BlobStore` keeps the files of the resources on the disk, read through mmap
+"""
+import asyncio
+import json
+import mmap
+import os
+import sqlite3
+import threading
+
+__all__ = ['BlobStore', 'SQLiteStore']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (kind TEXT NOT NULL, id TEXT NOT NULL, data TEXT NOT NULL,
+                                  PRIMARY KEY (kind, id)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS links (note_id TEXT NOT NULL, tag_id TEXT NOT NULL,
+                                  PRIMARY KEY (note_id, tag_id)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS links_tag ON links (tag_id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+class SQLiteStore:
+    """
+    storage of the mirror in a SQLite file, same interface as MemoryStore
+
+    The changes of a refresh are written in one transaction, committed by `save()`,
+    which the mirror runs in a worker thread: the connection is shared under a lock
+
+    usage:
+        mirror = JoplinMirror(joplin, store=SQLiteStore('joplin.db'), path='joplin.db')
+        await mirror.start()  # only the changes since the previous run are fetched
+    """
+
+    def __init__(self, path):
+        """
+        :param path: string, name of the SQLite file, created if needed
+        """
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        # readers of other processes are not blocked by the writes
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+        # cursor, high-water mark ... written with the items by `save()`
+        self.meta = self._read_meta()
+        # number of changes of the items and the links, the mirror saves the store when it moved
+        self.revision = 0
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+    def _read_meta(self):
+        return {key: json.loads(value) for key, value in self.db.execute('SELECT key, value FROM meta')}
+
+    def _write(self, sql, parameters=()):
+        with self._lock:
+            self.db.execute(sql, parameters)
+            self.revision += 1
+
+    def _select(self, sql, parameters=()):
+        with self._lock:
+            return self.db.execute(sql, parameters).fetchall()
+
+    def get(self, kind, item_id):
+        rows = self._select('SELECT data FROM items WHERE kind = ? AND id = ?', (kind, item_id))
+        return json.loads(rows[0][0]) if rows else None
+
+    def all(self, kind):
+        return [json.loads(data) for data, in self._select('SELECT data FROM items WHERE kind = ?', (kind,))]
+
+    def ids(self, kind):
+        return {item_id for item_id, in self._select('SELECT id FROM items WHERE kind = ?', (kind,))}
+
+    def put(self, kind, item):
+        self._write('INSERT OR REPLACE INTO items (kind, id, data) VALUES (?, ?, ?)',
+                    (kind, item['id'], json.dumps(item)))
+
+    def remove(self, kind, item_id):
+        with self._lock:
+            self._write('DELETE FROM items WHERE kind = ? AND id = ?', (kind, item_id))
+            if kind == 'notes':
+                self._write('DELETE FROM links WHERE note_id = ?', (item_id,))
+            elif kind == 'tags':
+                self._write('DELETE FROM links WHERE tag_id = ?', (item_id,))
+
+    def replace(self, kind, items):
+        with self._lock:
+            self._write('DELETE FROM items WHERE kind = ?', (kind,))
+            self.db.executemany('INSERT OR REPLACE INTO items (kind, id, data) VALUES (?, ?, ?)',
+                                ((kind, item['id'], json.dumps(item)) for item in items))
+
+    def note_tags(self, note_id):
+        return {tag_id for tag_id, in self._select('SELECT tag_id FROM links WHERE note_id = ?', (note_id,))}
+
+    def tag_notes(self, tag_id):
+        return {note_id for note_id, in self._select('SELECT note_id FROM links WHERE tag_id = ?', (tag_id,))}
+
+    def link(self, tag_id, note_id):
+        self._write('INSERT OR IGNORE INTO links (note_id, tag_id) VALUES (?, ?)', (note_id, tag_id))
+
+    def unlink(self, tag_id, note_id):
+        self._write('DELETE FROM links WHERE note_id = ? AND tag_id = ?', (note_id, tag_id))
+
+    def replace_links(self, links):
+        """
+        :param links: dict note id -> set of tag id
+        """
+        with self._lock:
+            self._write('DELETE FROM links')
+            self.db.executemany('INSERT INTO links (note_id, tag_id) VALUES (?, ?)',
+                                ((note_id, tag_id) for note_id, tag_ids in links.items() for tag_id in tag_ids))
+
+    def save(self, path):
+        """
+        commit the changes and the meta at once, and copy the database if `path` is another file
+        :param path: string, name of the file
+        """
+        with self._lock:
+            self.db.execute('DELETE FROM meta')
+            self.db.executemany('INSERT INTO meta (key, value) VALUES (?, ?)',
+                                ((key, json.dumps(value)) for key, value in list(self.meta.items())))
+            self.db.commit()
+        if os.path.abspath(path) != os.path.abspath(self.path):
+            # from another connection, the writes of the event loop are not held back by the copy
+            source = sqlite3.connect(self.path)
+            target = sqlite3.connect(path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+
+    def load(self, path):
+        """
+        read the store from a file written by `save()`, the database itself if `path` is its file
+        :param path: string, name of the file
+        """
+        with self._lock:
+            if os.path.abspath(path) != os.path.abspath(self.path):
+                source = sqlite3.connect(path)
+                try:
+                    source.backup(self.db)
+                finally:
+                    source.close()
+            self.meta = self._read_meta()
+
+
+class BlobStore:
+    """
+    files of the resources on the disk, one file per version of a resource
+
+    usage:
+        blobs = BlobStore('/var/cache/joplin')
+        data = await blobs.fetch(joplin, resource)
+        with data:
+            header = data[:16]
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: string, created if needed
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # path of the file -> task of its download, a version is downloaded once at a time
+        self._inflight = {}
+
+    def path(self, resource):
+        """
+        :param resource: dict with the `id` and `updated_time` of the resource
+        :return: name of the file of this version of the resource
+        """
+        return os.path.join(self.directory, f'{resource["id"]}.{resource.get("updated_time", 0)}')
+
+    def has(self, resource):
+        return os.path.exists(self.path(resource))
+
+    def open(self, resource):
+        """
+        :return: read-only mmap of the file of the resource (bytes when it is empty), None when not stored
+        """
+        try:
+            f = open(self.path(resource), 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            # the map stays valid once the file is closed
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    async def fetch(self, api, resource):
+        """
+        download the resource unless this version is already stored, and drop its older versions
+        :param api: JoplinApi instance
+        :param resource: dict with the `id` and `updated_time` of the resource
+        :return: read-only mmap of the file, see `open()`
+        """
+        path = self.path(resource)
+        if not os.path.exists(path):
+            task = self._inflight.get(path)
+            if task is None:
+                task = asyncio.ensure_future(self._download(api, resource['id'], path))
+                self._inflight[path] = task
+                task.add_done_callback(lambda done: self._inflight.pop(path, None))
+            await asyncio.shield(task)
+        return self.open(resource)
+
+    async def _download(self, api, resource_id, path):
+        # the partial file of this version, if any, is completed
+        part = f'{path}.part'
+        await api.download_resource_to(resource_id, part)
+        os.replace(part, path)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._drop_versions, resource_id, os.path.basename(path))
+
+    def _drop_versions(self, resource_id, keep):
+        for name in os.listdir(self.directory):
+            partial = name.endswith(('.part', '.part.version'))
+            if name.startswith(f'{resource_id}.') and name != keep and not partial:
+                os.remove(os.path.join(self.directory, name))
+
+    def remove(self, resource_id):
+        """
+        drop all the stored versions of the resource
+        """
+        self._drop_versions(resource_id, None)
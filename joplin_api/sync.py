@@ -0,0 +1,157 @@
+# coding: utf-8
+"""
+    Blocking facade of JoplinApi, for the code which is not async
+
+    The queries run on one event loop living in a background thread, shared
+    by all the JoplinSyncApi instances, so the connections are kept alive
+    between the calls, whatever the thread doing them. The thread stops when
+    the last instance is closed
+"""
+import asyncio
+import inspect
+import threading
+
+from .core import JoplinApi
+
+__all__ = ['JoplinSyncApi']
+
+
+class LoopThread:
+    """
+    an event loop running forever in a daemon thread
+    """
+    _shared = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        # number of JoplinSyncApi using it
+        self.users = 0
+        self.thread = threading.Thread(target=self._run, name='joplin-api-loop', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    @classmethod
+    def acquire(cls):
+        """
+        :return: the LoopThread shared by the whole process, started if needed, to `release()` once done
+        """
+        with cls._lock:
+            if cls._shared is None or not cls._shared.thread.is_alive():
+                cls._shared = cls()
+            cls._shared.users += 1
+            return cls._shared
+
+    def release(self):
+        """
+        stop the loop and its thread when nobody uses it anymore
+        """
+        with self._lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+            if LoopThread._shared is self:
+                LoopThread._shared = None
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def run(self, coro, timeout=None):
+        """
+        run the coroutine in the loop and wait for its result
+        :param coro: coroutine
+        :param timeout: seconds to wait, forever if None
+        :return: the result of the coroutine
+        """
+        if threading.current_thread() is self.thread:
+            raise RuntimeError('JoplinSyncApi can not be called from its own event loop')
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            # timeout or KeyboardInterrupt, do not leave the query running
+            future.cancel()
+            raise
+
+
+async def next_item(agen):
+    """
+    :return: (True, next item) or (False, None) at the end of the async generator
+    """
+    try:
+        return True, await agen.__anext__()
+    except StopAsyncIteration:
+        return False, None
+
+
+class JoplinSyncApi:
+    """
+    same methods as JoplinApi, but blocking: the coroutines return their result
+    and the async generators (iter_*) become generators
+
+    usage:
+        with JoplinSyncApi(token='my token') as joplin:
+            res = joplin.get_folders()
+            for note in joplin.iter_notes():
+                ...
+    """
+
+    def __init__(self, token, **config):
+        """
+        :param token: string The API token grabbed from the Joplin config page
+        :param config: dict for configuration, as for JoplinApi, plus
+                       `SYNC_TIMEOUT` the max seconds to wait for each call
+        """
+        self._runner = LoopThread.acquire()
+        self._timeout = config.pop('SYNC_TIMEOUT', None)
+        self._closed = False
+        self.api = JoplinApi(token, **config)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        close the connections of the api, and stop the event loop thread if no other instance uses it
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._runner.run(self.api.aclose(), self._timeout)
+        finally:
+            self._runner.release()
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name == 'api':
+            raise AttributeError(name)
+        attr = getattr(self.api, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if inspect.iscoroutine(result):
+                return self._runner.run(result, self._timeout)
+            if inspect.isasyncgen(result):
+                return self._iterate(result)
+            return result
+        call.__name__ = name
+        call.__doc__ = attr.__doc__
+        return call
+
+    def _iterate(self, agen):
+        try:
+            while True:
+                found, item = self._runner.run(next_item(agen), self._timeout)
+                if not found:
+                    return
+                yield item
+        finally:
+            self._runner.run(agen.aclose(), self._timeout)
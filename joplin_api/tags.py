@@ -0,0 +1,220 @@
+# coding: utf-8
+"""
+    Index of the links between the notes and the tags
+
+    Both directions (the tags of a note, the notes of a tag) are built with
+    one paginated listing per tag, fetched concurrently, instead of one query
+    per note; then the index follows the writes done through the api
+"""
+from .bulk import run_bounded
+
+__all__ = ['TagIndex']
+
+
+class TagIndex:
+    """
+    note <-> tag index
+
+    usage:
+        tags = TagIndex(joplin)
+        await tags.build()
+        tags.note_tags(note_id)
+        await tags.tag_notes_many(tags.resolve('todo'), note_ids)
+    """
+
+    def __init__(self, api, concurrency=None):
+        """
+        :param api: JoplinApi instance, the writes done through it update the index
+        :param concurrency: max number of queries at once, default `BULK_CONCURRENCY` of the api
+        """
+        self.api = api
+        self.concurrency = concurrency or api.bulk_concurrency
+        # tag id -> title
+        self.tags = {}
+        # tag id -> set of note id
+        self.notes_by_tag = {}
+        # note id -> set of tag id
+        self.tags_by_note = {}
+        # True when a write could not be applied (eg a note created with the title of an unknown tag),
+        # `build()` again to be exact
+        self.stale = False
+        api.add_listener(self._on_write)
+
+    def close(self):
+        """
+        stop following the writes done through the api
+        """
+        self.api.remove_listener(self._on_write)
+
+    async def build(self):
+        """
+        fetch the tags, and the notes of each tag concurrently
+        """
+        tags = {tag['id']: tag['title'] async for tag in self.api.iter_tags('id,title')}
+
+        async def tag_notes(tag_id):
+            return {note['id'] async for note in self.api.iter_tags_notes(tag_id, 'id')}
+
+        self.tags = tags
+        self.notes_by_tag = {tag_id: set() for tag_id in tags}
+        self.tags_by_note = {}
+        for result in await run_bounded(tag_notes, list(tags), self.concurrency):
+            if result.error is not None:
+                raise result.error
+            for note_id in result.response:
+                self.link(result.item, note_id)
+        self.stale = False
+
+    ############
+    # LOOKUPS
+    ############
+
+    def note_tags(self, note_id):
+        """
+        :return: set of the id of the tags of this note
+        """
+        return set(self.tags_by_note.get(note_id, ()))
+
+    def tag_notes(self, tag_id):
+        """
+        :return: set of the id of the notes with this tag
+        """
+        return set(self.notes_by_tag.get(tag_id, ()))
+
+    def notes_tags(self, note_ids):
+        """
+        :return: dict note id -> set of tag id, for each of these notes
+        """
+        return {note_id: self.note_tags(note_id) for note_id in note_ids}
+
+    def resolve(self, title):
+        """
+        :return: id of the tag with this title (case insensitive, as joplin), None if there is none
+        """
+        title = title.strip().lower()
+        return next((tag_id for tag_id, tag_title in self.tags.items() if tag_title.lower() == title), None)
+
+    ############
+    # UPDATES
+    ############
+
+    def link(self, tag_id, note_id):
+        self.notes_by_tag.setdefault(tag_id, set()).add(note_id)
+        self.tags_by_note.setdefault(note_id, set()).add(tag_id)
+
+    def unlink(self, tag_id, note_id):
+        self.notes_by_tag.get(tag_id, set()).discard(note_id)
+        tag_ids = self.tags_by_note.get(note_id)
+        if tag_ids is not None:
+            tag_ids.discard(tag_id)
+            if not tag_ids:
+                del self.tags_by_note[note_id]
+
+    def remove_tag(self, tag_id):
+        self.tags.pop(tag_id, None)
+        for note_id in self.notes_by_tag.pop(tag_id, set()):
+            self.unlink(tag_id, note_id)
+
+    def remove_note(self, note_id):
+        for tag_id in self.tags_by_note.pop(note_id, set()):
+            self.notes_by_tag.get(tag_id, set()).discard(note_id)
+
+    def _on_write(self, method, path, payload, response):
+        """
+        listener of JoplinApi: follow the writes on the tags and the links
+        """
+        parts = path.strip('/').split('/')
+        kind = parts[0]
+        if kind == 'tags' and len(parts) >= 3 and parts[2] == 'notes':
+            # POST /tags/:id/notes or DELETE /tags/:id/notes/:note_id
+            if method == 'post' and payload.get('id'):
+                self.link(parts[1], payload['id'])
+            elif method == 'delete' and len(parts) == 4:
+                self.unlink(parts[1], parts[3])
+        elif kind == 'tags' and len(parts) <= 2:
+            if method == 'post':
+                tag = response.json()
+                self.tags[tag['id']] = tag['title']
+                self.notes_by_tag.setdefault(tag['id'], set())
+            elif method == 'put' and len(parts) == 2 and 'title' in payload:
+                self.tags[parts[1]] = payload['title']
+            elif method == 'delete' and len(parts) == 2:
+                self.remove_tag(parts[1])
+        elif kind == 'notes' and len(parts) <= 2:
+            if method == 'delete' and len(parts) == 2:
+                self.remove_note(parts[1])
+            elif method in ('post', 'put') and payload.get('tags'):
+                note_id = parts[1] if len(parts) == 2 else response.json()['id']
+                self._note_tagged(note_id, payload['tags'])
+
+    def _note_tagged(self, note_id, titles):
+        """
+        the tags of the note have been set by their titles
+        """
+        self.remove_note(note_id)
+        for title in titles.split(','):
+            if not title.strip():
+                continue
+            tag_id = self.resolve(title)
+            if tag_id is None:
+                # created by joplin, its id is unknown
+                self.stale = True
+            else:
+                self.link(tag_id, note_id)
+
+    ############
+    # BULK
+    ############
+
+    async def tag_notes_many(self, tag_id, note_ids):
+        """
+        POST /tags/:id/notes
+
+        add the tag to these notes, concurrently, skipping the notes which have it already
+        :param tag_id: string id of the tag
+        :param note_ids: iterable of note id
+        :return: list of BulkResult of the notes which have been tagged
+        """
+        tagged = self.notes_by_tag.get(tag_id, set())
+        note_ids = [note_id for note_id in dict.fromkeys(note_ids) if note_id not in tagged]
+        return await run_bounded(lambda note_id: self.api.create_tags_notes(note_id, tag_id),
+                                 note_ids, self.concurrency)
+
+    async def untag_notes_many(self, tag_id, note_ids=None):
+        """
+        DELETE /tags/:id/notes/:note_id
+
+        remove the tag from these notes, concurrently, skipping the notes which do not have it
+        :param tag_id: string id of the tag
+        :param note_ids: iterable of note id, all the notes with the tag if None
+        :return: list of BulkResult of the notes which have been untagged
+        """
+        tagged = self.notes_by_tag.get(tag_id, set())
+        if note_ids is None:
+            note_ids = list(tagged)
+        else:
+            note_ids = [note_id for note_id in dict.fromkeys(note_ids) if note_id in tagged]
+        return await run_bounded(lambda note_id: self.api.delete_tags_notes(tag_id, note_id),
+                                 note_ids, self.concurrency)
+
+    async def set_notes_tags(self, notes_tags):
+        """
+        give these notes exactly these tags, only the missing links are added
+        and the extra ones removed
+        :param notes_tags: dict note id -> iterable of tag id
+        :return: list of BulkResult, their item is a tuple ('add' or 'remove', tag id, note id)
+        """
+        changes = []
+        for note_id, tag_ids in notes_tags.items():
+            tag_ids = set(tag_ids)
+            current = self.tags_by_note.get(note_id, set())
+            changes += [('add', tag_id, note_id) for tag_id in tag_ids - current]
+            changes += [('remove', tag_id, note_id) for tag_id in current - tag_ids]
+
+        async def apply(change):
+            action, tag_id, note_id = change
+            if action == 'add':
+                return await self.api.create_tags_notes(note_id, tag_id)
+            return await self.api.delete_tags_notes(tag_id, note_id)
+
+        return await run_bounded(apply, changes, self.concurrency)
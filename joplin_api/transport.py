@@ -0,0 +1,167 @@
+# coding: utf-8
+"""
+    httpx transport protecting the Joplin webclipper
+
+    The webclipper is a single Electron process: under load it slows down or
+    resets the connections. This transport retries the idempotent queries with
+    a jittered backoff, enforces an overall deadline per query, and can adapt
+    the number of queries in flight (AIMD on the latency and the errors)
+"""
+import asyncio
+import random
+
+import httpx
+
+__all__ = ['AdaptiveLimiter', 'AdaptiveTransport', 'DeadlineExceeded']
+
+# methods which can be sent again without side effect
+IDEMPOTENT = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+# status of an overloaded or restarting server
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """
+    the query, retries included, took longer than its deadline
+    """
+
+
+class AdaptiveLimiter:
+    """
+    limit of the queries in flight, increased by one per round trip while the
+    latency stays close to the best seen, halved on errors or congestion
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=64, tolerance=2.0, decrease=0.5):
+        """
+        :param initial: limit at start
+        :param minimum: the limit never goes under
+        :param maximum: the limit never goes above
+        :param tolerance: latency / best latency ratio from which the server is considered congested
+        :param decrease: factor applied to the limit on errors or congestion
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.decrease = decrease
+        self.inflight = 0
+        self.best_latency = None
+        self._last_decrease = 0.0
+        self._waiters = []
+
+    async def acquire(self):
+        while self.inflight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # pass the slot we have been woken up for to another waiter
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()
+                raise
+            finally:
+                self._waiters.remove(waiter)
+        self.inflight += 1
+
+    def _wake(self):
+        free = int(self.limit) - self.inflight
+        for waiter in self._waiters[:max(0, free)]:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def release(self, latency, ok):
+        """
+        :param latency: seconds taken by the query
+        :param ok: False if the query failed because of the server
+        """
+        now = asyncio.get_event_loop().time()
+        if ok:
+            # the best latency slowly ages, to follow a server which became slower for good
+            self.best_latency = latency if self.best_latency is None else min(self.best_latency * 1.01, latency)
+        congested = ok and latency > self.tolerance * self.best_latency
+        if (not ok or congested) and now - self._last_decrease > latency:
+            # at most one decrease per round trip, the queries already in flight saw the same congestion
+            self.limit = max(self.minimum, self.limit * self.decrease)
+            self._last_decrease = now
+        elif ok and not congested:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+        self.inflight -= 1
+        self._wake()
+
+
+class AdaptiveTransport(httpx.AsyncBaseTransport):
+    """
+    wraps the transport doing the real work
+    """
+
+    def __init__(self, transport, retries=2, backoff=0.1, max_backoff=5.0, deadline=None, limiter=None):
+        """
+        :param transport: httpx.AsyncBaseTransport sending the requests
+        :param retries: max number of retries of the idempotent queries
+        :param backoff: seconds before the first retry, doubled at each retry (with jitter)
+        :param max_backoff: max seconds between two retries
+        :param deadline: max seconds of a query, retries included
+        :param limiter: AdaptiveLimiter, no limit if None
+        """
+        self.transport = transport
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.limiter = limiter
+        # number of retries done since the start
+        self.retried = 0
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+    def _delay(self, attempt, response=None):
+        if response is not None and response.headers.get('retry-after', '').isdigit():
+            return min(self.max_backoff, float(response.headers['retry-after']))
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def handle_async_request(self, request):
+        loop = asyncio.get_running_loop()
+        end = loop.time() + self.deadline if self.deadline else None
+        retries = self.retries if request.method in IDEMPOTENT else 0
+        attempt = 0
+        while True:
+            remaining = None if end is None else end - loop.time()
+            try:
+                response = await asyncio.wait_for(self._send(request), remaining)
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f'deadline of {self.deadline}s exceeded', request=request)
+            except httpx.TransportError as e:
+                error, response = e, None
+            else:
+                error = None
+                if response.status_code not in RETRY_STATUSES:
+                    response.extensions['retries'] = attempt
+                    return response
+            delay = self._delay(attempt, response)
+            if attempt >= retries or (end is not None and loop.time() + delay >= end):
+                if error is not None:
+                    raise error
+                response.extensions['retries'] = attempt
+                return response
+            if response is not None:
+                await response.aclose()
+            attempt += 1
+            self.retried += 1
+            await asyncio.sleep(delay)
+
+    async def _send(self, request):
+        if self.limiter is None:
+            return await self.transport.handle_async_request(request)
+        loop = asyncio.get_running_loop()
+        await self.limiter.acquire()
+        start = loop.time()
+        ok = False
+        try:
+            response = await self.transport.handle_async_request(request)
+            ok = response.status_code < 500 and response.status_code != 429
+            return response
+        finally:
+            self.limiter.release(loop.time() - start, ok)
@@ -0,0 +1,282 @@
+# coding: utf-8
+"""
+    Stream of the changes of a Joplin profile
+
+    The changes of the notes come from the `/events` cursor of Joplin. The
+    folders, tags and resources have no events: they, and the notes when
+    `/events` is not available, are listed with only their `id` and
+    `updated_time`, and compared with the previous listing.
+
+    One poller is shared by all the consumers. It polls more often while
+    things change and less often when nothing happens, and can checkpoint
+    its cursor to a file to carry on from there after a restart
+"""
+import asyncio
+import json
+from logging import getLogger
+import os
+import threading
+
+import httpx
+
+__all__ = ['ChangeEvent', 'ChangeWatcher', 'CREATED', 'UPDATED', 'DELETED']
+
+logger = getLogger("joplin_api.watch")
+
+CREATED, UPDATED, DELETED = 'created', 'updated', 'deleted'
+# kind of the items -> endpoint
+KINDS = {'note': 'notes', 'folder': 'folders', 'tag': 'tags', 'resource': 'resources'}
+# events.type of the API
+EVENT_TYPES = {1: CREATED, 2: UPDATED, 3: DELETED}
+# events.item_type of the API
+ITEM_TYPE_NOTE = 1
+# end of the stream of a consumer
+STOP = None
+
+
+class ChangeEvent:
+    """
+    a note, folder, tag or resource created, updated or deleted
+    """
+    __slots__ = ('kind', 'type', 'item_id', 'time')
+
+    def __init__(self, kind, type, item_id, time=None):
+        """
+        :param kind: 'note', 'folder', 'tag' or 'resource'
+        :param type: CREATED, UPDATED or DELETED
+        :param item_id: id of the item
+        :param time: time of the change in ms, when known
+        """
+        self.kind = kind
+        self.type = type
+        self.item_id = item_id
+        self.time = time
+
+    def __repr__(self):
+        return f'ChangeEvent({self.kind!r}, {self.type!r}, {self.item_id!r})'
+
+    def __eq__(self, other):
+        if not isinstance(other, ChangeEvent):
+            return NotImplemented
+        return (self.kind, self.type, self.item_id) == (other.kind, other.type, other.item_id)
+
+    def __hash__(self):
+        return hash((self.kind, self.type, self.item_id))
+
+
+class ChangeWatcher:
+    """
+    the poller shared by the consumers of `JoplinApi.watch_changes()`
+    """
+
+    def __init__(self, api, min_interval=1.0, max_interval=30.0, checkpoint=None, queue_size=1000):
+        """
+        :param api: JoplinApi instance
+        :param min_interval: seconds between two polls while things change
+        :param max_interval: seconds between two polls when nothing changes, the interval doubles up to it
+        :param checkpoint: JSON file where the cursor is saved after each poll, and read from at start
+        :param queue_size: max number of changes waiting for each consumer,
+                           the poller waits for the slowest consumer, no change is dropped
+        """
+        self.api = api
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.checkpoint = checkpoint
+        self.queue_size = queue_size
+        self.interval = min_interval
+        # cursor of `/events`, and if `/events` is available (None until known)
+        self.cursor = None
+        self.events_enabled = None
+        # kind -> dict id -> updated_time of the last listing, None when not listed yet
+        self.known = {kind: None for kind in KINDS}
+        # queue of each consumer -> set of the kinds it wants
+        self._consumers = {}
+        self._task = None
+        self._wake = None
+        # set by `close()`, the consumers end once they have all their changes
+        self._closed = False
+        # the poller saves in a worker thread, `close()` in the event loop
+        self._save_lock = threading.Lock()
+        if checkpoint and os.path.exists(checkpoint):
+            self._load()
+        api.add_listener(self._on_write)
+
+    def _load(self):
+        try:
+            with open(self.checkpoint, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning('checkpoint %s ignored: %r', self.checkpoint, e)
+            return
+        self.cursor = data.get('cursor')
+        self.events_enabled = data.get('events_enabled')
+        for kind, known in data.get('known', {}).items():
+            if kind in self.known:
+                self.known[kind] = known
+
+    def save(self):
+        """
+        write the cursor and the last listings to the checkpoint file
+        """
+        if not self.checkpoint:
+            return
+        data = {'cursor': self.cursor, 'events_enabled': self.events_enabled, 'known': self.known}
+        part = self.checkpoint + '.part'
+        with self._save_lock:
+            with open(part, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(part, self.checkpoint)
+
+    async def close(self):
+        """
+        stop the poller, checkpoint, and end the streams of the consumers once they have all their changes
+        """
+        self._closed = True
+        self.api.remove_listener(self._on_write)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.save()
+        for queue in self._consumers:
+            # a full queue is not waited on: its consumer ends when it is empty
+            if not queue.full():
+                queue.put_nowait(STOP)
+
+    def _state(self):
+        return self.cursor, self.events_enabled, dict(self.known)
+
+    def _restore(self, state):
+        self.cursor, self.events_enabled, self.known = state
+
+    async def poll(self, kinds=None):
+        """
+        fetch the changes done since the previous poll, the first poll of a kind only takes its state
+        :param kinds: iterable of 'note', 'folder', 'tag', 'resource', all of them if None
+        :return: list of ChangeEvent
+        """
+        kinds = set(KINDS) if kinds is None else set(kinds)
+        changes = []
+        if 'note' in kinds:
+            if self.events_enabled is not False:
+                changes += await self._poll_events()
+            if self.events_enabled is False:
+                changes += await self._poll_listing('note')
+        for kind in KINDS:
+            if kind != 'note' and kind in kinds:
+                changes += await self._poll_listing(kind)
+        return changes
+
+    async def _poll_events(self):
+        if self.cursor is None:
+            res = await self.api.get_events()
+            if res.status_code == 404:
+                logger.info('/events unavailable, the notes are listed instead')
+                self.events_enabled = False
+                return []
+            res.raise_for_status()
+            self.cursor = res.json().get('cursor')
+            self.events_enabled = self.cursor is not None
+            return []
+        changes = []
+        while True:
+            res = await self.api.get_events(self.cursor)
+            res.raise_for_status()
+            data = res.json()
+            for event in data.get('items', []):
+                if event.get('item_type') == ITEM_TYPE_NOTE and event.get('type') in EVENT_TYPES:
+                    changes.append(ChangeEvent('note', EVENT_TYPES[event['type']], event['item_id'],
+                                               event.get('created_time')))
+            self.cursor = data.get('cursor', self.cursor)
+            if not data.get('has_more'):
+                return changes
+
+    async def _poll_listing(self, kind):
+        items = getattr(self.api, f'iter_{KINDS[kind]}')('id,updated_time')
+        current = {item['id']: item.get('updated_time', 0) async for item in items}
+        known, self.known[kind] = self.known[kind], current
+        if known is None:
+            return []
+        changes = []
+        for item_id, updated_time in current.items():
+            if item_id not in known:
+                changes.append(ChangeEvent(kind, CREATED, item_id, updated_time))
+            elif known[item_id] != updated_time:
+                changes.append(ChangeEvent(kind, UPDATED, item_id, updated_time))
+        changes += [ChangeEvent(kind, DELETED, item_id) for item_id in known.keys() - current.keys()]
+        return changes
+
+    async def subscribe(self, kinds=None):
+        """
+        :param kinds: iterable of 'note', 'folder', 'tag', 'resource', all of them if None
+        :return: async generator of ChangeEvent, the changes done from now on
+        """
+        kinds = set(KINDS) if kinds is None else set(kinds)
+        unknown = kinds - set(KINDS)
+        if unknown:
+            raise ValueError(f'unknown kinds {sorted(unknown)}, expected {list(KINDS)}')
+        if self._closed:
+            return
+        queue = asyncio.Queue(self.queue_size)
+        self._consumers[queue] = kinds
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        try:
+            while True:
+                if self._closed and queue.empty():
+                    return
+                change = await queue.get()
+                if change is STOP:
+                    return
+                yield change
+        finally:
+            del self._consumers[queue]
+            # unblock the poller if it waits for this queue
+            while not queue.empty():
+                queue.get_nowait()
+            if not self._consumers and self._task is not None:
+                self._task.cancel()
+                self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        first = True
+        while self._consumers:
+            wanted = set().union(*self._consumers.values())
+            for kind in KINDS:
+                if kind not in wanted:
+                    # listed again from scratch when a consumer wants it
+                    self.known[kind] = None
+            before = self._state()
+            try:
+                changes = await self.poll(wanted)
+            except (httpx.HTTPError, ValueError) as e:
+                logger.warning('poll of the changes failed: %r', e)
+                changes = []
+            try:
+                for change in changes:
+                    for queue, kinds in list(self._consumers.items()):
+                        if change.kind in kinds and queue in self._consumers:
+                            await queue.put(change)
+            except asyncio.CancelledError:
+                # stopped while waiting for a slow consumer: the checkpoint stays before these changes
+                self._restore(before)
+                raise
+            if changes or first:
+                await loop.run_in_executor(None, self.save)
+                first = False
+            self.interval = self.min_interval if changes else min(self.interval * 2, self.max_interval)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _on_write(self, method, path, payload, response):
+        """
+        listener of JoplinApi: a write done through the api is seen at once
+        """
+        self.interval = self.min_interval
+        if self._wake is not None:
+            self._wake.set()
@@ -0,0 +1,180 @@
+# coding: utf-8
+"""
+    Write-behind of the updates of the notes, folders and tags
+
+    The PUT of an item are kept in memory and merged (the last value of each
+    field wins), then sent on an interval, when too many items are waiting,
+    or on `flush()`. A read of an item first sends its pending update, a
+    listing or a search all of them, so they see them. The delete of an item
+    drops its pending update. The listeners of JoplinApi are called when an
+    update is buffered (response 202), and again when it is sent
+"""
+import asyncio
+from collections import deque
+from logging import getLogger
+
+import httpx
+
+from .bulk import run_bounded
+
+__all__ = ['WriteBehind']
+
+logger = getLogger("joplin_api.writebehind")
+
+KINDS = ('notes', 'folders', 'tags')
+# endpoints of which the GET can return the items updated
+LISTINGS = KINDS + ('search',)
+
+
+class WriteBehind:
+    """
+    buffer of the updates, used by JoplinApi with `WRITE_BEHIND=True`
+    """
+
+    def __init__(self, api, interval=1.0, max_pending=100, on_error=None, max_failures=1000):
+        """
+        :param api: JoplinApi instance
+        :param interval: max seconds an update waits before being sent
+        :param max_pending: number of items waiting from which they are sent at once
+        :param on_error: callable(BulkResult) called for each update which failed,
+                         the failed updates are also kept in `failures`
+        :param max_failures: number of failed updates kept in `failures`, the oldest are dropped
+        """
+        self.api = api
+        self.interval = interval
+        self.max_pending = max_pending
+        self.on_error = on_error
+        # path of the item -> merged payload
+        self.pending = {}
+        # BulkResult of the last updates which failed, item being (path, payload)
+        self.failures = deque(maxlen=max_failures)
+        # number of updates received, of requests sent, and of updates which failed
+        self.received = 0
+        self.sent = 0
+        self.failed = 0
+        self._timer = None
+        # flushes started by the timer, kept until they are done
+        self._tasks = set()
+        # created in the event loop
+        self._lock = None
+
+    @staticmethod
+    def key(path):
+        """
+        :return: '/notes/:id' of an item of the notes, folders or tags, None for the other paths
+        """
+        parts = path.strip('/').split('/')
+        if parts[0] in KINDS and len(parts) >= 2:
+            return f'/{parts[0]}/{parts[1]}'
+        return None
+
+    def stats(self):
+        """
+        :return: dict of the counters
+        """
+        return {'received': self.received, 'sent': self.sent, 'pending': len(self.pending),
+                'failures': self.failed}
+
+    async def put(self, path, payload):
+        """
+        buffer an update
+        :param path: '/notes/:id', '/folders/:id' or '/tags/:id'
+        :param payload: dict of the fields
+        :return: a response 202 with the merged fields of the item
+        """
+        key = self.key(path)
+        merged = self.pending[key] = {**self.pending.get(key, {}), **payload}
+        self.received += 1
+        if len(self.pending) >= self.max_pending:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.interval, self._on_timer)
+        request = httpx.Request('PUT', self.api.JOPLIN_HOST + path)
+        return httpx.Response(202, json={'id': key.rsplit('/', 1)[1], **merged}, request=request)
+
+    def _on_timer(self):
+        self._timer = None
+        task = asyncio.ensure_future(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def before(self, path, method='get'):
+        """
+        send the pending updates a query depends on: the one of its item, all of them before a listing
+        or a search, which can return any item. The delete of an item drops its pending update instead
+        :param path: path of the query
+        :param method: 'get', 'post', 'put' or 'delete'
+        """
+        parts = path.strip('/').split('/')
+        key = self.key(path)
+        # a flush running may be sending it
+        running = self._lock is not None and self._lock.locked()
+        if method == 'get' and len(parts) != 2 and parts[0] in LISTINGS:
+            if self.pending or running:
+                await self.flush()
+        elif key is None:
+            return
+        elif method == 'delete' and len(parts) == 2:
+            await self.discard(key)
+        elif key in self.pending or running:
+            await self.flush([key])
+
+    async def discard(self, key):
+        """
+        drop the pending update of an item, once a flush sending it is done
+        :param key: '/notes/:id', '/folders/:id' or '/tags/:id'
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self.pending.pop(key, None)
+            if not self.pending and self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    async def flush(self, keys=None):
+        """
+        send the pending updates, concurrently, the updates of an item always in the order they have been done
+        :param keys: list of '/notes/:id' ... to send, all of them if None
+        :return: list of BulkResult, item being (path, payload)
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if keys is None:
+                updates, self.pending = list(self.pending.items()), {}
+            else:
+                updates = [(key, self.pending.pop(key)) for key in keys if key in self.pending]
+            if not self.pending and self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not updates:
+                return []
+
+            async def send(update):
+                path, payload = update
+                res = await self.api._query('put', path, '', payload)
+                res.raise_for_status()
+                return res
+
+            results = await run_bounded(send, updates, self.api.bulk_concurrency)
+            self.sent += len(updates)
+        for result in results:
+            if result.error is not None:
+                logger.warning('update of %s failed: %r', result.item[0], result.error)
+                self.failures.append(result)
+                self.failed += 1
+                if self.on_error is not None:
+                    self.on_error(result)
+        return results
+
+    async def close(self):
+        """
+        send what is pending and stop the timer
+        """
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.flush()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
@@ -1,4 +1,6 @@
 import pytest
+from joplin_api import JoplinApi
+from joplin_api.fake_server import FakeJoplin, FakeJoplinTransport
 
 
 @pytest.fixture
@@ -8,3 +10,23 @@ def get_token():
     :return:
     """
     return 'fff6170db0bbb65ff563fc5977d533a0b4a60ce3203b8c6252f500fbf9e37211a056dcc8f7cf6239e8745a90bd62da0ff328fcc6e8162552139e382301520ca8'  # noqa
+
+
+@pytest.fixture
+def fake_joplin():
+    """
+    in-memory stand-in of the webclipper, for the tests which do not need Joplin
+    :return: FakeJoplin
+    """
+    fake = FakeJoplin()
+    fake.populate(folders=3, notes=30, tags=5, body_size=64)
+    return fake
+
+
+@pytest.fixture
+def fake_api(fake_joplin):
+    """
+    JoplinApi answered by the `fake_joplin` fixture
+    :return: JoplinApi
+    """
+    return JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake_joplin), PAGE_SIZE=10)
@@ -0,0 +1,28 @@
+import pytest
+from joplin_api import JoplinApi
+from joplin_api.fake_server import FakeJoplin, FakeJoplinTransport
+
+
+@pytest.mark.asyncio
+async def test_export_import_profile(tmp_path, fake_api, fake_joplin):
+    folder_id = next(iter(fake_joplin.items['folders']))
+    fake_joplin.add('folders', title='child', parent_id=folder_id)
+    blob = bytes(range(256)) * 1000
+    async with fake_api as joplin:
+        resource = (await joplin.create_resource(blob, title='blob', filename='blob.bin')).json()
+        path = str(tmp_path / 'profile.tar')
+        manifest = await joplin.export_profile(path, concurrency=4)
+    assert manifest['counts'] == {'folders': 4, 'tags': 5, 'note_tags': 60, 'notes': 30, 'resources': 1}
+    assert manifest['missing'] == []
+
+    restored = FakeJoplin()
+    async with JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(restored), PAGE_SIZE=10) as joplin:
+        result = await joplin.import_profile(path, concurrency=4)
+    assert result['errors'] == []
+    for kind in ('folders', 'tags', 'notes', 'resources'):
+        assert set(restored.items[kind]) == set(fake_joplin.items[kind])
+    for note_id, note in fake_joplin.items['notes'].items():
+        assert restored.items['notes'][note_id]['body'] == note['body']
+        assert restored.items['notes'][note_id]['parent_id'] == note['parent_id']
+    assert restored.links == fake_joplin.links
+    assert restored.blobs[resource['id']] == blob
@@ -0,0 +1,107 @@
+import pytest
+from joplin_api import JoplinApi, ResponseCache
+from joplin_api.fake_server import FakeJoplinTransport
+
+
+def cache_api(fake, cache=True):
+    return JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake), CACHE=cache)
+
+
+def first(fake, kind):
+    return next(iter(fake.items[kind].values()))
+
+
+@pytest.mark.asyncio
+async def test_cache_hits_and_evictions(fake_joplin):
+    note_ids = list(fake_joplin.items['notes'])
+    async with cache_api(fake_joplin, ResponseCache(max_entries=2)) as joplin:
+        await joplin.get_note(note_ids[0])
+        await joplin.get_note(note_ids[0])
+        assert fake_joplin.requests['GET /notes/:id'] == 1
+        # the same path with other fields is another entry
+        await joplin.get_note(note_ids[0], 'id,title')
+        await joplin.get_note(note_ids[1])
+        assert joplin.cache.stats()['evictions'] == 1
+        # the least recently used was evicted
+        await joplin.get_note(note_ids[0])
+        assert fake_joplin.requests['GET /notes/:id'] == 4
+        stats = joplin.cache.stats()
+        assert (stats['hits'], stats['misses'], stats['entries']) == (1, 4, 2)
+
+    cache = ResponseCache(ttl={'notes': 0})
+    async with cache_api(fake_joplin, cache) as joplin:
+        await joplin.get_note(note_ids[0])
+        await joplin.get_note(note_ids[0])
+        # expired at once
+        assert cache.stats()['evictions'] == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_uncached(fake_joplin):
+    note = first(fake_joplin, 'notes')
+    async with cache_api(fake_joplin) as joplin:
+        res = await joplin.create_resource(b'x' * 1000, title='blob', filename='blob.bin')
+        resource_id = res.json()['id']
+        for _ in range(2):
+            await joplin.search(note['title'])
+            await joplin.download_resources(resource_id)
+            await joplin.ping()
+        assert fake_joplin.requests['GET /search'] == 2
+        assert fake_joplin.requests['GET /resources/:id/file'] == 2
+        assert len(joplin.cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidation_of_the_notes(fake_joplin):
+    folder_ids = list(fake_joplin.items['folders'])
+    note = next(note for note in fake_joplin.items['notes'].values() if note['parent_id'] == folder_ids[0])
+    async with cache_api(fake_joplin) as joplin:
+        async def listings():
+            await joplin.get_note(note['id'])
+            await joplin.get_notes()
+            for folder_id in folder_ids:
+                await joplin.get_folders_notes(folder_id)
+
+        await listings()
+        fake_joplin.requests.clear()
+        await listings()
+        assert fake_joplin.requests == {}
+        # moved to another folder: the note, the listing of all the notes, and of both folders
+        await joplin.update_note(note['id'], note['title'], note['body'], folder_ids[1])
+        fake_joplin.requests.clear()
+        await listings()
+        assert fake_joplin.requests == {'GET /notes/:id': 1, 'GET /notes': 1, 'GET /folders/:id/notes': 2}
+        # the listings of the other folders are kept
+        assert joplin.cache.stats()['hits'] >= 1
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidation_of_the_tags(fake_joplin):
+    note = first(fake_joplin, 'notes')
+    tag_ids = list(fake_joplin.items['tags'])
+    async with cache_api(fake_joplin) as joplin:
+        async def listings():
+            await joplin.get_tags()
+            await joplin.get_notes_tags(note['id'])
+            for tag_id in tag_ids[:2]:
+                await joplin.get_tags_notes(tag_id)
+
+        await listings()
+        fake_joplin.requests.clear()
+        # tag a note: the notes of the tag and the tags of the note
+        await joplin.create_tags_notes(note['id'], tag_ids[0])
+        await listings()
+        assert fake_joplin.requests == {'POST /tags/:id/notes': 1, 'GET /notes/:id/tags': 1,
+                                        'GET /tags/:id/notes': 1}
+        fake_joplin.requests.clear()
+        await joplin.delete_tags_notes(tag_ids[0], note['id'])
+        await listings()
+        assert fake_joplin.requests == {'DELETE /tags/:id/notes/:id': 1, 'GET /notes/:id/tags': 1,
+                                        'GET /tags/:id/notes': 1}
+        fake_joplin.requests.clear()
+        # delete a tag: the tags, and the tags of the notes
+        await joplin.delete_tag(tag_ids[1])
+        await joplin.get_tags()
+        await joplin.get_notes_tags(note['id'])
+        await joplin.get_tags_notes(tag_ids[0])
+        assert fake_joplin.requests == {'DELETE /tags/:id': 1, 'GET /tags': 1, 'GET /notes/:id/tags': 1}
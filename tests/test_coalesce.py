@@ -0,0 +1,45 @@
+import asyncio
+import pytest
+from joplin_api import JoplinApi
+from joplin_api.fake_server import FakeJoplinTransport
+
+
+@pytest.mark.asyncio
+async def test_coalesce_identical_gets(fake_joplin):
+    fake_joplin.latency = 0.05
+    folder_id = next(iter(fake_joplin.items['folders']))
+    async with JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake_joplin), COALESCE=True) as joplin:
+        results = await asyncio.gather(*[joplin.get_folder(folder_id) for _ in range(100)],
+                                       joplin.get_folder(folder_id, fields='id'))
+        assert all(res.status_code == 200 for res in results)
+        assert results[-1].json() == {'id': folder_id}
+        assert fake_joplin.requests['GET /folders/:id'] == 2
+        assert joplin.coalescer.stats() == {'sent': 2, 'saved': 99, 'inflight': 0}
+
+
+@pytest.mark.asyncio
+async def test_coalesce_after_write(fake_joplin):
+    fake_joplin.latency = 0.05
+    folder_id = next(iter(fake_joplin.items['folders']))
+    async with JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake_joplin), COALESCE=True) as joplin:
+        async def rename_then_get():
+            await asyncio.sleep(0.01)
+            await joplin.update_folder(folder_id, 'renamed')
+            return await joplin.get_folder(folder_id, 'title')
+
+        before, after = await asyncio.gather(joplin.get_folder(folder_id, 'title'), rename_then_get())
+        # the query sent after the write does not join the one sent before
+        assert after.json() == {'title': 'renamed'}
+        assert fake_joplin.requests['GET /folders/:id'] == 2
+
+
+@pytest.mark.asyncio
+async def test_coalesce_cancelled_caller(fake_joplin):
+    fake_joplin.latency = 0.05
+    folder_id = next(iter(fake_joplin.items['folders']))
+    async with JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake_joplin), COALESCE=True) as joplin:
+        first = asyncio.ensure_future(joplin.get_folder(folder_id))
+        second = asyncio.ensure_future(joplin.get_folder(folder_id))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert (await second).status_code == 200
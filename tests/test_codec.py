@@ -0,0 +1,73 @@
+import httpx
+import json
+import pytest
+from joplin_api import JoplinApi
+from joplin_api.codec import JsonCodec, get_codec
+from joplin_api.fake_server import FakeJoplin, FakeJoplinTransport
+
+
+def test_get_codec():
+    assert isinstance(get_codec(), JsonCodec)
+    assert get_codec('auto').name in ('orjson', 'msgspec', 'json')
+    with pytest.raises(ValueError):
+        get_codec('yaml')
+    data = {'title': 'été ☀', 'body': 'x' * 1000, 'is_todo': 1}
+    assert json.loads(JsonCodec().dumps(data)) == data
+
+
+async def check_queries(fake_joplin, codec):
+    folder_id = next(iter(fake_joplin.items['folders']))
+    async with JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake_joplin), CODEC=codec) as joplin:
+        res = await joplin.create_note('été', 'body ☀', folder_id)
+        note_id = res.json()['id']
+        await joplin.update_note(note_id, 'hiver', 'body ❄', folder_id)
+        res = await joplin.get_note(note_id)
+        assert res.json()['title'] == 'hiver' and res.json()['body'] == 'body ❄'
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('codec', ['json', 'auto'])
+async def test_codec_queries(fake_joplin, codec):
+    await check_queries(fake_joplin, codec)
+
+
+@pytest.mark.asyncio
+async def test_query_raw_forward(fake_joplin):
+    other = FakeJoplin()
+    note_id = next(iter(fake_joplin.items['notes']))
+    async with JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake_joplin)) as source, \
+            JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(other), CACHE=True) as target:
+        content = await source.query_raw('get', f'/notes/{note_id}', 'id,title,body')
+        assert isinstance(content, bytes)
+        # forwarded without being decoded
+        created = json.loads(await target.query_raw('post', '/notes/', content=content))
+        assert created['id'] == note_id
+        assert other.items['notes'][note_id]['body'] == fake_joplin.items['notes'][note_id]['body']
+        await target.get_note(note_id)
+        await target.query_raw('put', f'/notes/{note_id}', content=b'{"title":"forwarded"}')
+        # the listeners, here the cache, see the raw writes
+        assert (await target.get_note(note_id)).json()['title'] == 'forwarded'
+        with pytest.raises(httpx.HTTPStatusError):
+            await source.query_raw('get', '/notes/unknown')
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('name', ['orjson', 'msgspec'])
+async def test_optional_codecs(fake_joplin, name):
+    pytest.importorskip(name)
+    codec = get_codec(name)
+    assert codec.name == name
+    data = {'title': 'été ☀', 'body': 'x' * 1000, 'is_todo': 1}
+    assert codec.loads(codec.dumps(data)) == data
+    await check_queries(fake_joplin, name)
+
+
+@pytest.mark.asyncio
+async def test_query_raw_not_decoded(fake_joplin):
+    note_id = next(iter(fake_joplin.items['notes']))
+    async with JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake_joplin), DELTA_UPDATES=True) as joplin:
+        await joplin.query_raw('get', f'/notes/{note_id}', 'id,title,body')
+        # not decoded to be kept as the baseline of the note
+        assert len(joplin.baselines) == 0
+        await joplin.get_note(note_id, 'id,title,body')
+        assert len(joplin.baselines) == 1
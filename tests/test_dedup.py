@@ -0,0 +1,55 @@
+import asyncio
+import io
+import pytest
+from joplin_api import JoplinApi
+from joplin_api.fake_server import FakeJoplinTransport
+
+
+def dedup_api(fake, **config):
+    return JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake), DEDUP_RESOURCES=True, **config)
+
+
+@pytest.mark.asyncio
+async def test_dedup_uploads(tmp_path, fake_joplin):
+    logo = tmp_path / 'logo.png'
+    logo.write_bytes(b'\x89PNG logo' * 1000)
+    async with dedup_api(fake_joplin) as joplin:
+        results = await asyncio.gather(*[joplin.create_resource(str(logo), title=f'logo {i}') for i in range(10)])
+        resource_id = results[0].json()['id']
+        assert {res.json()['id'] for res in results} == {resource_id}
+        # the same content given as bytes or as a file object
+        res = await joplin.create_resource(logo.read_bytes(), title='bytes')
+        assert res.json()['id'] == resource_id
+        f = io.BytesIO(logo.read_bytes())
+        res = await joplin.create_resource(f, title='file object')
+        assert res.json()['id'] == resource_id and f.tell() == 0
+        res = await joplin.create_resource(b'another', title='other')
+        assert res.json()['id'] != resource_id
+        assert len(fake_joplin.blobs) == 2
+        assert joplin.dedup.stats()['uploaded'] == 2 and joplin.dedup.stats()['reused'] == 11
+        # a deleted resource is uploaded again
+        await joplin.delete_resources(resource_id)
+        res = await joplin.create_resource(str(logo), title='logo')
+        assert res.json()['id'] != resource_id and len(fake_joplin.blobs) == 2
+
+
+@pytest.mark.asyncio
+async def test_dedup_existing_and_persisted(tmp_path, fake_joplin):
+    index = str(tmp_path / 'index.json')
+    existing = fake_joplin.add('resources', title='avatar', size=6)
+    fake_joplin.blobs[existing['id']] = b'avatar'
+    other = fake_joplin.add('resources', title='same size', size=6)
+    fake_joplin.blobs[other['id']] = b'other!'
+    async with dedup_api(fake_joplin, DEDUP_INDEX=index) as joplin:
+        res = await joplin.create_resource(b'avatar', title='avatar again')
+        assert res.json()['id'] == existing['id']
+        assert len(fake_joplin.blobs) == 2
+    assert fake_joplin.requests['GET /resources/:id/file'] == 1
+    # the digest of the avatar comes from the index of the previous run
+    async with dedup_api(fake_joplin, DEDUP_INDEX=index) as joplin:
+        res = await joplin.create_resource(b'avatar', title='avatar')
+        assert res.json()['id'] == existing['id']
+        assert fake_joplin.requests['GET /resources/:id/file'] == 1
+        res = await joplin.create_resource(b'other!', title='other')
+        assert res.json()['id'] == other['id']
+    assert len(fake_joplin.blobs) == 2
@@ -0,0 +1,84 @@
+import pytest
+from joplin_api import JoplinApi
+from joplin_api.delta import NoteBaselines
+from joplin_api.fake_server import FakeJoplinTransport
+
+
+@pytest.mark.asyncio
+async def test_delta_updates(fake_joplin):
+    note_id, note = next(iter(fake_joplin.items['notes'].items()))
+    note['author'] = 'someone'
+    body = 'long body ' * 100000
+    async with JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake_joplin), DELTA_UPDATES=True) as joplin:
+        await joplin.update_note(note_id, 'title', body, note['parent_id'])
+        assert fake_joplin.requests['PUT /notes/:id'] == 1
+        # nothing changed: no request
+        res = await joplin.update_note(note_id, 'title', body, note['parent_id'])
+        assert res.status_code == 200 and res.json() == {'id': note_id}
+        assert fake_joplin.requests['PUT /notes/:id'] == 1
+        # only the title is sent, and the author is not reset
+        await joplin.update_note(note_id, 'new title', body, note['parent_id'])
+        assert fake_joplin.requests['PUT /notes/:id'] == 2
+        assert fake_joplin.items['notes'][note_id]['title'] == 'new title'
+        assert fake_joplin.items['notes'][note_id]['author'] == 'someone'
+        stats = joplin.baselines.stats()
+        assert stats['skipped'] == 1
+        assert stats['chars_saved'] >= 2 * len(body)
+
+
+@pytest.mark.asyncio
+async def test_delta_baseline_from_reads(fake_joplin):
+    async with JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake_joplin), DELTA_UPDATES=True) as joplin:
+        notes = [note async for note in joplin.iter_notes('id,title,body,parent_id,updated_time')]
+        for note in notes:
+            await joplin.update_note(note['id'], note['title'], note['body'], note['parent_id'])
+        assert 'PUT /notes/:id' not in fake_joplin.requests
+        assert joplin.baselines.stats()['skipped'] == len(notes)
+        # a baseline without the body: the body is sent
+        fresh = JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake_joplin), DELTA_UPDATES=True)
+        await fresh.get_note(notes[0]['id'], 'id,title,updated_time')
+        await fresh.update_note(notes[0]['id'], notes[0]['title'], 'changed', notes[0]['parent_id'])
+        assert fake_joplin.items['notes'][notes[0]['id']]['body'] == 'changed'
+        await fresh.aclose()
+
+
+@pytest.mark.asyncio
+async def test_delta_baseline_without_updated_time(fake_joplin):
+    note_id, note = next(iter(fake_joplin.items['notes'].items()))
+    async with JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake_joplin), DELTA_UPDATES=True) as joplin:
+        known = (await joplin.get_note(note_id, 'id,title,body,parent_id')).json()
+        # another client changes the note, the baseline cannot tell
+        fake_joplin._update('notes', fake_joplin.items['notes'][note_id], {'title': 'other', 'body': 'other'})
+        await joplin.update_note(note_id, known['title'], known['body'], known['parent_id'])
+        assert fake_joplin.requests['PUT /notes/:id'] == 1
+        assert fake_joplin.items['notes'][note_id]['title'] == known['title']
+        assert fake_joplin.items['notes'][note_id]['body'] == known['body']
+        assert joplin.baselines.stats()['unversioned'] == 1
+        # the version written knows its updated_time
+        await joplin.update_note(note_id, known['title'], known['body'], known['parent_id'])
+        assert fake_joplin.requests['PUT /notes/:id'] == 1
+
+
+@pytest.mark.asyncio
+async def test_delta_note_changed_elsewhere(fake_joplin):
+    note_id, note = next(iter(fake_joplin.items['notes'].items()))
+    async with JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake_joplin), DELTA_UPDATES=True) as joplin:
+        await joplin.update_note(note_id, 'title', 'body', note['parent_id'])
+        # another client changes the note
+        fake_joplin._update('notes', fake_joplin.items['notes'][note_id], {'title': 'other', 'body': 'other'})
+        # the known version is stale: the update is sent, whole
+        await joplin.update_note(note_id, 'title', 'body', note['parent_id'])
+        assert fake_joplin.requests['PUT /notes/:id'] == 2
+        assert fake_joplin.items['notes'][note_id]['title'] == 'title'
+        assert fake_joplin.items['notes'][note_id]['body'] == 'body'
+        assert joplin.baselines.stats()['stale'] == 1
+        # the version written is known again
+        await joplin.update_note(note_id, 'title', 'body', note['parent_id'])
+        assert fake_joplin.requests['PUT /notes/:id'] == 2
+
+
+def test_delta_ttl():
+    baselines = NoteBaselines(ttl=0.0)
+    baselines.record('a', {'title': 'title'})
+    assert baselines.changes('a', {'title': 'title'}) == {'title': 'title'}
+    assert NoteBaselines().ttl == 300.0
@@ -0,0 +1,100 @@
+import asyncio
+import os
+import pytest
+from joplin_api import JoplinApi
+from joplin_api.fake_server import FakeJoplin, FakeJoplinTransport, serve
+
+
+@pytest.mark.asyncio
+async def test_fake_crud(fake_api, fake_joplin):
+    async with fake_api as joplin:
+        folder = (await joplin.create_folder('fake')).json()
+        res = await joplin.create_note('title', 'body', folder['id'], tags='one,two')
+        assert res.status_code == 200
+        note_id = res.json()['id']
+        assert (await joplin.get_note(note_id, 'id,title,body')).json() == {'id': note_id, 'title': 'title',
+                                                                            'body': 'body'}
+        tags = [tag['title'] async for tag in joplin.iter_notes_tags(note_id, 'id,title')]
+        assert sorted(tags) == ['one', 'two']
+        res = await joplin.update_note(note_id, 'new title', 'body', folder['id'])
+        assert res.json()['title'] == 'new title'
+        assert (await joplin.delete_note(note_id)).status_code == 200
+        assert (await joplin.get_note(note_id)).status_code == 404
+    assert fake_joplin.requests['DELETE /notes/:id'] == 1
+
+
+@pytest.mark.asyncio
+async def test_fake_pagination(fake_api, fake_joplin):
+    async with fake_api as joplin:
+        ids = [note['id'] async for note in joplin.iter_notes('id', prefetch=True)]
+    assert sorted(ids) == sorted(fake_joplin.items['notes'])
+    # PAGE_SIZE is 10
+    assert fake_joplin.requests['GET /notes'] == 3
+
+
+@pytest.mark.asyncio
+async def test_fake_resource(fake_api, fake_joplin):
+    content = bytes(range(256)) * 100
+    async with fake_api as joplin:
+        res = await joplin.create_resource(content, title='blob', filename='blob.bin')
+        resource = res.json()
+        assert fake_joplin.blobs[resource['id']] == content
+        chunks = [chunk async for chunk in joplin.stream_resource(resource['id'], offset=1000)]
+    assert b''.join(chunks) == content[1000:]
+
+
+@pytest.mark.asyncio
+async def test_fake_resume_download(tmp_path):
+    fake = FakeJoplin()
+    content = bytes(range(256)) * 100
+    resource = fake.add('resources', title='blob', size=len(content))
+    fake.blobs[resource['id']] = content
+    path = str(tmp_path / 'blob.bin')
+    async with JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake)) as joplin:
+        # a part of this version
+        with open(path, 'wb') as f:
+            f.write(content[:1000])
+        with open(path + '.version', 'w') as f:
+            f.write(str(resource['updated_time']))
+        await joplin.download_resource_to(resource['id'], path)
+        with open(path, 'rb') as f:
+            assert f.read() == content
+        assert not os.path.exists(path + '.version')
+
+        # a part of a previous version: downloaded again
+        with open(path, 'wb') as f:
+            f.write(b'old content')
+        with open(path + '.version', 'w') as f:
+            f.write(str(resource['updated_time'] - 1))
+        await joplin.download_resource_to(resource['id'], path)
+        with open(path, 'rb') as f:
+            assert f.read() == content
+
+    # the Range header is ignored: the file is written from the start
+    fake.ranges = False
+    with open(path, 'wb') as f:
+        f.write(content[:1000])
+    with open(path + '.version', 'w') as f:
+        f.write(str(resource['updated_time']))
+    async with JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake)) as joplin:
+        await joplin.download_resource_to(resource['id'], path)
+    with open(path, 'rb') as f:
+        assert f.read() == content
+
+
+@pytest.mark.asyncio
+async def test_fake_tcp():
+    fake = FakeJoplin(token='secret')
+    fake.populate(folders=1, notes=5, tags=0)
+    server = await serve(fake, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        async with JoplinApi(token='secret', JOPLIN_HOST=f'http://127.0.0.1:{port}') as joplin:
+            assert (await joplin.ping()).text == 'JoplinClipperServer'
+            notes = await asyncio.gather(*[joplin.get_note(note_id) for note_id in fake.items['notes']])
+            assert all(res.status_code == 200 for res in notes)
+        async with JoplinApi(token='wrong', JOPLIN_HOST=f'http://127.0.0.1:{port}') as joplin:
+            assert (await joplin.get_folders()).status_code == 403
+    finally:
+        server.close()
+        await server.wait_closed()
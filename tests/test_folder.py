@@ -147,3 +147,70 @@ async def test_get_tags(get_token):
 
     assert type(res.json()) is list
     assert res.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_iter_folders(get_token):
+    async with JoplinApi(token=get_token) as joplin:
+        res = await joplin.create_folder(folder='MY FOLDER5')
+        folder_id = res.json()['id']
+
+        folders = [folder async for folder in joplin.iter_folders(page_size=1, prefetch=True)]
+        assert folder_id in [folder['id'] for folder in folders]
+
+        await joplin.delete_folder(folder_id)
+
+
+@pytest.mark.asyncio
+async def test_create_delete_folders(get_token):
+    async with JoplinApi(token=get_token) as joplin:
+        folders = ['BULK FOLDER1', 'BULK FOLDER2', {'folder': 'BULK FOLDER3'}]
+        results = await joplin.create_folders(folders, concurrency=2)
+        assert [result.item for result in results] == folders
+        assert all(result.ok for result in results)
+
+        folder_ids = [result.response.json()['id'] for result in results]
+        results = await joplin.delete_folders(folder_ids)
+        assert all(result.ok for result in results)
+
+
+@pytest.mark.asyncio
+async def test_cache_folder(get_token):
+    async with JoplinApi(token=get_token, CACHE=True) as joplin:
+        res = await joplin.create_folder(folder='MY FOLDER6')
+        folder_id = res.json()['id']
+
+        await joplin.get_folder(folder_id)
+        res = await joplin.get_folder(folder_id)
+        assert joplin.cache.hits == 1
+        assert res.json()['title'] == 'MY FOLDER6'
+
+        # the update drops the cached folder
+        await joplin.update_folder(folder_id, 'MY FOLDER7')
+        res = await joplin.get_folder(folder_id)
+        assert res.json()['title'] == 'MY FOLDER7'
+        assert joplin.cache.hits == 1
+
+        await joplin.delete_folder(folder_id)
+
+
+@pytest.mark.asyncio
+async def test_iter_notes_model(get_token):
+    async with JoplinApi(token=get_token) as joplin:
+        res = await joplin.create_folder(folder='MY FOLDER8')
+        parent_id = res.json()['id']
+        body = '# title 1\n ## subtitle \n ```python\npython --version\n```'
+        res = await joplin.create_note(title="NOTE TEST3", body=body, parent_id=parent_id)
+        note_id = res.json()['id']
+
+        notes = [note async for note in joplin.iter_folders_notes(parent_id, 'id,title', model=True)]
+        assert [note.id for note in notes] == [note_id]
+        assert not notes[0].is_loaded('body')
+        assert await notes[0].load_body() == body
+        assert notes[0].body == body
+
+        folder = await joplin.fetch_folder(parent_id)
+        assert folder.title == 'MY FOLDER8'
+
+        await joplin.delete_note(note_id)
+        await joplin.delete_folder(parent_id)
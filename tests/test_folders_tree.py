@@ -0,0 +1,50 @@
+import pytest
+from joplin_api.folders import FolderTree
+
+
+@pytest.mark.asyncio
+async def test_tree_paths(fake_api, fake_joplin):
+    async with fake_api as joplin:
+        tree = FolderTree(joplin)
+        await tree.build()
+        assert len(tree) == 3
+        year_id = await tree.ensure_path('Work/Projects/2026')
+        assert tree.path(year_id) == 'Work/Projects/2026'
+        assert tree.resolve('Work/Projects/2026') == year_id
+        assert tree.resolve('Work/Nope') is None
+        projects_id = tree.parent(year_id)
+        assert tree.ancestors(year_id) == [projects_id, tree.resolve('Work')]
+        # no folder is created again
+        requests = fake_joplin.requests['POST /folders']
+        assert await tree.ensure_path('Work/Projects/2026') == year_id
+        assert fake_joplin.requests['POST /folders'] == requests
+        await joplin.update_folder(projects_id, 'Archive', parent_id=tree.resolve('Work'))
+        assert tree.path(year_id) == 'Work/Archive/2026'
+        tree.close()
+
+
+@pytest.mark.asyncio
+async def test_tree_subtree(fake_api, fake_joplin):
+    async with fake_api as joplin:
+        tree = FolderTree(joplin)
+        await tree.build()
+        top_id = await tree.ensure_path('Top')
+        sub_id = await tree.ensure_path('Top/Sub/Leaf')
+        for folder_id in (top_id, sub_id, tree.parent(sub_id)):
+            await joplin.create_note('note', 'body', folder_id)
+        notes = await tree.get_subtree_notes(top_id, 'id,parent_id')
+        assert len(notes) == 3
+
+        other_id = tree.children()[0]
+        with pytest.raises(ValueError):
+            await tree.move(top_id, sub_id)
+        await tree.move(tree.resolve('Top/Sub'), other_id)
+        assert tree.resolve(tree.path(other_id) + '/Sub/Leaf') == sub_id
+
+        results = await tree.delete(other_id)
+        assert all(result.ok for result in results)
+        # the leaf first, the folder itself last
+        assert [result.item for result in results][0] == sub_id
+        assert results[-1].item == other_id
+        assert other_id not in tree and sub_id not in tree
+        assert other_id not in fake_joplin.items['folders']
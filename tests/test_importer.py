@@ -0,0 +1,49 @@
+import pytest
+from joplin_api.importer import MarkdownImporter, import_markdown, rewrite_links
+
+
+def test_rewrite_links():
+    body = '![cat](img/cat.png "a cat") [doc](<my doc.pdf>) [web](https://joplinapp.org) <img src="img/cat.png">'
+    assert rewrite_links(body, {'img/cat.png': 'a' * 32, '<my doc.pdf>': 'b' * 32}) == (
+        f'![cat](:/{"a" * 32} "a cat") [doc](:/{"b" * 32}) [web](https://joplinapp.org) <img src=":/{"a" * 32}">')
+
+
+@pytest.mark.asyncio
+async def test_import_markdown(tmp_path, fake_api, fake_joplin):
+    root = tmp_path / 'Vault'
+    (root / 'img').mkdir(parents=True)
+    (root / 'img' / 'cat.png').write_bytes(b'\x89PNG cat')
+    (root / 'Projects' / '2026').mkdir(parents=True)
+    (root / 'index.md').write_text('# Index\n![cat](img/cat.png) [next](Projects/plan.md) [missing](nope.png)')
+    (root / 'Projects' / 'plan.md').write_text('the plan ![same cat](../img/cat.png)')
+    for i in range(20):
+        (root / 'Projects' / '2026' / f'note {i}.md').write_text(f'note {i}')
+    async with fake_api as joplin:
+        report = await import_markdown(joplin, str(root), queue_size=2)
+    assert report['errors'] == []
+    assert report == {'folders': 3, 'notes': 22, 'resources': 1, 'errors': []}
+    resource_id = next(iter(fake_joplin.blobs))
+    assert fake_joplin.blobs[resource_id] == b'\x89PNG cat'
+    notes = {note['title']: note for note in fake_joplin.items['notes'].values()}
+    assert notes['index']['body'] == f'# Index\n![cat](:/{resource_id}) [next](Projects/plan.md) [missing](nope.png)'
+    assert notes['plan']['body'] == f'the plan ![same cat](:/{resource_id})'
+    folders = {folder['id']: folder for folder in fake_joplin.items['folders'].values()}
+    year = folders[notes['note 0']['parent_id']]
+    assert year['title'] == '2026'
+    assert folders[folders[year['parent_id']]['parent_id']]['title'] == 'Vault'
+
+
+@pytest.mark.asyncio
+async def test_import_markdown_runs(tmp_path, fake_api, fake_joplin):
+    for name in ('first', 'second'):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / 'cat.png').write_bytes(b'\x89PNG cat')
+        (tmp_path / name / 'note.md').write_text('![cat](cat.png)')
+    async with fake_api as joplin:
+        importer = MarkdownImporter(joplin)
+        for name in ('first', 'second'):
+            report = await importer.run(str(tmp_path / name))
+            assert report == {'folders': 1, 'notes': 1, 'resources': 1, 'errors': []}
+            # the resources of a run are not kept
+            assert importer._resources == {}
+    assert len(fake_joplin.blobs) == 2
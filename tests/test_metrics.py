@@ -0,0 +1,71 @@
+import logging
+import httpx
+import pytest
+from joplin_api import JoplinApi
+from joplin_api.metrics import Hook, endpoint_template
+
+
+def mock_transport(failures=0):
+    calls = []
+
+    async def handler(request):
+        calls.append(request.method)
+        if len(calls) <= failures:
+            return httpx.Response(503)
+        if request.url.path.endswith('/file'):
+            return httpx.Response(200, content=b'x' * 1000)
+        if request.url.path.startswith('/boom'):
+            raise httpx.ConnectError('refused', request=request)
+        return httpx.Response(200, json={'id': 'a' * 32, 'title': 'note'})
+    return httpx.MockTransport(handler)
+
+
+def test_endpoint_template():
+    assert endpoint_template('/notes/') == '/notes'
+    assert endpoint_template('/notes/1234') == '/notes/:id'
+    assert endpoint_template('/tags/1234/notes/5678') == '/tags/:id/notes/:id'
+
+
+@pytest.mark.asyncio
+async def test_metrics_per_endpoint():
+    async with JoplinApi(token='token', TRANSPORT=mock_transport(failures=1), METRICS=True,
+                         RETRY_BACKOFF=0.01) as joplin:
+        await joplin.get_note('a' * 32)
+        await joplin.get_note('b' * 32)
+        await joplin.update_note('a' * 32, 'title', 'body', 'b' * 32)
+        chunks = [chunk async for chunk in joplin.stream_resource('c' * 32)]
+        snapshot = joplin.metrics.snapshot()
+    get = snapshot['GET /notes/:id']
+    assert get['latency']['count'] == 2
+    assert get['statuses'] == {200: 2}
+    assert get['retries'] == 1
+    assert get['bytes_received'] > 0
+    put = snapshot['PUT /notes/:id']
+    assert put['bytes_sent'] > 0
+    assert snapshot['GET /resources/:id/file']['bytes_received'] == sum(len(chunk) for chunk in chunks) == 1000
+
+
+@pytest.mark.asyncio
+async def test_hook_errors():
+    events = []
+
+    class Recorder(Hook):
+        def on_request_end(self, event):
+            events.append(event)
+
+    async with JoplinApi(token='token', TRANSPORT=mock_transport(), HOOKS=[Recorder()], RETRIES=0,
+                         JOPLIN_HOST='http://127.0.0.1:41184/boom') as joplin:
+        with pytest.raises(httpx.ConnectError):
+            await joplin.ping()
+    assert len(events) == 1
+    assert isinstance(events[0].error, httpx.ConnectError)
+    assert events[0].status_code is None
+
+
+@pytest.mark.asyncio
+async def test_logging_hides_token(caplog):
+    caplog.set_level(logging.DEBUG, logger='joplin_api.api')
+    async with JoplinApi(token='secret-token', TRANSPORT=mock_transport()) as joplin:
+        await joplin.update_note('a' * 32, 'title', 'secret body', 'b' * 32)
+    assert 'PUT' in caplog.text
+    assert 'secret' not in caplog.text
@@ -0,0 +1,82 @@
+import json
+import pytest
+from joplin_api import JoplinApi
+from joplin_api.mirror import JoplinMirror
+
+
+@pytest.mark.asyncio
+async def test_mirror(get_token, tmp_path):
+    async with JoplinApi(token=get_token) as joplin:
+        res = await joplin.create_folder(folder='MIRROR FOLDER')
+        parent_id = res.json()['id']
+        res = await joplin.create_note(title='MIRROR NOTE', body='body', parent_id=parent_id)
+        note_id = res.json()['id']
+
+        path = str(tmp_path / 'mirror.json')
+        mirror = JoplinMirror(joplin, max_staleness=60, path=path)
+        await mirror.start()
+        note = await mirror.get_note(note_id)
+        assert note['title'] == 'MIRROR NOTE'
+        assert [note['id'] for note in await mirror.get_folders_notes(parent_id)] == [note_id]
+
+        # the writes done through the api are read back at once
+        await joplin.update_note(note_id, 'MIRROR NOTE2', 'body', parent_id)
+        note = await mirror.get_note(note_id)
+        assert note['title'] == 'MIRROR NOTE2'
+
+        # a new mirror starts from the saved file
+        mirror2 = JoplinMirror(joplin, path=path)
+        await mirror2.start()
+        note = await mirror2.get_note(note_id)
+        assert note['title'] == 'MIRROR NOTE2'
+
+        mirror.close()
+        mirror2.close()
+        await joplin.delete_note(note_id)
+        await joplin.delete_folder(parent_id)
+
+
+@pytest.mark.asyncio
+async def test_mirror_incremental_refresh(fake_api, fake_joplin):
+    for i in range(20):
+        fake_joplin.add('tags', title=f'extra {i}')
+    note_id = next(iter(fake_joplin.items['notes']))
+    async with fake_api as joplin:
+        mirror = JoplinMirror(joplin, max_staleness=0)
+        await mirror.start()
+        assert len(await mirror.get_tags()) == 25
+
+        # done by another client
+        tag = fake_joplin.add('tags', title='new tag')
+        fake_joplin.links.add((tag['id'], note_id))
+        fake_joplin.items['notes'][note_id]['title'] = 'changed'
+        fake_joplin._update('notes', fake_joplin.items['notes'][note_id], {})
+        fake_joplin.requests.clear()
+        assert (await mirror.get_note(note_id))['title'] == 'changed'
+        assert tag['id'] in {tag['id'] for tag in await mirror.get_notes_tags(note_id)}
+        # only the notes of the new tag are listed again, not the ones of every tag
+        assert fake_joplin.requests['GET /tags/:id/notes'] == 1
+        assert fake_joplin.requests['GET /notes/:id/tags'] == 1
+        mirror.close()
+
+
+@pytest.mark.asyncio
+async def test_mirror_saved_when_changed(fake_api, fake_joplin, tmp_path):
+    path = str(tmp_path / 'mirror.json')
+    note_id = next(iter(fake_joplin.items['notes']))
+    async with fake_api as joplin:
+        mirror = JoplinMirror(joplin, path=path, max_staleness=0)
+        await mirror.start()
+        saves = []
+        save = mirror.store.save
+        mirror.store.save = lambda path: saves.append(path) or save(path)
+        # nothing changed: not saved again
+        await mirror.refresh()
+        await mirror.refresh_items()
+        assert saves == []
+        fake_joplin._update('notes', fake_joplin.items['notes'][note_id], {'title': 'changed'})
+        await mirror.refresh()
+        assert saves == [path]
+        mirror.close()
+    with open(path) as f:
+        assert json.load(f)['items']['notes'][note_id]['title'] == 'changed'
@@ -0,0 +1,28 @@
+import asyncio
+import pytest
+from joplin_api.models import Folder, Note
+
+
+@pytest.mark.asyncio
+async def test_models_bodies_in_one_batch(fake_api, fake_joplin):
+    async with fake_api as joplin:
+        notes = [note async for note in joplin.iter_notes('id,title,parent_id,updated_time', model=True)]
+        assert not any(note.is_loaded('body') for note in notes)
+        fake_joplin.requests.clear()
+        bodies = await asyncio.gather(*[note.load_body() for note in notes[:5]])
+        assert bodies == [fake_joplin.items['notes'][note.id]['body'] for note in notes[:5]]
+        assert joplin.body_loader.batches == 1
+        # one GET per body, the API has no GET of several notes
+        assert fake_joplin.requests == {'GET /notes/:id': 5}
+        # loaded once
+        await notes[0].load_body()
+        assert fake_joplin.requests == {'GET /notes/:id': 5}
+
+
+def test_models_hashable():
+    note = Note(id='a' * 32, title='title')
+    same = Note(id='a' * 32, title='title')
+    assert note == same and len({note, same}) == 1
+    # another kind of item with the same id
+    assert len({note, Folder(id='a' * 32, title='title')}) == 2
+    assert {note: 1}[same] == 1
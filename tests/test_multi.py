@@ -0,0 +1,122 @@
+import httpx
+import pytest
+from joplin_api import JoplinApi, JoplinMultiApi
+from joplin_api.fake_server import FakeJoplin, FakeJoplinTransport
+
+
+def instance(fake):
+    return JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake), PAGE_SIZE=10)
+
+
+@pytest.fixture
+def fakes():
+    team_a, team_b = FakeJoplin(), FakeJoplin()
+    team_a.populate(folders=2, notes=20, tags=3, body_size=64)
+    team_b.populate(folders=2, notes=15, tags=3, body_size=64)
+    return team_a, team_b
+
+
+@pytest.mark.asyncio
+async def test_multi_merged_reads(fakes):
+    team_a, team_b = fakes
+    # the slow instance does not hold back the results of the other one
+    team_a.latency = 0.05
+    async with JoplinMultiApi({'a': instance(team_a), 'b': instance(team_b)}) as joplin:
+        names = [name async for name, note in joplin.iter_notes()]
+        assert names.count('a') == 20 and names.count('b') == 15
+        assert names.index('b') < names.index('a')
+        assert len(await joplin.get_tags()) == 6
+        note = next(iter(team_b.items['notes'].values()))
+        found = await joplin.search(note['title'])
+        assert ('b', note['id']) in [(name, item['id']) for name, item in found]
+
+
+@pytest.mark.asyncio
+async def test_multi_route_writes(fakes):
+    team_a, team_b = fakes
+    folder_b = next(iter(team_b.items['folders']))
+    async with JoplinMultiApi({'a': instance(team_a), 'b': instance(team_b)}, tags={'Team-B': 'b'}) as joplin:
+        name, res = await joplin.create_note('default', 'body', '')
+        assert name == 'a' and res.json()['id'] in team_a.items['notes']
+        name, res = await joplin.create_note('tagged', 'body', '', tags='urgent, team-b')
+        assert name == 'b'
+        name, res = await joplin.create_folder('explicit', instance='b')
+        assert name == 'b' and res.json()['id'] in team_b.items['folders']
+        # the instance of a folder is learned from the reads
+        await joplin.get_folders()
+        name, res = await joplin.create_note('in folder', 'body', folder_b)
+        assert name == 'b'
+        note_id = res.json()['id']
+        name, res = await joplin.delete_note(note_id)
+        assert name == 'b' and note_id not in team_b.items['notes']
+
+
+@pytest.mark.asyncio
+async def test_multi_health(fakes):
+    team_a, team_b = fakes
+
+    def down(request):
+        raise httpx.ConnectError('connection refused', request=request)
+
+    broken = JoplinApi(token='token', TRANSPORT=httpx.MockTransport(down))
+    async with JoplinMultiApi({'a': instance(team_a), 'b': instance(team_b), 'c': broken}) as joplin:
+        assert await joplin.check_health() == {'a', 'b'}
+        assert isinstance(joplin.errors['c'], httpx.ConnectError)
+        assert len(await joplin.get_notes()) == 35
+        with pytest.raises(ConnectionError):
+            await joplin.create_folder('lost', instance='c')
+
+
+@pytest.mark.asyncio
+async def test_multi_failure_during_read(fakes):
+    team_a, team_b = fakes
+
+    class Flaky(FakeJoplinTransport):
+        up = True
+
+        async def handle_async_request(self, request):
+            if not self.up:
+                raise httpx.ConnectError('connection refused', request=request)
+            return await super().handle_async_request(request)
+
+    flaky = Flaky(team_b)
+    api_b = JoplinApi(token='token', TRANSPORT=flaky, PAGE_SIZE=10)
+    async with JoplinMultiApi({'a': instance(team_a), 'b': api_b}) as joplin:
+        await joplin.check_health()
+        flaky.up = False
+        # the results of the healthy instance are still given
+        assert {name for name, note in await joplin.get_notes()} == {'a'}
+        assert await joplin.available() == ['a']
+
+
+@pytest.mark.asyncio
+async def test_multi_owners_bounded(fakes):
+    team_a, team_b = fakes
+    folder_b = next(iter(team_b.items['folders']))
+    async with JoplinMultiApi({'a': instance(team_a), 'b': instance(team_b)}, max_owners=10) as joplin:
+        await joplin.get_notes()
+        # the least recently used are dropped
+        assert len(joplin.owners) == 10
+        name, res = await joplin.create_note('title', 'body', folder_b, instance='b')
+        note_id = res.json()['id']
+        assert joplin.owners[note_id] == 'b' and len(joplin.owners) == 10
+        # the deleted items are forgotten
+        name, res = await joplin.delete_note(note_id)
+        assert name == 'b' and note_id not in joplin.owners
+
+
+@pytest.mark.asyncio
+async def test_multi_unexpected_error_during_read(fakes):
+    team_a, team_b = fakes
+
+    class Broken(FakeJoplinTransport):
+        async def handle_async_request(self, request):
+            if request.url.path.startswith('/notes'):
+                return httpx.Response(200, content=b'not json', request=request)
+            return await super().handle_async_request(request)
+
+    api_b = JoplinApi(token='token', TRANSPORT=Broken(team_b), PAGE_SIZE=10)
+    async with JoplinMultiApi({'a': instance(team_a), 'b': api_b}) as joplin:
+        # the merged read does not end early without an error
+        with pytest.raises(ValueError):
+            await joplin.get_notes()
@@ -9,3 +9,14 @@ async def test_ping(get_token):
     ping = await joplin.ping()
     assert type(ping.text) is str
     assert ping.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_ping_reuse_client(get_token):
+    async with JoplinApi(token=get_token) as joplin:
+        await joplin.ping()
+        client = joplin.client
+        ping = await joplin.ping()
+        assert joplin.client is client
+        assert ping.status_code == 200
+    assert client.is_closed
@@ -40,3 +40,55 @@ async def test_create_get_update_delete_download_resource(get_token):
 
     res = await joplin.delete_resources(resource_id)
     assert res.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_download_resource_to(get_token, tmp_path):
+    async with JoplinApi(token=get_token, CHUNK_SIZE=1024) as joplin:
+        res = await joplin.create_resource('tests/cactus.png', title='test download resource')
+        resource_id = res.json()['id']
+        with open('tests/cactus.png', 'rb') as f:
+            content = f.read()
+
+        chunks = [chunk async for chunk in joplin.stream_resource(resource_id)]
+        assert b''.join(chunks) == content
+
+        # resume a partial download
+        path = tmp_path / 'cactus.png'
+        path.write_bytes(content[:1000])
+        await joplin.download_resource_to(resource_id, str(path))
+        assert path.read_bytes() == content
+
+        results = await joplin.download_resources_many([resource_id], str(tmp_path / 'many'))
+        assert not results[0].ok
+
+        (tmp_path / 'many').mkdir()
+        results = await joplin.download_resources_many([resource_id], str(tmp_path / 'many'))
+        assert results[0].ok
+        assert (tmp_path / 'many' / resource_id).read_bytes() == content
+
+        await joplin.delete_resources(resource_id)
+
+
+@pytest.mark.asyncio
+async def test_create_resource_from_memory(get_token):
+    async with JoplinApi(token=get_token) as joplin:
+        with open('tests/cactus.png', 'rb') as f:
+            content = f.read()
+
+        async def chunks():
+            for start in range(0, len(content), 512):
+                yield content[start:start + 512]
+
+        results = await joplin.create_resources([
+            {'resource_file': content, 'title': 'from bytes', 'filename': 'cactus.png'},
+            {'resource_file': memoryview(content), 'title': 'from memoryview', 'filename': 'cactus.png'},
+            {'resource_file': chunks(), 'title': 'from stream', 'filename': 'cactus.png'},
+        ])
+        assert all(result.ok for result in results)
+
+        for result in results:
+            resource_id = result.response.json()['id']
+            res = await joplin.download_resources(resource_id)
+            assert res.content == content
+            await joplin.delete_resources(resource_id)
@@ -0,0 +1,140 @@
+import pytest
+from joplin_api import JoplinApi
+from joplin_api.fake_server import FakeJoplin, FakeJoplinTransport
+from joplin_api.fulltext import SearchIndex
+
+
+@pytest.mark.asyncio
+async def test_search(get_token):
+    async with JoplinApi(token=get_token) as joplin:
+        # single word, quoted and wildcard queries
+        for query in ('cactus', '"cactus flower"', 'cact*'):
+            res = await joplin.search(query)
+            assert res.status_code == 200
+        res = await joplin.search('cactus', 'title')
+        assert res.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_search_index(get_token):
+    async with JoplinApi(token=get_token) as joplin:
+        res = await joplin.create_folder(folder='SEARCH FOLDER')
+        parent_id = res.json()['id']
+        res = await joplin.create_note(title='Meeting with the cactus team', body='the action items',
+                                       parent_id=parent_id)
+        note_id = res.json()['id']
+
+        index = SearchIndex(joplin)
+        await index.build()
+        assert [note['id'] for note in index.search('"action items" title:cactus')] == [note_id]
+        assert [note['id'] for note in index.search('notebook:"SEARCH FOLDER" meet*')] == [note_id]
+        assert index.search('cactus -action') == []
+
+        # the index follows the writes done through the api
+        await joplin.update_note(note_id, 'Meeting with the cactus team', 'no more items', parent_id)
+        assert index.search('"action items"') == []
+
+        index.close()
+        await joplin.delete_note(note_id)
+        await joplin.delete_folder(parent_id)
+
+
+def search_profile(events=True):
+    fake = FakeJoplin(events=events)
+    work = fake.add('folders', title='Work')
+    projects = fake.add('folders', title='Projects', parent_id=work['id'])
+    home = fake.add('folders', title='Home')
+    urgent = fake.add('tags', title='urgent')
+    notes = {
+        'meeting': fake.add('notes', title='Meeting with the cactus team', body='the action items of the week',
+                            parent_id=projects['id']),
+        'cactus': fake.add('notes', title='Cactus', body='cactus cactus watering', parent_id=home['id']),
+        'items': fake.add('notes', title='Shopping', body='items to buy: action figure, cactus pot',
+                          parent_id=home['id']),
+    }
+    fake.links.add((urgent['id'], notes['meeting']['id']))
+    ids = {name: note['id'] for name, note in notes.items()}
+    return fake, ids
+
+
+def found(index, query, limit=None):
+    return [note['id'] for note in index.search(query, limit)]
+
+
+@pytest.mark.asyncio
+async def test_search_index_queries():
+    fake, ids = search_profile()
+    async with JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake)) as joplin:
+        index = SearchIndex(joplin)
+        await index.build()
+        assert len(index) == 3
+        # phrases
+        assert found(index, '"action items"') == [ids['meeting']]
+        assert found(index, '"items action"') == []
+        # prefixes
+        assert set(found(index, 'water*')) == {ids['cactus']}
+        assert set(found(index, 'act*')) == {ids['meeting'], ids['items']}
+        # filters
+        assert found(index, 'title:cactus') == [ids['cactus'], ids['meeting']]
+        assert found(index, 'body:week') == [ids['meeting']]
+        assert found(index, 'title:week') == []
+        assert found(index, 'tag:urgent') == [ids['meeting']]
+        assert found(index, 'tag:urg*') == [ids['meeting']]
+        # a notebook and its sub notebooks
+        assert found(index, 'notebook:work') == [ids['meeting']]
+        assert set(found(index, 'notebook:home')) == {ids['cactus'], ids['items']}
+        assert found(index, 'cactus -notebook:home') == [ids['meeting']]
+        assert set(found(index, 'week any:1 watering')) == {ids['meeting'], ids['cactus']}
+        # ranking: the title weights more than the body, the repeated words more than the single ones
+        assert found(index, 'cactus') == [ids['cactus'], ids['meeting'], ids['items']]
+        assert found(index, 'cactus', limit=1) == [ids['cactus']]
+
+
+@pytest.mark.asyncio
+async def test_search_index_follows_the_writes():
+    fake, ids = search_profile()
+    urgent = next(iter(fake.items['tags']))
+    async with JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake)) as joplin:
+        index = SearchIndex(joplin)
+        await index.build()
+        note = fake.items['notes'][ids['items']]
+        await joplin.update_note(ids['items'], 'Shopping', 'a new list', note['parent_id'])
+        assert found(index, '"action figure"') == []
+        assert found(index, 'list') == [ids['items']]
+        await joplin.create_tags_notes(ids['items'], urgent)
+        assert set(found(index, 'tag:urgent')) == {ids['meeting'], ids['items']}
+        await joplin.delete_tags_notes(urgent, ids['meeting'])
+        assert found(index, 'tag:urgent') == [ids['items']]
+        await joplin.delete_note(ids['cactus'])
+        assert found(index, 'watering') == []
+        await joplin.delete_tag(urgent)
+        assert found(index, 'tag:urgent') == []
+        index.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('events', [True, False])
+async def test_search_index_refresh(events):
+    fake, ids = search_profile(events=events)
+    home = next(folder for folder in fake.items['folders'].values() if folder['title'] == 'Home')
+    async with JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake)) as joplin:
+        index = SearchIndex(joplin)
+        await index.build()
+        assert (index.cursor is not None) == events
+        # done in the Joplin app
+        added = fake.add('notes', title='Garden', body='plant a new cactus', parent_id=home['id'])
+        fake._update('notes', fake.items['notes'][ids['meeting']], {'body': 'nothing left to do'})
+        fake._delete('notes', ids['cactus'])
+        tag = fake.add('tags', title='later')
+        fake.links.add((tag['id'], added['id']))
+        fake.requests.clear()
+        assert await index.refresh() == {added['id'], ids['meeting'], ids['cactus']}
+        assert set(found(index, 'cactus')) == {added['id'], ids['meeting'], ids['items']}
+        assert found(index, '"action items"') == []
+        assert found(index, 'watering') == []
+        assert found(index, 'tag:later') == [added['id']]
+        # only the changed notes are fetched
+        assert fake.requests['GET /notes/:id'] == 2
+        fake.requests.clear()
+        assert await index.refresh() == set()
+        assert 'GET /notes/:id' not in fake.requests
@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from joplin_api.mirror import JoplinMirror
+from joplin_api.store import BlobStore, SQLiteStore
+
+
+@pytest.mark.asyncio
+async def test_sqlite_mirror_warm_start(tmp_path, fake_api, fake_joplin):
+    path = str(tmp_path / 'joplin.db')
+    note_id = next(iter(fake_joplin.items['notes']))
+    for i in range(50):
+        fake_joplin.add('tags', title=f'extra {i}')
+    async with fake_api as joplin:
+        store = SQLiteStore(path)
+        mirror = JoplinMirror(joplin, store=store, path=path, resources=True)
+        await mirror.start()
+        assert len(await mirror.get_notes()) == 30
+        tag_id = next(iter(fake_joplin.items['tags']))
+        assert {note['id'] for note in await mirror.get_tags_notes(tag_id)} == {
+            note_id for tag, note_id in fake_joplin.links if tag == tag_id}
+        mirror.close()
+        store.close()
+
+        # changes done by another client
+        await joplin.update_note(note_id, 'changed', 'body', fake_joplin.items['notes'][note_id]['parent_id'])
+        res = await joplin.create_resource(b'png', title='logo', filename='logo.png')
+        resource_id = res.json()['id']
+
+        fake_joplin.requests.clear()
+        store = SQLiteStore(path)
+        mirror = JoplinMirror(joplin, store=store, path=path, resources=True)
+        await mirror.start()
+        # the notes are revalidated with the events, not fetched again, nor the folders and tags
+        assert 'GET /notes' not in fake_joplin.requests
+        assert fake_joplin.requests['GET /notes/:id'] == 1
+        for route in ('GET /folders', 'GET /tags', 'GET /tags/:id/notes', 'GET /resources'):
+            assert route not in fake_joplin.requests
+        assert (await mirror.get_note(note_id))['title'] == 'changed'
+        assert (await mirror.get_resource(resource_id))['title'] == 'logo'
+        assert len(await mirror.get_notes()) == 30
+        # the previews of the notes are mirrored, the bodies fetched when asked for
+        assert 'body' not in await mirror.get_note(note_id)
+        assert await mirror.get_note_body(note_id) == 'body'
+        assert await mirror.get_note_body('a' * 32) is None
+        mirror.close()
+        store.close()
+
+
+@pytest.mark.asyncio
+async def test_blob_store(tmp_path, fake_api, fake_joplin):
+    async with fake_api as joplin:
+        res = await joplin.create_resource(b'x' * 1000, title='file', filename='file.bin')
+        resource_id = res.json()['id']
+        mirror = JoplinMirror(joplin, blobs=BlobStore(str(tmp_path / 'blobs')), resources=True)
+        fake_joplin.latency = 0.01
+        results = await asyncio.gather(*[mirror.get_resource_file(resource_id) for _ in range(5)])
+        fake_joplin.latency = 0
+        assert all(data[:] == b'x' * 1000 for data in results)
+        for data in results:
+            data.close()
+        await mirror.get_resource_file(resource_id)
+        assert fake_joplin.requests['GET /resources/:id/file'] == 1
+        await joplin.delete_resources(resource_id)
+        assert list((tmp_path / 'blobs').iterdir()) == []
+        assert await mirror.get_resource_file('0' * 32) is None
+        mirror.close()
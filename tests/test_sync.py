@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+from joplin_api import JoplinSyncApi
+from joplin_api.fake_server import FakeJoplinTransport
+
+
+def test_sync_api(get_token):
+    with JoplinSyncApi(token=get_token) as joplin:
+        assert joplin.ping().status_code == 200
+
+        res = joplin.create_folder(folder='SYNC FOLDER')
+        folder_id = res.json()['id']
+        assert folder_id in [folder['id'] for folder in joplin.iter_folders()]
+
+        # the same instance is used from many threads
+        with ThreadPoolExecutor(4) as executor:
+            statuses = list(executor.map(lambda _: joplin.get_folder(folder_id).status_code, range(20)))
+        assert statuses == [200] * 20
+
+        res = joplin.delete_folder(folder_id)
+        assert res.status_code == 200
+
+
+def test_sync_api_threads(fake_joplin):
+    folder_ids = list(fake_joplin.items['folders'])
+    joplin = JoplinSyncApi(token='token', TRANSPORT=FakeJoplinTransport(fake_joplin), PAGE_SIZE=10)
+    other = JoplinSyncApi(token='token', TRANSPORT=FakeJoplinTransport(fake_joplin))
+    thread = joplin._runner.thread
+    assert other._runner is joplin._runner and thread.is_alive()
+    assert len(list(joplin.iter_notes('id'))) == 30
+
+    def work(i):
+        folder_id = folder_ids[i % len(folder_ids)]
+        res = joplin.create_note(f'note {i}', 'body', folder_id)
+        note_id = res.json()['id']
+        assert joplin.get_note(note_id, 'id,title').json()['title'] == f'note {i}'
+        return len(list(joplin.iter_folders_notes(folder_id, 'id')))
+
+    # the same instance is used from many threads at once
+    with ThreadPoolExecutor(8) as executor:
+        counts = list(executor.map(work, range(40)))
+    assert len(fake_joplin.items['notes']) == 70
+    assert all(count >= 10 for count in counts)
+
+    # the loop thread lives until the last instance is closed
+    joplin.close()
+    assert thread.is_alive()
+    other.close()
+    thread.join(2)
+    assert not thread.is_alive()
+    # a new instance starts a new one
+    with JoplinSyncApi(token='token', TRANSPORT=FakeJoplinTransport(fake_joplin)) as again:
+        assert again.get_folder(folder_ids[0]).status_code == 200
+        assert again._runner.thread is not thread
@@ -0,0 +1,45 @@
+import pytest
+from joplin_api.tags import TagIndex
+
+
+@pytest.mark.asyncio
+async def test_tag_index(fake_api, fake_joplin):
+    async with fake_api as joplin:
+        index = TagIndex(joplin)
+        await index.build()
+        for tag_id, note_id in fake_joplin.links:
+            assert note_id in index.tag_notes(tag_id)
+            assert tag_id in index.note_tags(note_id)
+        # one listing per tag (of 2 pages of 10 notes), not one query per note
+        assert fake_joplin.requests['GET /tags/:id/notes'] == 2 * len(fake_joplin.items['tags'])
+
+        tag_id = (await joplin.create_tag('bulk')).json()['id']
+        note_ids = list(fake_joplin.items['notes'])
+        results = await index.tag_notes_many(tag_id, note_ids)
+        assert len(results) == len(note_ids) and all(result.ok for result in results)
+        assert index.tag_notes(tag_id) == set(note_ids)
+        assert {link for link in fake_joplin.links if link[0] == tag_id} == {(tag_id, n) for n in note_ids}
+        # nothing left to do
+        assert await index.tag_notes_many(tag_id, note_ids) == []
+
+        results = await index.untag_notes_many(tag_id)
+        assert all(result.ok for result in results)
+        assert index.tag_notes(tag_id) == set()
+        assert not [link for link in fake_joplin.links if link[0] == tag_id]
+
+        await joplin.delete_note(note_ids[0])
+        assert note_ids[0] not in index.tags_by_note
+        index.close()
+
+
+@pytest.mark.asyncio
+async def test_set_notes_tags(fake_api, fake_joplin):
+    async with fake_api as joplin:
+        index = TagIndex(joplin)
+        await index.build()
+        note_id = next(iter(fake_joplin.items['notes']))
+        wanted = set(list(fake_joplin.items['tags'])[:2])
+        results = await index.set_notes_tags({note_id: wanted})
+        assert all(result.ok for result in results)
+        assert index.note_tags(note_id) == wanted
+        assert {tag_id for tag_id, linked_id in fake_joplin.links if linked_id == note_id} == wanted
@@ -0,0 +1,67 @@
+import asyncio
+import httpx
+import pytest
+from joplin_api import JoplinApi
+from joplin_api.transport import DeadlineExceeded
+
+
+def flaky_transport(failures):
+    """
+    answer 503 to the `failures` first requests
+    """
+    calls = []
+
+    async def handler(request):
+        calls.append(request.method)
+        if request.url.path.endswith('/slow'):
+            await asyncio.sleep(1)
+        if len(calls) <= failures:
+            return httpx.Response(503)
+        return httpx.Response(200, json={'id': 'a' * 32})
+    return httpx.MockTransport(handler), calls
+
+
+@pytest.mark.asyncio
+async def test_retry_idempotent():
+    transport, calls = flaky_transport(failures=2)
+    async with JoplinApi(token='token', TRANSPORT=transport, RETRIES=2, RETRY_BACKOFF=0.01) as joplin:
+        res = await joplin.get_note('a' * 32)
+        assert res.status_code == 200
+        assert res.extensions['retries'] == 2
+        assert calls == ['GET'] * 3
+
+
+@pytest.mark.asyncio
+async def test_no_retry_post():
+    transport, calls = flaky_transport(failures=1)
+    async with JoplinApi(token='token', TRANSPORT=transport, RETRY_BACKOFF=0.01) as joplin:
+        res = await joplin.create_folder('folder')
+        assert res.status_code == 503
+        assert calls == ['POST']
+
+
+@pytest.mark.asyncio
+async def test_deadline():
+    transport, calls = flaky_transport(failures=0)
+    async with JoplinApi(token='token', TRANSPORT=transport, DEADLINE=0.1) as joplin:
+        with pytest.raises(DeadlineExceeded):
+            await joplin.get_note('slow')
+
+
+@pytest.mark.asyncio
+async def test_adaptive_concurrency():
+    inflight = []
+
+    async def handler(request):
+        inflight.append(request)
+        # the server fails over 4 queries at once
+        failed = len(inflight) > 4
+        await asyncio.sleep(0.01)
+        inflight.remove(request)
+        return httpx.Response(503 if failed else 200, json={})
+
+    async with JoplinApi(token='token', TRANSPORT=httpx.MockTransport(handler), ADAPTIVE_CONCURRENCY=True,
+                         MAX_CONCURRENCY=20, BULK_CONCURRENCY=20, RETRIES=5, RETRY_BACKOFF=0.01) as joplin:
+        results = await joplin.delete_notes([str(i) for i in range(200)])
+        assert all(result.ok for result in results)
+        assert joplin.limiter.limit <= 8
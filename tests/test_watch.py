@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+from joplin_api import JoplinApi
+from joplin_api.fake_server import FakeJoplin, FakeJoplinTransport
+from joplin_api.watch import ChangeEvent, CREATED, DELETED, UPDATED
+
+
+def watch_api(fake, **config):
+    return JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake), WATCH_MIN_INTERVAL=0.01,
+                     WATCH_MAX_INTERVAL=0.05, **config)
+
+
+async def take(changes, count):
+    return [await asyncio.wait_for(changes.__anext__(), 2) for _ in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_watch_changes(fake_joplin):
+    folder_id = next(iter(fake_joplin.items['folders']))
+    async with watch_api(fake_joplin) as joplin:
+        everything = joplin.watch_changes()
+        notes_only = joplin.watch_changes(['note'])
+        first = asyncio.ensure_future(take(everything, 4))
+        second = asyncio.ensure_future(take(notes_only, 2))
+        # the first poll takes the current state
+        await asyncio.sleep(0.05)
+        res = await joplin.create_note('new', 'body', folder_id)
+        note_id = res.json()['id']
+        await joplin.update_folder(folder_id, 'renamed')
+        # done by another client
+        fake_joplin._delete('notes', note_id)
+        tag = fake_joplin.add('tags', title='new tag')
+        changes = await first
+        assert set(changes) == {ChangeEvent('note', CREATED, note_id), ChangeEvent('note', DELETED, note_id),
+                                ChangeEvent('folder', UPDATED, folder_id), ChangeEvent('tag', CREATED, tag['id'])}
+        assert await second == [ChangeEvent('note', CREATED, note_id), ChangeEvent('note', DELETED, note_id)]
+        # one poller for both consumers
+        assert joplin.watcher._task is not None
+        await everything.aclose()
+        await notes_only.aclose()
+        assert joplin.watcher._task is None
+
+
+@pytest.mark.asyncio
+async def test_watch_checkpoint_and_listing(tmp_path):
+    checkpoint = str(tmp_path / 'watch.json')
+    fake = FakeJoplin(events=False)
+    fake.populate(folders=2, notes=5, tags=1)
+    async with watch_api(fake, WATCH_CHECKPOINT=checkpoint) as joplin:
+        changes = joplin.watch_changes(['note'])
+        pending = asyncio.ensure_future(changes.__anext__())
+        await asyncio.sleep(0.05)
+        assert joplin.watcher.events_enabled is False
+    # the stream ends with the api
+    with pytest.raises(StopAsyncIteration):
+        await pending
+
+    # changed while nobody watched
+    note_id = next(iter(fake.items['notes']))
+    fake.items['notes'][note_id]['updated_time'] += 1
+    async with watch_api(fake, WATCH_CHECKPOINT=checkpoint) as joplin:
+        changes = joplin.watch_changes(['note'])
+        assert await take(changes, 1) == [ChangeEvent('note', UPDATED, note_id)]
+        await changes.aclose()
+
+
+@pytest.mark.asyncio
+async def test_watch_close_with_a_slow_consumer(fake_joplin, tmp_path):
+    checkpoint = str(tmp_path / 'watch.json')
+    folder_id = next(iter(fake_joplin.items['folders']))
+    async with watch_api(fake_joplin, WATCH_CHECKPOINT=checkpoint, WATCH_QUEUE_SIZE=1) as joplin:
+        changes = joplin.watch_changes(['note'])
+        first = asyncio.ensure_future(changes.__anext__())
+        await asyncio.sleep(0.05)
+        note_ids = [fake_joplin.add('notes', title=f'note {i}', parent_id=folder_id)['id'] for i in range(3)]
+        assert await asyncio.wait_for(first, 2) == ChangeEvent('note', CREATED, note_ids[0])
+        # the poller waits for the consumer
+        await asyncio.sleep(0.05)
+    # the change waiting in the queue is not dropped, then the stream ends
+    assert [change async for change in changes] == [ChangeEvent('note', CREATED, note_ids[1])]
+
+    # the changes not delivered are given again after a restart
+    async with watch_api(fake_joplin, WATCH_CHECKPOINT=checkpoint) as joplin:
+        changes = joplin.watch_changes(['note'])
+        assert await take(changes, 3) == [ChangeEvent('note', CREATED, note_id) for note_id in note_ids]
+        await changes.aclose()
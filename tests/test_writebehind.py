@@ -0,0 +1,117 @@
+import asyncio
+import pytest
+from joplin_api import JoplinApi
+from joplin_api.fake_server import FakeJoplinTransport
+
+
+def make_api(fake, **config):
+    return JoplinApi(token='token', TRANSPORT=FakeJoplinTransport(fake), WRITE_BEHIND=True, **config)
+
+
+@pytest.mark.asyncio
+async def test_write_behind_merges(fake_joplin):
+    note_id, note = next(iter(fake_joplin.items['notes'].items()))
+    async with make_api(fake_joplin, WRITE_BEHIND_INTERVAL=60) as joplin:
+        for i in range(50):
+            res = await joplin.update_note(note_id, f'title {i}', f'body {i}', note['parent_id'])
+            assert res.status_code == 202
+        assert 'PUT /notes/:id' not in fake_joplin.requests
+        # the read sends the pending update first
+        res = await joplin.get_note(note_id, 'id,title,body')
+        assert res.json() == {'id': note_id, 'title': 'title 49', 'body': 'body 49'}
+        assert fake_joplin.requests['PUT /notes/:id'] == 1
+        assert joplin.write_behind.stats() == {'received': 50, 'sent': 1, 'pending': 0, 'failures': 0}
+
+
+@pytest.mark.asyncio
+async def test_write_behind_triggers(fake_joplin):
+    folder_ids = list(fake_joplin.items['folders'])
+    async with make_api(fake_joplin, WRITE_BEHIND_INTERVAL=0.05, WRITE_BEHIND_MAX_PENDING=2) as joplin:
+        await joplin.update_folder(folder_ids[0], 'first')
+        await asyncio.sleep(0.1)
+        # sent by the timer
+        assert fake_joplin.items['folders'][folder_ids[0]]['title'] == 'first'
+        await joplin.update_folder(folder_ids[1], 'second')
+        await joplin.update_folder(folder_ids[2], 'third')
+        # sent because 2 items were waiting
+        assert fake_joplin.items['folders'][folder_ids[2]]['title'] == 'third'
+        tag_id = next(iter(fake_joplin.items['tags']))
+        await joplin.update_tag(tag_id, 'renamed')
+    # sent when closing
+    assert fake_joplin.items['tags'][tag_id]['title'] == 'renamed'
+
+
+@pytest.mark.asyncio
+async def test_write_behind_delete_and_failures(fake_joplin):
+    note_ids = list(fake_joplin.items['notes'])
+    failed = []
+    async with make_api(fake_joplin, WRITE_BEHIND_INTERVAL=60) as joplin:
+        joplin.write_behind.on_error = failed.append
+        await joplin.update_note(note_ids[0], 'updated', 'body', '')
+        await joplin.delete_note(note_ids[0])
+        # the pending update is dropped, not sent
+        assert 'PUT /notes/:id' not in fake_joplin.requests
+        assert joplin.write_behind.stats()['pending'] == 0
+        assert note_ids[0] not in fake_joplin.items['notes']
+
+        await joplin.update_note('a' * 32, 'unknown', 'body', '')
+        results = await joplin.write_behind.flush()
+    assert not results[0].ok
+    assert failed == list(joplin.write_behind.failures) == results
+
+
+@pytest.mark.asyncio
+async def test_write_behind_failures_bounded(fake_joplin):
+    async with make_api(fake_joplin, WRITE_BEHIND_INTERVAL=60, WRITE_BEHIND_MAX_FAILURES=3) as joplin:
+        for index in range(5):
+            await joplin.update_note(f'{index:032x}', 'unknown', 'body', '')
+        await joplin.write_behind.flush()
+        # the last failures only are kept, all of them are counted
+        assert len(joplin.write_behind.failures) == 3
+        assert joplin.write_behind.stats()['failures'] == 5
+
+
+@pytest.mark.asyncio
+async def test_write_behind_timer_task(fake_joplin):
+    note_id, note = next(iter(fake_joplin.items['notes'].items()))
+    async with make_api(fake_joplin, WRITE_BEHIND_INTERVAL=60) as joplin:
+        await joplin.update_note(note_id, 'timed', 'body', note['parent_id'])
+        joplin.write_behind._timer.cancel()
+        joplin.write_behind._on_timer()
+        # the flush started by the timer is referenced until it is done
+        tasks = list(joplin.write_behind._tasks)
+        assert len(tasks) == 1
+        await asyncio.gather(*tasks)
+        assert not joplin.write_behind._tasks
+        assert fake_joplin.items['notes'][note_id]['title'] == 'timed'
+
+
+@pytest.mark.asyncio
+async def test_write_behind_listings(fake_joplin):
+    note_id, note = next(iter(fake_joplin.items['notes'].items()))
+    folder_id = next(iter(fake_joplin.items['folders']))
+    async with make_api(fake_joplin, WRITE_BEHIND_INTERVAL=60) as joplin:
+        await joplin.update_note(note_id, 'listed title', 'body', note['parent_id'])
+        await joplin.update_folder(folder_id, 'listed folder')
+        # a listing sends all the pending updates first
+        notes = [item async for item in joplin.iter_notes('id,title')]
+        assert {'id': note_id, 'title': 'listed title'} in notes
+        assert fake_joplin.items['folders'][folder_id]['title'] == 'listed folder'
+        assert joplin.write_behind.stats()['pending'] == 0
+        await joplin.update_note(note_id, 'searched title', 'body', note['parent_id'])
+        res = await joplin.search('searched')
+        assert [item['id'] for item in res.json()['items']] == [note_id]
+
+
+@pytest.mark.asyncio
+async def test_write_behind_listeners(fake_joplin):
+    note_id, note = next(iter(fake_joplin.items['notes'].items()))
+    calls = []
+    async with make_api(fake_joplin, WRITE_BEHIND_INTERVAL=60) as joplin:
+        joplin.add_listener(lambda method, path, payload, res: calls.append((method, path, res.status_code)))
+        await joplin.update_note(note_id, 'title', 'body', note['parent_id'])
+        # called when the update is buffered
+        assert calls == [('put', f'/notes/{note_id}', 202)]
+        await joplin.write_behind.flush()
+        # and again when it is sent
+        assert calls == [('put', f'/notes/{note_id}', 202), ('put', f'/notes/{note_id}', 200)]